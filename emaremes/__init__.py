@@ -2,8 +2,13 @@ from . import ts
 from . import fetch
 from . import plot
 from . import utils
+from . import grib
+from . import cache
+from . import cube
+from . import pixels
+from . import sparse
 
-__all__ = ["ts", "fetch", "plot", "utils"]
+__all__ = ["ts", "fetch", "plot", "utils", "grib", "cache", "cube", "pixels", "sparse"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,262 @@
+import gzip
+import hashlib
+import os
+import time
+from os import PathLike, scandir
+from pathlib import Path
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile
+
+__all__ = ["enable", "disable", "is_enabled", "clear", "usage", "index_path", "prune_indexes"]
+
+# The configuration lives in environment variables so that worker processes, forked or
+# spawned, use the same cache as the process that enabled it.
+_ENV_PATH: str = "EMAREMES_GRIB_CACHE"
+_ENV_MAX_BYTES: str = "EMAREMES_GRIB_CACHE_MAX_BYTES"
+
+DEFAULT_PATH: Path = Path.home() / ".cache" / "emaremes" / "grib2"
+DEFAULT_INDEX_PATH: Path = Path.home() / ".cache" / "emaremes" / "indexes"
+
+
+def enable(path: PathLike | None = None, max_bytes: int = 10 * 1024**3) -> None:
+    """
+    Keep decompressed copies of the `.grib2.gz` files read by `mrms.ts`, `mrms.plot` and
+    `utils.unzip_if_gz`, so each file is gunzipped once instead of once per analysis.
+
+    Entries are keyed by the path, modification time and size of the source file, so a
+    file replaced on disk is decompressed again. When the cache grows over `max_bytes`,
+    the least recently used entries are deleted. The cache can be shared by several
+    processes, including `multiprocessing` workers started after calling this function.
+
+    Parameters
+    ----------
+    path : PathLike | None = None
+        Folder to keep the decompressed files in. If None, `~/.cache/emaremes/grib2`.
+    max_bytes : int = 10 * 1024**3
+        Maximum size of the cache in bytes. A decompressed CONUS file takes about 25 MB.
+    """
+    if max_bytes <= 0:
+        raise ValueError("`max_bytes` must be positive.")
+
+    path = Path(path) if path is not None else DEFAULT_PATH
+    path.mkdir(parents=True, exist_ok=True)
+
+    os.environ[_ENV_PATH] = str(path.resolve())
+    os.environ[_ENV_MAX_BYTES] = str(int(max_bytes))
+
+
+def disable() -> None:
+    """Stop using the cache. Files already in it are kept, see `clear`."""
+    os.environ.pop(_ENV_PATH, None)
+    os.environ.pop(_ENV_MAX_BYTES, None)
+
+
+def is_enabled() -> bool:
+    return _ENV_PATH in os.environ
+
+
+def _config() -> tuple[Path, int] | None:
+    if (path := os.environ.get(_ENV_PATH)) is None:
+        return None
+
+    return Path(path), int(os.environ.get(_ENV_MAX_BYTES, 10 * 1024**3))
+
+
+def _entries(root: Path) -> list[os.DirEntry]:
+    with scandir(root) as it:
+        return [e for e in it if e.is_file() and e.name.endswith(".grib2")]
+
+
+def usage() -> int:
+    """Size in bytes of the files in the cache. Zero if the cache is not enabled."""
+    if (config := _config()) is None:
+        return 0
+
+    return sum(e.stat().st_size for e in _entries(config[0]))
+
+
+def clear() -> None:
+    """Delete all the files in the cache, and the cfgrib indexes that went stale."""
+    if (config := _config()) is None:
+        return
+
+    for entry in _entries(config[0]):
+        _remove(Path(entry.path))
+
+    prune_indexes()
+
+
+def _key(f: Path, stat: os.stat_result) -> str:
+    """Identifies a version of a file by its path, modification time and size."""
+    return hashlib.sha1(f"{f}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:16]
+
+
+def _index_root() -> Path:
+    """Indexes go next to the decompressed files if the cache is enabled."""
+    if (config := _config()) is None:
+        return DEFAULT_INDEX_PATH
+
+    return config[0] / "indexes"
+
+
+def _remove(entry: Path) -> None:
+    """Delete a cache entry and its cfgrib indexes."""
+    try:
+        key = _key(entry, entry.stat())
+    except FileNotFoundError:  # Evicted by another process
+        return
+
+    entry.unlink(missing_ok=True)
+
+    for idx in _index_root().glob(f"{key}.*"):
+        idx.unlink(missing_ok=True)
+
+    # Indexes written by cfgrib with its default location
+    for idx in entry.parent.glob(f"{entry.name}.*.idx"):
+        idx.unlink(missing_ok=True)
+
+
+def index_path(f: PathLike) -> str:
+    """
+    Location of the cfgrib index of a `.grib2` file, to be passed to cfgrib as
+    `backend_kwargs={"indexpath": index_path(f)}`.
+
+    Indexes are kept in a dedicated folder instead of next to the data, keyed by the
+    path, modification time and size of the file. They are reused across runs and
+    processes, and a file replaced on disk gets a new index instead of a stale one that
+    cfgrib would ignore but never rebuild. Indexes whose files changed or were deleted
+    are removed by `prune_indexes`.
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to a `.grib2` file.
+
+    Returns
+    -------
+    str
+        Index path template, with the `{short_hash}` placeholder of cfgrib.
+    """
+    f = Path(f).resolve()
+    stat = f.stat()
+    key = _key(f, stat)
+
+    root = _index_root()
+    source = root / f"{key}.src"
+
+    # Record the file the index belongs to, so `prune_indexes` can tell when it is stale
+    if not source.exists():
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = source.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(f"{f}\n{stat.st_mtime_ns}\n{stat.st_size}\n")
+        os.replace(tmp, source)
+
+    return str(root / f"{key}.{{short_hash}}.idx")
+
+
+def prune_indexes() -> int:
+    """
+    Delete the cfgrib indexes of files that were modified or deleted since they were
+    indexed.
+
+    Returns
+    -------
+    int
+        Number of files whose indexes were deleted.
+    """
+    if not (root := _index_root()).is_dir():
+        return 0
+
+    pruned = 0
+
+    for source in root.glob("*.src"):
+        try:
+            path, mtime_ns, size = source.read_text().splitlines()
+            stat = os.stat(path)
+            current = (stat.st_mtime_ns, stat.st_size) == (int(mtime_ns), int(size))
+
+        except (FileNotFoundError, ValueError):
+            current = False
+
+        if not current:
+            for idx in root.glob(f"{source.stem}.*.idx"):
+                idx.unlink(missing_ok=True)
+
+            source.unlink(missing_ok=True)
+            pruned += 1
+
+    return pruned
+
+
+def _evict(root: Path, max_bytes: int, keep: Path) -> None:
+    """Delete the least recently used entries until the cache fits in `max_bytes`."""
+    entries = []
+
+    for e in _entries(root):
+        try:
+            stat = e.stat()
+        except FileNotFoundError:  # Evicted by another process
+            continue
+
+        entries.append((stat.st_atime, stat.st_size, Path(e.path)))
+
+    total = sum(size for _, size, _ in entries)
+
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+
+        if entry != keep:
+            _remove(entry)
+            total -= size
+
+
+def decompressed(f: PathLike) -> Path | None:
+    """
+    Path to the decompressed copy of a `.grib2.gz` file in the cache. The file is
+    decompressed into the cache if it is not there yet.
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to a `.grib2.gz` file.
+
+    Returns
+    -------
+    Path | None
+        Path to a `.grib2` file, or None if the cache is not enabled.
+    """
+    if (config := _config()) is None:
+        return None
+
+    root, max_bytes = config
+    f = Path(f).resolve()
+    stat = f.stat()
+
+    key = _key(f, stat)
+    entry = root / f"{f.name.removesuffix('.gz').removesuffix('.grib2')}.{key}.grib2"
+
+    try:
+        # Mark the entry as recently used. Only its access time is changed, since the
+        # modification time is part of the key of its cfgrib indexes (see `index_path`).
+        os.utime(entry, ns=(time.time_ns(), entry.stat().st_mtime_ns))
+        return entry
+
+    except FileNotFoundError:
+        pass
+
+    root.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first, so other processes never see a partial entry
+    with gzip.open(f, "rb") as fin, NamedTemporaryFile("wb", dir=root, suffix=".tmp", delete=False) as tf:
+        try:
+            copyfileobj(fin, tf, 1 << 20)
+        except BaseException:
+            tf.close()
+            os.unlink(tf.name)
+            raise
+
+    os.replace(tf.name, entry)
+    _evict(root, max_bytes, keep=entry)
+
+    return entry
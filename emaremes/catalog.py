@@ -0,0 +1,421 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from os import PathLike, scandir
+from pathlib import Path
+from typing import Iterable, Literal
+
+import pandas as pd
+
+__all__ = ["Catalog", "parse_filename"]
+
+CATALOG_NAME: str = ".emaremes.sqlite"
+
+_FILENAME = re.compile(r"^(?P<product>\w+?)_00\.00_(?P<stamp>\d{8}-\d{6})\.grib2(?:\.gz)?$")
+_DAYFOLDER = re.compile(r"^\d{8}$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    product TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    relpath TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL,
+    PRIMARY KEY (product, t, relpath)
+);
+
+-- Files are touched and removed by path
+CREATE INDEX IF NOT EXISTS files_relpath ON files (relpath);
+
+CREATE TABLE IF NOT EXISTS listings (
+    source TEXT NOT NULL,
+    product TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    PRIMARY KEY (source, product, day)
+);
+
+CREATE TABLE IF NOT EXISTS remote (
+    source TEXT NOT NULL,
+    product TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    PRIMARY KEY (source, product, t)
+);
+
+CREATE TABLE IF NOT EXISTS cursors (
+    source TEXT NOT NULL,
+    product TEXT NOT NULL,
+    t INTEGER NOT NULL,
+    PRIMARY KEY (source, product)
+);
+"""
+
+
+def parse_filename(name: str) -> tuple[str, pd.Timestamp] | None:
+    """
+    Parse the name of an MRMS file.
+
+    Parameters
+    ----------
+    name : str
+        File name, e.g. `PrecipRate_00.00_20240927-120000.grib2.gz`.
+
+    Returns
+    -------
+    tuple[str, pd.Timestamp] | None
+        MRMS product name (e.g., "PrecipRate") and timestamp of the file, or None if
+        the name does not follow the MRMS convention.
+    """
+    if not (match := _FILENAME.match(name)):
+        return None
+
+    t = datetime.strptime(match["stamp"], r"%Y%m%d-%H%M%S")
+    return match["product"], pd.Timestamp(t)
+
+
+def _epoch(t: pd.Timestamp) -> int:
+    return pd.Timestamp(t).value // 1_000_000_000
+
+
+class Catalog:
+    """
+    SQLite index of the MRMS files stored under a root folder. The database lives in
+    the root folder itself, so it is shared by all the processes using that folder.
+
+    Files are indexed by MRMS product name and timestamp, so resolving a whole time
+    range is a single query instead of probing the filesystem for each file. The
+    catalog is only as fresh as the operations that went through it: files added or
+    removed by hand are picked up by calling `rescan`.
+
+    Parameters
+    ----------
+    root : PathLike
+        Folder containing MRMS files organized in `YYYYMMDD` subfolders. If the catalog
+        does not exist yet, the folder is scanned to build it. If the folder is read-only,
+        the catalog is built from a scan and kept in memory.
+    """
+
+    def __init__(self, root: PathLike) -> None:
+        self.root = Path(root)
+        self.path = self.root / CATALOG_NAME
+        self._lock = threading.Lock()
+
+        is_new = not self.path.exists()
+        self._conn = None
+
+        if os.access(self.root, os.W_OK):
+            try:
+                self._conn = self._connect(self.path)
+            except (sqlite3.OperationalError, OSError):
+                pass
+
+        if self._conn is None:
+            # The catalog cannot be written to the root, so it only lives in this process
+            self._conn = self._connect(":memory:")
+            is_new = True
+
+        if is_new:
+            self.rescan()
+
+    def _connect(self, database: PathLike | str) -> sqlite3.Connection:
+        conn = sqlite3.connect(database, timeout=60, check_same_thread=False)
+
+        try:
+            # WAL needs shared memory, which is unreliable on network filesystems (NFS, SMB).
+            # The rollback journal is used instead, and catalogs left in WAL mode are reverted.
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+
+        except BaseException:
+            conn.close()
+            raise
+
+        return conn
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        """Bring catalogs created by older versions up to date with the schema."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(files)")}
+
+        if "accessed" not in columns:
+            with conn:
+                conn.execute("ALTER TABLE files ADD COLUMN accessed REAL")
+
+    def _relpath(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix() if path.is_absolute() else path.as_posix()
+
+    def _row(
+        self, path: Path, size: int | None = None, accessed: float | None = None
+    ) -> tuple[str, int, str, int, float] | None:
+        if not (parsed := parse_filename(path.name)):
+            return None
+
+        product, t = parsed
+        size = path.stat().st_size if size is None else size
+        accessed = time.time() if accessed is None else accessed
+        return product, _epoch(t), self._relpath(path), size, accessed
+
+    def add(self, paths: PathLike | Iterable[PathLike]) -> None:
+        """
+        Register files in the catalog.
+
+        Parameters
+        ----------
+        paths : PathLike | Iterable[PathLike]
+            Files to register. They must be inside the root folder.
+        """
+        if isinstance(paths, (str, PathLike)):
+            paths = [paths]
+
+        rows = [row for p in paths if (row := self._row(Path(p)))]
+
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+    def touch(self, paths: PathLike | Iterable[PathLike]) -> None:
+        """
+        Mark files as accessed now. The time of last access is used by the "lru"
+        eviction policy.
+
+        Parameters
+        ----------
+        paths : PathLike | Iterable[PathLike]
+            Files that were accessed.
+        """
+        if isinstance(paths, (str, PathLike)):
+            paths = [paths]
+
+        now = time.time()
+        rows = [(now, self._relpath(Path(p))) for p in paths]
+
+        with self._lock, self._conn:
+            self._conn.executemany("UPDATE files SET accessed = ? WHERE relpath = ?", rows)
+
+    def usage(self) -> int:
+        """Total size in bytes of the files in the catalog."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+
+    def eviction_order(self, policy: Literal["lru", "oldest"] = "lru") -> list[tuple[str, pd.Timestamp, Path, int]]:
+        """
+        Files in the order they should be evicted when the storage is over its quota.
+
+        Parameters
+        ----------
+        policy : Literal["lru", "oldest"] = "lru"
+            "lru" evicts the files accessed least recently first. "oldest" evicts the files
+            with the oldest timestamps first.
+
+        Returns
+        -------
+        list[tuple[str, pd.Timestamp, Path, int]]
+            Product name, timestamp, path and size of each file.
+        """
+        order = {"lru": "COALESCE(accessed, 0), t", "oldest": "t, COALESCE(accessed, 0)"}
+
+        if policy not in order:
+            raise ValueError(f"Unknown eviction policy {policy!r}. Use one of {list(order)}.")
+
+        with self._lock:
+            rows = self._conn.execute(f"SELECT product, t, relpath, size FROM files ORDER BY {order[policy]}").fetchall()
+
+        return [(product, pd.Timestamp(t, unit="s"), self.root / relpath, size) for product, t, relpath, size in rows]
+
+    def remove(self, paths: PathLike | Iterable[PathLike]) -> None:
+        """
+        Remove files from the catalog. The files themselves are not deleted.
+
+        Parameters
+        ----------
+        paths : PathLike | Iterable[PathLike]
+            Files to remove from the catalog.
+        """
+        if isinstance(paths, (str, PathLike)):
+            paths = [paths]
+
+        relpaths = [(self._relpath(Path(p)),) for p in paths]
+
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE relpath = ?", relpaths)
+
+    def query(self, product: str, start: pd.Timestamp, end: pd.Timestamp) -> dict[pd.Timestamp, Path]:
+        """
+        Find the files of a product within a time range (both ends included). If a file is
+        stored both uncompressed and gzipped, the uncompressed one is preferred.
+
+        Parameters
+        ----------
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        start, end : pd.Timestamp
+            Time range to query.
+
+        Returns
+        -------
+        dict[pd.Timestamp, Path]
+            Mapping of timestamps to file paths.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT t, relpath FROM files WHERE product = ? AND t BETWEEN ? AND ? "
+                "ORDER BY t, relpath LIKE '%.gz' DESC",
+                (product, _epoch(start), _epoch(end)),
+            ).fetchall()
+
+        # Rows are sorted so the preferred file of each timestamp comes last
+        return {pd.Timestamp(t, unit="s"): self.root / relpath for t, relpath in rows}
+
+    def listing(self, source: str, product: str, day: pd.Timestamp) -> set[pd.Timestamp] | None:
+        """
+        Files of a product available in a remote archive for a given day, as stored by
+        `save_listing`.
+
+        Parameters
+        ----------
+        source : str
+            Base URL of the archive.
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        day : pd.Timestamp
+            Day of the listing.
+
+        Returns
+        -------
+        set[pd.Timestamp] | None
+            Timestamps of the files in the archive, or None if the listing is not stored.
+        """
+        day = pd.Timestamp(day).normalize()
+
+        with self._lock:
+            if not self._conn.execute(
+                "SELECT 1 FROM listings WHERE source = ? AND product = ? AND day = ?",
+                (source, product, _epoch(day)),
+            ).fetchone():
+                return None
+
+            rows = self._conn.execute(
+                "SELECT t FROM remote WHERE source = ? AND product = ? AND t >= ? AND t < ?",
+                (source, product, _epoch(day), _epoch(day + pd.Timedelta(days=1))),
+            ).fetchall()
+
+        return {pd.Timestamp(t, unit="s") for (t,) in rows}
+
+    def save_listing(self, source: str, product: str, day: pd.Timestamp, stamps: Iterable[pd.Timestamp]) -> None:
+        """
+        Store the files of a product available in a remote archive for a given day. Only
+        listings that will not change anymore should be stored: any timestamp missing
+        from them is considered a gap in the archive.
+
+        Parameters
+        ----------
+        source : str
+            Base URL of the archive.
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        day : pd.Timestamp
+            Day of the listing.
+        stamps : Iterable[pd.Timestamp]
+            Timestamps of the files in the archive.
+        """
+        day = pd.Timestamp(day).normalize()
+
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO listings VALUES (?, ?, ?)", (source, product, _epoch(day)))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO remote VALUES (?, ?, ?)",
+                [(source, product, _epoch(t)) for t in stamps],
+            )
+
+    def forget_listings(self) -> None:
+        """Remove all the stored listings of remote archives."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM listings")
+            self._conn.execute("DELETE FROM remote")
+
+    def cursor(self, source: str, product: str) -> pd.Timestamp | None:
+        """
+        Timestamp of the last file of a product ingested from a remote archive by
+        `fetch.follow`.
+
+        Parameters
+        ----------
+        source : str
+            Base URL of the archive.
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+
+        Returns
+        -------
+        pd.Timestamp | None
+            Timestamp of the last file ingested, or None if the product was never followed.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT t FROM cursors WHERE source = ? AND product = ?", (source, product)
+            ).fetchone()
+
+        return pd.Timestamp(row[0], unit="s") if row else None
+
+    def set_cursor(self, source: str, product: str, t: pd.Timestamp) -> None:
+        """
+        Store the timestamp of the last file of a product ingested from a remote archive.
+
+        Parameters
+        ----------
+        source : str
+            Base URL of the archive.
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        t : pd.Timestamp
+            Timestamp of the last file ingested.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)", (source, product, _epoch(t)))
+
+    def rescan(self) -> int:
+        """
+        Rebuild the catalog by listing the files in the root folder.
+
+        Returns
+        -------
+        int
+            Number of files found.
+        """
+        with self._lock:
+            accessed = dict(self._conn.execute("SELECT relpath, accessed FROM files"))
+
+        rows = []
+
+        with scandir(self.root) as days:
+            for day in days:
+                if not (day.is_dir() and _DAYFOLDER.match(day.name)):
+                    continue
+
+                with scandir(day.path) as files:
+                    for f in files:
+                        if f.is_file() and (stat := f.stat()).st_size > 1024:
+                            # Keep the time of last access of the files already known
+                            relpath = f"{day.name}/{f.name}"
+                            last = accessed.get(relpath) or stat.st_mtime
+
+                            if row := self._row(Path(f.path), stat.st_size, last):
+                                rows.append(row)
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+
+        return len(rows)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f"Catalog({str(self.root)!r})"
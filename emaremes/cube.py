@@ -0,0 +1,275 @@
+from multiprocessing import Pool
+from functools import partial
+from os import PathLike
+from pathlib import Path
+from shutil import rmtree
+from typing import Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from . import grib
+from .catalog import parse_filename
+from .typing_utils import MRMSDataType
+from .utils import DATA_NAMES, Extent
+
+__all__ = ["ingest", "open_cube", "read_grid"]
+
+# Name of the data variable in a cube, same as in the datasets opened by cfgrib
+VARIABLE: str = "unknown"
+
+_GRID_ATTRS: tuple[str, ...] = ("nlat", "nlon", "lat0", "lon0", "dlat", "dlon")
+
+
+def _require_zarr() -> None:
+    try:
+        import zarr  # noqa: F401
+    except ImportError as e:
+        raise ImportError("Cubes are stored with `zarr`. Install it with `pip install zarr`.") from e
+
+
+def _sorted_by_time(files: Iterable[PathLike]) -> tuple[list[Path], pd.DatetimeIndex]:
+    """Order files by the timestamp in their names."""
+    files = [Path(f) for f in files]
+    stamps = []
+
+    for f in files:
+        if (parsed := parse_filename(f.name)) is None:
+            raise ValueError(f"Cannot tell the timestamp of {f.name}, it does not follow the MRMS naming.")
+
+        stamps.append(parsed[1])
+
+    stamps = pd.DatetimeIndex(stamps)
+    order = np.argsort(stamps.values, kind="stable")
+
+    return [files[i] for i in order], stamps[order]
+
+
+def _data_type(files: Iterable[Path]) -> MRMSDataType | None:
+    """Data type of a list of files, told by their names. None if they are not all of one type."""
+    products = {parse_filename(f.name)[0] for f in files}
+    data_types = [k for k, v in DATA_NAMES.items() if v in products]
+    return data_types[0] if len(products) == 1 and data_types else None
+
+
+def read_grid(store: PathLike) -> grib.GridDefinition:
+    """
+    Grid of the cells of a cube.
+
+    Parameters
+    ----------
+    store : PathLike
+        Path to the cube.
+
+    Returns
+    -------
+    grib.GridDefinition
+        Grid of the cube. Longitudes are positive, as in the GRIB files.
+    """
+    _require_zarr()
+
+    with xr.open_zarr(store, chunks=None, consolidated=False) as ds:
+        return grib.GridDefinition(**{k: ds.attrs[k] for k in _GRID_ATTRS})
+
+
+def open_cube(store: PathLike) -> xr.Dataset:
+    """
+    Open a cube written by `ingest`. Values are read lazily, chunk by chunk, as they
+    are indexed.
+
+    Parameters
+    ----------
+    store : PathLike
+        Path to the cube.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset with dimensions `time`, `latitude` and `longitude`, laid out as the datasets
+        of `grib.open_dataset`.
+    """
+    _require_zarr()
+    return xr.open_zarr(store, chunks=None, consolidated=False)
+
+
+def _open_encoded(store: PathLike) -> tuple[xr.Dataset, grib.Quantization | None]:
+    """
+    Open a cube without decoding quantized values, so they are read in their compact
+    integer form. The quantization is None if the values are stored as floats.
+    """
+    _require_zarr()
+    ds = xr.open_zarr(store, chunks=None, consolidated=False, mask_and_scale=False)
+    attrs = ds[VARIABLE].attrs
+
+    if "scale_factor" not in attrs:
+        return ds, None
+
+    return ds, grib.Quantization(
+        ds[VARIABLE].dtype.name, float(attrs["scale_factor"]), float(attrs["add_offset"]), int(attrs["_FillValue"])
+    )
+
+
+def _read_values(da: xr.DataArray, quantization: grib.Quantization | None) -> np.ndarray:
+    """Values of a selection of a cube as in `GribField.values`, with -3 for no data."""
+    values = da.values
+    return quantization.decode(values) if quantization is not None else values
+
+
+def _write_block(
+    store: Path,
+    fields: list[grib.GribField],
+    grid: grib.GridDefinition,
+    chunks: tuple[int, int, int],
+    quantization: grib.Quantization | None,
+    append: bool,
+) -> None:
+    values = np.stack([f.values for f in fields])
+
+    # xarray quantizes the values following the encoding of the store, with NaN for no data
+    if quantization is not None:
+        values = quantization.decode(quantization.encode(values))
+        values[values == -3] = np.nan
+
+    ds = xr.Dataset(
+        {VARIABLE: (("time", "latitude", "longitude"), values)},
+        coords={
+            "time": np.array([f.time for f in fields], dtype="datetime64[ns]"),
+            "latitude": grid.latitudes,
+            "longitude": grid.longitudes,
+        },
+        attrs={k: getattr(grid, k) for k in _GRID_ATTRS},
+    )
+
+    if append:
+        ds.to_zarr(store, append_dim="time", consolidated=False)
+        return
+
+    encoding = {
+        VARIABLE: {"chunks": chunks, **(quantization.cf_encoding if quantization is not None else {})},
+        "time": {"units": "seconds since 1970-01-01", "dtype": "int64", "chunks": (1 << 16,)},
+    }
+    ds.to_zarr(store, mode="w", encoding=encoding, consolidated=False)
+
+
+def ingest(
+    files: Sequence[PathLike],
+    store: PathLike,
+    extent: Extent | None = None,
+    time_chunk: int = 720,
+    space_chunk: int = 32,
+    quantize: bool = True,
+    overwrite: bool = False,
+    max_bytes: int = 2 * 1024**3,
+    verbose: bool = False,
+) -> Path:
+    """
+    Transcode MRMS files into a cube: a single chunked and compressed Zarr store with
+    one array of dimensions (time, latitude, longitude).
+
+    Chunks are long in time and small in space, so the series of a point or a basin over
+    years is a few chunk reads instead of one file open per timestamp. Query a cube with
+    `ts.point.query_cube` and `ts.polygon.query_cube`.
+
+    Parameters
+    ----------
+    files : Sequence[PathLike]
+        `.grib2` or `.grib2.gz` files of a single data type, e.g., as returned by
+        `fetch.timerange`. They are ordered by the timestamp in their names.
+    store : PathLike
+        Path of the Zarr store.
+    extent : Extent | None = None
+        Only keep the cells within this extent. If None, the full grid is kept.
+    time_chunk : int = 720
+        Number of timestamps in a chunk, one day of 2-minute data by default. Files are
+        decoded and written `time_chunk` at a time, or as many as fit in `max_bytes`.
+    space_chunk : int = 32
+        Number of rows and columns in a chunk.
+    quantize : bool = True
+        Store the values as scaled integers, see `grib.QUANTIZATION`. They take 2 to 4
+        times less space than single precision floats, before compression. Files whose
+        data type cannot be told from their names are stored as floats. Ignored when
+        appending to a store, which keeps its encoding.
+    overwrite : bool = False
+        If the store already exists, replace it. Otherwise, files later than the last
+        timestamp of the store are appended to it and the rest are skipped.
+    max_bytes : int = 2 * 1024**3
+        Size of the decoded fields held in memory before writing them. When fewer than
+        `time_chunk` fields fit, e.g. for the full CONUS grid, each time chunk is written
+        in several passes. Peak memory is a few times this size.
+    verbose : bool = False
+        Print progress.
+
+    Returns
+    -------
+    Path
+        Path to the store.
+
+    Examples
+    --------
+    >>> files = mrms.fetch.timerange("2024-01-01", "2024-12-31", frequency="10min")
+    >>> mrms.cube.ingest(files, "basin.zarr", extent=Extent((35.0, 36.5), (-85.0, -83.0)))
+    """
+    _require_zarr()
+
+    if time_chunk < 1 or space_chunk < 1 or max_bytes < 1:
+        raise ValueError("`time_chunk`, `space_chunk` and `max_bytes` must be positive.")
+
+    store = Path(store)
+    files, stamps = _sorted_by_time(files)
+
+    grid = None
+    append = store.exists() and not overwrite
+    data_type = _data_type(files) if quantize else None
+    quantization = grib.QUANTIZATION.get(data_type) if data_type is not None else None
+
+    if store.exists() and overwrite:
+        rmtree(store)
+
+    if append:
+        grid = read_grid(store)
+
+        ds, quantization = _open_encoded(store)
+
+        with ds:
+            last = pd.Timestamp(ds.time.values[-1])
+
+        keep = stamps > last
+        files = [f for f, k in zip(files, keep) if k]
+
+        if verbose:
+            print(f"-> {len(keep) - len(files)} files are already in {store}.")
+
+    if not files:
+        if not append:
+            raise ValueError("No files to ingest")
+        return store
+
+    if grid is None:
+        grid = grib.read_grid(files[0])
+        grid = grid.subgrid(*grid.window(extent)) if extent is not None else grid
+
+    # Decoded fields are float32
+    per_write = max(1, min(time_chunk, max_bytes // (4 * grid.nlat * grid.nlon)))
+    chunks = (time_chunk, min(space_chunk, grid.nlat), min(space_chunk, grid.nlon))
+
+    # Files are decoded in parallel, in order, and written `per_write` at a time
+    with Pool() as pool:
+        for start in range(0, len(files), per_write):
+            batch = files[start : start + per_write]
+            block = pool.map(partial(grib.read, extent=extent), batch)
+
+            for f, field in zip(batch, block):
+                if field.grid != grid:
+                    raise ValueError(f"The grid of {f.name} does not match the grid of the cube.")
+
+            _write_block(store, block, grid, chunks, quantization, append)
+            append = True
+
+            # Free the fields before decoding the next batch
+            del block
+
+            if verbose:
+                print(f"-> {start + len(batch)}/{len(files)} files written to {store}.")
+
+    return store
@@ -1,16 +1,31 @@
-from dataclasses import dataclass
-from datetime import date, datetime, timedelta
-from itertools import compress, product
-from multiprocessing import Pool
+import gzip
+import queue
+import random
+import re
+import threading
+import warnings
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
 from pathlib import Path
-from shutil import copyfileobj
+from time import monotonic, sleep
+from urllib.parse import unquote
+from os import replace
 from os.path import getsize
-from typing import get_args
+from typing import Any, Callable, Iterable, Iterator, Literal, Sequence, get_args
 
+import numpy as np
 import requests
 import pandas as pd
 
-from .utils import DATA_NAMES, _PathConfig
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as _URLLib3Error
+
+from .catalog import parse_filename
+from .utils import DATA_NAMES, _PathConfig, is_valid_grib
 from .typing_utils import MRMSDataType
 
 type DatetimeLike = date | datetime | pd.Timestamp
@@ -18,11 +33,42 @@ type TimedeltaLike = timedelta | pd.Timedelta
 
 _BASE_URL: str = "https://mtarchive.geol.iastate.edu"
 
-__all__ = ["path_config", "timerange"]
+__all__ = [
+    "path_config",
+    "timerange",
+    "iter_timerange",
+    "stream_timerange",
+    "follow",
+    "Downloader",
+    "DownloadSummary",
+]
 
 path_config = _PathConfig()
 
 
+def _snap_timestamp(t: pd.Timestamp, data_type: MRMSDataType) -> pd.Timestamp:
+    """
+    Round a timestamp to the time of the file that contains it.
+
+    Raises
+    ------
+    ValueError
+        If `t` is not a valid time for precipitation rate or flag files, which are
+        posted every 2 minutes.
+    """
+    match data_type:
+        case "precip_rate" | "precip_flag":
+            t = t.replace(second=0, microsecond=0)
+
+            if t.minute % 2 != 0:
+                raise ValueError(f"{t} is invalid. GRIB files are posted every 2 minutes")
+
+        case "precip_accum_1h" | "precip_accum_24h" | "precip_accum_72h":
+            t = t.replace(minute=0, second=0, microsecond=0)
+
+    return t
+
+
 @dataclass
 class _GribFile:
     """
@@ -36,16 +82,7 @@ class _GribFile:
         if not isinstance(self.t, pd.Timestamp):
             self.t: pd.Timestamp = pd.to_datetime(self.t)
 
-        # Check if the data_type is valid
-        match self.data_type:
-            case "precip_rate" | "precip_flag":
-                self.t = self.t.replace(second=0, microsecond=0)
-
-                if self.t.minute % 2 != 0:
-                    raise ValueError(f"{self.t} is invalid. GRIB files are posted every 2 minutes")
-
-            case "precip_accum_1h" | "precip_accum_24h" | "precip_accum_72h":
-                self.t = self.t.replace(minute=0, second=0, microsecond=0)
+        self.t = _snap_timestamp(self.t, self.data_type)
 
         # Check if the file exists in anywhere in path_config.
         # If it does, set that as the GribFile path. Otherwise,
@@ -53,26 +90,32 @@ class _GribFile:
 
         subdir: str = self.t.strftime(r"%Y%m%d")
         gz_name: str = self.url.rpartition("/")[-1]
-        grib_name: str = gz_name.rpartition(".")[0]
 
-        ordered_paths = [path_config.prefered_path]
-        if other_paths := path_config.all_paths - {path_config.prefered_path}:
-            ordered_paths += list(other_paths)
-
-        for root, name in product(ordered_paths, (grib_name, gz_name)):
-            if (root / subdir / name).exists():
-                self.root = root
-                self._path = root / subdir / name
-                break
+        if found := path_config.locate(DATA_NAMES[self.data_type], self.t):
+            self.root = found.parent.parent
+            self._path = found
         else:
             self.root = path_config.prefered_path
             self._path = self.root / subdir / gz_name
 
         self.subdir = self.root / subdir
 
+    @classmethod
+    def _planned(
+        cls, t: pd.Timestamp, data_type: MRMSDataType, root: Path, subdir: Path, name: str, url: str
+    ) -> "_GribFile":
+        """Create a GribFile whose location and URL are already known (see `_plan`)."""
+        gfile = cls.__new__(cls)
+        gfile.t, gfile.data_type, gfile._url = t, data_type, url
+        gfile.root, gfile.subdir, gfile._path = root, subdir, subdir / name
+        return gfile
+
     @property
     def url(self) -> str:
         """Assemble the URL to the MRMS archive"""
+        if url := getattr(self, "_url", None):
+            return url
+
         mrms_datatype = DATA_NAMES[self.data_type]
         header = f"{_BASE_URL}/{self.t.strftime(r'%Y/%m/%d')}/mrms/ncep/{mrms_datatype}"
         return f"{header}/{mrms_datatype}_00.00_{self.t.strftime(r'%Y%m%d-%H%M%S')}.grib2.gz"
@@ -85,6 +128,11 @@ class _GribFile:
     def filename(self) -> str:
         return self.path.name
 
+    @property
+    def part_path(self) -> Path:
+        """Temporary location of the file while it is being downloaded."""
+        return self.path.with_name(self.filename + ".part")
+
     def exists(self) -> bool:
         if it_exists := self.path.exists():
             # Check if the file is empty.
@@ -94,16 +142,312 @@ class _GribFile:
         return it_exists
 
 
-def _single_file(gfile: _GribFile, verbose: bool = False) -> None:
+def _snap_times(stamps: pd.DatetimeIndex, data_type: MRMSDataType) -> np.ndarray:
+    """
+    Vectorized `_snap_timestamp`.
+
+    Returns
+    -------
+    np.ndarray
+        Snapped timestamps as `datetime64[s]`.
+    """
+    match data_type:
+        case "precip_rate" | "precip_flag":
+            stamps = stamps.floor("min")
+
+            if (odd := stamps.minute % 2 != 0).any():
+                raise ValueError(f"{stamps[odd][0]} is invalid. GRIB files are posted every 2 minutes")
+
+        case "precip_accum_1h" | "precip_accum_24h" | "precip_accum_72h":
+            stamps = stamps.floor("h")
+
+    return stamps.values.astype("datetime64[s]")
+
+
+@dataclass
+class _FilePlan:
+    """
+    Files of a time range laid out as arrays, so planning a range of any length is a
+    handful of vectorized operations instead of one `_GribFile` per timestamp. Build it
+    with `_plan`.
+
+    Attributes
+    ----------
+    data_type : MRMSDataType
+        Type of data of the files.
+    times : np.ndarray
+        Sorted and unique timestamps of the files, as `datetime64[s]`.
+    days : np.ndarray
+        Day folder of each file, `YYYYMMDD`.
+    names : np.ndarray
+        File name in the archive, e.g. `PrecipRate_00.00_20240927-120000.grib2.gz`.
+    urls : np.ndarray
+        URL of each file in the archive.
+    """
+
+    data_type: MRMSDataType
+    times: np.ndarray
+    days: np.ndarray
+    names: np.ndarray
+    urls: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def relpaths(self) -> np.ndarray:
+        """Path of each file relative to a storage path, `YYYYMMDD/name`."""
+        return np.char.add(np.char.add(self.days, "/"), self.names)
+
+    def take(self, which: np.ndarray) -> "_FilePlan":
+        """Subset of the plan given a boolean mask, a slice or an array of indices."""
+        return _FilePlan(self.data_type, self.times[which], self.days[which], self.names[which], self.urls[which])
+
+    def index(self, t: pd.Timestamp) -> int:
+        """Position of a timestamp in the plan."""
+        return int(np.searchsorted(self.times, np.datetime64(t, "s")))
+
+    def timestamp(self, i: int) -> pd.Timestamp:
+        return pd.Timestamp(self.times[i])
+
+    def gribfiles(self, root: Path) -> list[_GribFile]:
+        """Files of the plan to be stored under `root`."""
+        folders = {day: root / day for day in np.unique(self.days).tolist()}
+        times = pd.DatetimeIndex(self.times).tolist()
+
+        return [
+            _GribFile._planned(t, self.data_type, root, folders[day], name, url)
+            for t, day, name, url in zip(times, self.days.tolist(), self.names.tolist(), self.urls.tolist())
+        ]
+
+
+def _plan(stamps: pd.DatetimeIndex, data_type: MRMSDataType) -> tuple[_FilePlan, np.ndarray]:
+    """
+    Build the file names, day folders and URLs of a set of timestamps in one pass.
+
+    Parameters
+    ----------
+    stamps : pd.DatetimeIndex
+        Requested timestamps. They are snapped to the times of the files, see `_snap_timestamp`.
+    data_type : MRMSDataType
+        Type of data of the files.
+
+    Returns
+    -------
+    tuple[_FilePlan, np.ndarray]
+        Plan of the unique files, and the position in the plan of each requested timestamp.
+    """
+    times, inverse = np.unique(_snap_times(stamps, data_type), return_inverse=True)
+    product = DATA_NAMES[data_type]
+
+    # "YYYY-MM-DDTHH:MM:SS" split into characters to rearrange them without leaving numpy
+    chars = np.datetime_as_string(times, unit="s").astype("U19").view("U1").reshape(-1, 19)
+
+    days = np.ascontiguousarray(chars[:, [0, 1, 2, 3, 5, 6, 8, 9]]).view("U8").ravel()
+    clock = np.ascontiguousarray(chars[:, [11, 12, 14, 15, 17, 18]]).view("U6").ravel()
+
+    slashed = chars[:, :10].copy()
+    slashed[:, [4, 7]] = "/"
+    slashed = slashed.view("U10").ravel()
+
+    names = np.char.add(np.char.add(f"{product}_00.00_", days), np.char.add(np.char.add("-", clock), ".grib2.gz"))
+    urls = np.char.add(np.char.add(f"{_BASE_URL}/", slashed), np.char.add(f"/mrms/ncep/{product}/", names))
+
+    return _FilePlan(data_type, times, days, names, urls), inverse.ravel()
+
+
+class _DownloadError(Exception):
+    """
+    A failed attempt to download a file.
+
+    Parameters
+    ----------
+    reason : str
+        Description of the failure.
+    retryable : bool
+        Whether a later attempt could succeed, e.g. after a server error or a dropped
+        connection. Files that are not in the archive are not retryable.
+    retry_after : float | None
+        Seconds to wait before retrying, as requested by the server.
+    missing : bool
+        Whether the file is not in the archive (HTTP 404).
+    """
+
+    def __init__(self, reason: str, retryable: bool, retry_after: float | None = None, missing: bool = False) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.missing = missing
+
+
+_RETRYABLE_STATUS: set[int] = {408, 429, 500, 502, 503, 504}
+_TIMEOUT: tuple[float, float] = (15, 60)  # Connect and read timeouts in seconds
+
+# Quotas are enforced after this many bytes are downloaded into a path, or a tenth of its quota
+_QUOTA_CHECK_BYTES: int = 256 * 1024**2
+
+
+def _check_status(r: requests.Response) -> None:
+    """Raise a `_DownloadError` for responses that do not carry the file."""
+    if r.status_code in _RETRYABLE_STATUS:
+        retry_after = r.headers.get("Retry-After", "")
+        raise _DownloadError(
+            f"HTTP {r.status_code}",
+            retryable=True,
+            retry_after=float(retry_after) if retry_after.isdigit() else None,
+        )
+
+    if r.status_code == 404:
+        raise _DownloadError("Not in the archive", retryable=False, missing=True)
+
+    raise _DownloadError(f"HTTP {r.status_code}", retryable=False)
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket. Tokens are refilled at a constant `rate` per second up to a
+    burst of `rate` tokens. Requests larger than the burst are let through when the bucket
+    is full and leave it in debt, so the long-term rate is still respected.
+    """
+
+    def __init__(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("Rate limits must be positive")
+
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self._tokens = self.capacity
+        self._last = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+
+                if self._tokens >= min(amount, self.capacity):
+                    self._tokens -= amount
+                    return
+
+                wait = (min(amount, self.capacity) - self._tokens) / self.rate
+
+            sleep(wait)
+
+
+class _Throttle:
+    """Global requests-per-second and bytes-per-second caps shared by all download threads."""
+
+    def __init__(self, requests_per_second: float | None = None, bytes_per_second: float | None = None) -> None:
+        self._requests = _TokenBucket(requests_per_second) if requests_per_second else None
+        self._bytes = _TokenBucket(bytes_per_second) if bytes_per_second else None
+
+    def request(self) -> None:
+        if self._requests:
+            self._requests.acquire()
+
+    def chunks(self, r: requests.Response, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        """Iterate over the raw content of a response, respecting the bytes-per-second cap."""
+        for chunk in r.raw.stream(chunk_size, decode_content=False):
+            if self._bytes:
+                self._bytes.acquire(len(chunk))
+
+            yield chunk
+
+
+def _request_file(gfile: _GribFile, session: requests.Session | None = None, throttle: _Throttle | None = None) -> int:
+    """
+    Make a single attempt to download a GribFile into its path. See `_single_file`.
+
+    Returns
+    -------
+    int
+        Number of bytes received.
+
+    Raises
+    ------
+    _DownloadError
+        If the attempt failed.
+    """
+    # Make sure YYYYMMDD folder exists
+    gfile.subdir.mkdir(exist_ok=True, parents=True)
+
+    part = gfile.part_path
+    offset = getsize(part) if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+
+    getter = session.get if session is not None else requests.get
+    throttle = throttle or _Throttle()
+    received = 0
+
+    try:
+        throttle.request()
+
+        with getter(gfile.url, stream=True, headers=headers, timeout=_TIMEOUT) as r:
+            content_range = r.headers.get("Content-Range", "")
+
+            if r.status_code == 206 and content_range.startswith(f"bytes {offset}-"):
+                mode = "ab"  # Resume the partial download
+
+            elif r.status_code == 200:
+                mode = "wb"  # Server sent the whole file
+
+            elif r.status_code == 416 and offset:
+                mode = None  # The partial download is already complete
+
+            elif r.status_code == 206:
+                raise _DownloadError(f"Unexpected Content-Range {content_range!r}", retryable=False)
+
+            else:
+                _check_status(r)
+
+            if mode:
+                with open(part, mode) as f:
+                    for chunk in throttle.chunks(r):
+                        f.write(chunk)
+                        received += len(chunk)
+
+    except (requests.RequestException, _URLLib3Error, OSError) as e:
+        # What was received is kept in the .part file and resumed on the next attempt
+        raise _DownloadError(f"Interrupted: {e}", retryable=True) from e
+
+    if not is_valid_grib(part):
+        part.unlink(missing_ok=True)
+        raise _DownloadError("Corrupt file", retryable=True)
+
+    replace(part, gfile._path)
+    path_config.register(gfile._path)
+
+    return received
+
+
+def _single_file(gfile: _GribFile, verbose: bool = False, session: requests.Session | None = None) -> bool:
     """
     Requests a GribFile from the base URL and stores it into the MRMS default path.
 
+    Data is written to a `.part` file next to the destination. If a `.part` file is
+    already there from an interrupted download, only the missing bytes are requested
+    using an HTTP Range request. The file is renamed into place only after checking
+    that it is complete (see `utils.is_valid_grib`).
+
+    A single attempt is made. Use `Downloader` to retry failed downloads.
+
     Parameters
     ----------
     gfile : GribFile
         File to be requested.
     verbose : bool, optional
         Whether to print the progress of the download, by default False.
+    session : requests.Session | None, optional
+        Session used to make the request. Reusing a session keeps the connection to the
+        archive open between requests. If None, a one-off request is made.
+
+    Returns
+    -------
+    bool
+        Whether the file is available on disk after the request.
     """
 
     if not isinstance(gfile, _GribFile):
@@ -112,31 +456,770 @@ def _single_file(gfile: _GribFile, verbose: bool = False) -> None:
     if gfile.exists():
         if verbose:
             print(f"{gfile._path} already exists. Skipping.")
-        return
 
-    # Make sure YYYYMMDD folder exists
-    gfile.subdir.mkdir(exist_ok=True, parents=True)
+        path_config.register(gfile._path)
+        return True
+
+    try:
+        _request_file(gfile, session)
+
+    except _DownloadError as e:
+        if verbose:
+            print(f"Error downloading {gfile.filename}: {e.reason}.")
+
+        return False
+
+    if verbose:
+        print(f"Saved {gfile._path} :)")
+
+    return True
+
+
+def _read_message(f: Path) -> bytes:
+    """Read the uncompressed GRIB2 message of a `.grib2` or `.grib2.gz` file."""
+    if f.suffix == ".gz":
+        with gzip.open(f, "rb") as fin:
+            return fin.read()
+
+    return f.read_bytes()
+
+
+def _request_message(
+    gfile: _GribFile, session: requests.Session | None = None, throttle: _Throttle | None = None
+) -> tuple[bytes, int]:
+    """
+    Make a single attempt to download a GribFile into memory. See `_single_message`.
+
+    Returns
+    -------
+    tuple[bytes, int]
+        Uncompressed GRIB2 message and number of bytes received.
+
+    Raises
+    ------
+    _DownloadError
+        If the attempt failed.
+    """
+    getter = session.get if session is not None else requests.get
+    throttle = throttle or _Throttle()
+
+    try:
+        throttle.request()
+
+        with getter(gfile.url, stream=True, timeout=_TIMEOUT) as r:
+            if r.status_code != 200:
+                _check_status(r)
+
+            content = b"".join(throttle.chunks(r))
+
+    except (requests.RequestException, _URLLib3Error, OSError) as e:
+        raise _DownloadError(f"Interrupted: {e}", retryable=True) from e
+
+    try:
+        message = gzip.decompress(content)
+    except (OSError, EOFError, zlib.error) as e:
+        raise _DownloadError("Corrupt file", retryable=True) from e
+
+    if not (message.startswith(b"GRIB") and message.endswith(b"7777")):
+        raise _DownloadError("Corrupt file", retryable=True)
+
+    return message, len(content)
+
+
+def _single_message(gfile: _GribFile, verbose: bool = False, session: requests.Session | None = None) -> bytes | None:
+    """
+    Requests a GribFile from the base URL and keeps it in memory.
+
+    Parameters
+    ----------
+    gfile : GribFile
+        File to be requested.
+    verbose : bool, optional
+        Whether to print the progress of the download, by default False.
+    session : requests.Session | None, optional
+        Session used to make the request. If None, a one-off request is made.
+
+    Returns
+    -------
+    bytes | None
+        Uncompressed GRIB2 message, or None if the file could not be downloaded or is corrupt.
+    """
+    try:
+        return _request_message(gfile, session)[0]
+
+    except _DownloadError as e:
+        if verbose:
+            print(f"Error downloading {gfile.filename}: {e.reason}.")
+
+        return None
+
+
+@dataclass
+class DownloadSummary:
+    """
+    Summary of a run of `Downloader.fetch_many`.
+
+    Attributes
+    ----------
+    requested : int
+        Number of files requested.
+    downloaded : int
+        Number of files successfully downloaded.
+    received_bytes : int
+        Number of bytes received from the archive.
+    retries : int
+        Number of attempts that were retried.
+    missing : list[str]
+        Names of the files that are not in the archive (HTTP 404).
+    failed : dict[str, str]
+        Names of the files that could not be downloaded, after all retries for transient
+        errors, mapped to the reason of the last failure.
+    """
+
+    requested: int = 0
+    downloaded: int = 0
+    received_bytes: int = 0
+    retries: int = 0
+    missing: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        lines = [
+            f"{self.downloaded}/{self.requested} files downloaded "
+            f"({self.received_bytes / 1e6:.1f} MB, {self.retries} retries)."
+        ]
+
+        if self.missing:
+            lines.append(f"{len(self.missing)} files are not in the archive.")
+
+        if self.failed:
+            lines.append(f"{len(self.failed)} files failed:")
+            lines.extend(f"  {name}: {reason}" for name, reason in sorted(self.failed.items()))
+
+        return "\n".join(lines)
+
+
+class Downloader:
+    """
+    Download engine for the MRMS archive. Files are requested by a bounded pool of threads
+    that share a single HTTP session, so TCP/TLS connections are reused between files.
+
+    Failed attempts caused by server errors, throttling (HTTP 429) or dropped connections
+    are retried with exponential backoff and full jitter. Interrupted downloads are resumed
+    from where they stopped. Optional global caps on requests and bytes per second apply to
+    all the threads together. After each call to `fetch_many`, `summary` reports what was
+    downloaded and what failed.
+
+    Parameters
+    ----------
+    max_workers : int = 8
+        Maximum number of concurrent downloads. This is also the size of the connection pool.
+    retries : int = 3
+        Number of times a failed download is retried.
+    backoff : float = 1.0
+        Base delay in seconds. The delay before retry `n` is drawn uniformly between 0 and
+        `backoff * 2**n`, capped at `max_backoff`.
+    max_backoff : float = 60.0
+        Maximum delay in seconds between attempts.
+    max_requests_per_second : float | None = None
+        Global cap on the number of requests per second. If None, there is no cap.
+    max_bytes_per_second : float | None = None
+        Global cap on the download bandwidth. If None, there is no cap.
+
+    Examples
+    --------
+    >>> with Downloader(max_workers=16) as dl:
+    ...     files = timerange("2024-09-27T00:00", "2024-09-28T00:00", downloader=dl)
+    ...     print(dl.summary)
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        retries: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        max_requests_per_second: float | None = None,
+        max_bytes_per_second: float | None = None,
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError("`max_workers` must be at least 1")
+
+        if retries < 0:
+            raise ValueError("`retries` must not be negative")
+
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.summary = DownloadSummary()
+
+        self._throttle = _Throttle(max_requests_per_second, max_bytes_per_second)
+        self._summary_lock = threading.Lock()
+        self._session: requests.Session | None = None
+
+    @property
+    def session(self) -> requests.Session:
+        """HTTP session shared by all the download threads. It is created on first use."""
+        if self._session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+
+        return self._session
+
+    def close(self) -> None:
+        """Close the HTTP session and the connections it holds."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def __enter__(self) -> "Downloader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _record(self, **counts: int) -> None:
+        with self._summary_lock:
+            for key, value in counts.items():
+                setattr(self.summary, key, getattr(self.summary, key) + value)
+
+    def _with_retries(self, attempt: Callable[[], Any], gfile: _GribFile, verbose: bool) -> Any:
+        """Call `attempt` until it succeeds or the retries are exhausted."""
+        for n in range(self.retries + 1):
+            try:
+                return attempt()
+
+            except _DownloadError as e:
+                if not e.retryable:
+                    with self._summary_lock:
+                        if e.missing:
+                            self.summary.missing.append(gfile.filename)
+                        else:
+                            self.summary.failed[gfile.filename] = e.reason
+
+                    if verbose:
+                        print(f"Error downloading {gfile.filename}: {e.reason}.")
+
+                    return None
+
+                if n == self.retries:
+                    with self._summary_lock:
+                        self.summary.failed[gfile.filename] = e.reason
+
+                    if verbose:
+                        print(f"Giving up on {gfile.filename} after {n + 1} attempts: {e.reason}.")
+
+                    return None
+
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**n))
+                delay = max(delay, min(e.retry_after or 0, self.max_backoff))
+
+                if verbose:
+                    print(f"Error downloading {gfile.filename}: {e.reason}. Retrying in {delay:.1f} s.")
+
+                self._record(retries=1)
+                sleep(delay)
+
+    def fetch(self, gfile: _GribFile, verbose: bool = False) -> bool:
+        """
+        Download a single file.
+
+        Parameters
+        ----------
+        gfile : _GribFile
+            File to be requested.
+        verbose : bool = False
+            Whether to print the progress of the download.
+
+        Returns
+        -------
+        bool
+            Whether the file is available on disk after the request.
+        """
+        if gfile.exists():
+            path_config.register(gfile._path)
+            return True
+
+        received = self._with_retries(lambda: _request_file(gfile, self.session, self._throttle), gfile, verbose)
+
+        if received is None:
+            return False
+
+        self._record(downloaded=1, received_bytes=received)
+
+        if verbose:
+            print(f"Saved {gfile._path} :)")
+
+        return True
+
+    def fetch_message(self, gfile: _GribFile, verbose: bool = False) -> bytes | None:
+        """
+        Download a single file into memory. Nothing is written to disk.
+
+        Parameters
+        ----------
+        gfile : _GribFile
+            File to be requested.
+        verbose : bool = False
+            Whether to print the progress of the download.
 
-    with requests.get(gfile.url, stream=True) as r:
-        if r.status_code == 200:
-            with open(gfile._path, "wb") as f:
-                copyfileobj(r.raw, f)  # Write data to file
+        Returns
+        -------
+        bytes | None
+            Uncompressed GRIB2 message, or None if the file could not be downloaded.
+        """
+        query = self._with_retries(lambda: _request_message(gfile, self.session, self._throttle), gfile, verbose)
+
+        if query is None:
+            return None
+
+        message, received = query
+        self._record(downloaded=1, received_bytes=received)
+
+        return message
+
+    def fetch_many(
+        self,
+        gfiles: Iterable[_GribFile],
+        verbose: bool = False,
+        in_memory: bool = False,
+    ) -> Iterator[tuple[_GribFile, bool | bytes | None]]:
+        """
+        Download several files concurrently. A new `summary` is started on each call.
+        Files are taken from `gfiles` as downloads complete, keeping at most twice
+        `max_workers` downloads queued, so `gfiles` can be a lazy iterable.
+
+        Parameters
+        ----------
+        gfiles : Iterable[_GribFile]
+            Files to be requested.
+        verbose : bool = False
+            Whether to print the progress of the downloads.
+        in_memory : bool = False
+            Whether to download the files into memory (see `fetch_message`) instead of
+            storing them on disk.
+
+        Yields
+        ------
+        tuple[_GribFile, bool | bytes | None]
+            Each file, in completion order, and whether it is available on disk. If
+            `in_memory`, the GRIB2 message or None is yielded instead.
+        """
+        gfiles = iter(gfiles)
+        self.summary = DownloadSummary()
+
+        fetch = self.fetch_message if in_memory else self.fetch
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending: dict[Future, _GribFile] = {}
+
+        def submit(n: int) -> None:
+            for gf in islice(gfiles, n):
+                pending[pool.submit(fetch, gf, verbose)] = gf
+                self._record(requested=1)
+
+        try:
+            submit(2 * self.max_workers)
+
+            while pending:
+                done, _ = wait_futures(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    # Keep the pool busy while the consumer handles the file
+                    submit(1)
+                    yield pending.pop(future), future.result()
+
+        finally:
+            # If the consumer stops early, drop the downloads that have not started
+            pool.shutdown(wait=True, cancel_futures=True)
 
             if verbose:
-                print(f"Saved {gfile._path} :)")
+                print(self.summary)
+
+            elif self.summary.failed:
+                warnings.warn(f"Some files could not be downloaded.\n{self.summary}", stacklevel=2)
+
+
+def _listing_url(product: str, day: pd.Timestamp) -> str:
+    """Assemble the URL to the folder of a product for a given day in the MRMS archive"""
+    return f"{_BASE_URL}/{day.strftime(r'%Y/%m/%d')}/mrms/ncep/{product}/"
+
+
+def _fetch_listing(product: str, day: pd.Timestamp, session: requests.Session) -> set[pd.Timestamp] | None:
+    """
+    Request the listing of the files of a product available in the archive for a day.
+
+    Returns
+    -------
+    set[pd.Timestamp] | None
+        Timestamps of the files in the archive, or None if the listing could not be retrieved.
+    """
+    try:
+        r = session.get(_listing_url(product, day), timeout=60)
+    except requests.RequestException:
+        return None
+
+    if r.status_code == 404:
+        return set()  # Nothing was posted that day
+
+    if r.status_code != 200:
+        return None
+
+    stamps = set()
+    for href in re.findall(r'href="([^"]+)"', r.text):
+        if (parsed := parse_filename(unquote(href).rpartition("/")[-1])) and parsed[0] == product:
+            stamps.add(parsed[1])
+
+    return stamps
+
+
+def _listing_is_final(day: pd.Timestamp) -> bool:
+    """Whether files can still be posted to the archive for a day."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return day + pd.Timedelta(days=1, hours=6) < now
+
+
+def _iter_available(
+    plan: _FilePlan, session: requests.Session, verbose: bool = False
+) -> Iterator[tuple[_FilePlan, np.ndarray]]:
+    """
+    Find which files of a plan are in the archive using the per-day listings of the
+    archive. Listings are only requested as the days are consumed, so files of the
+    first days can be downloaded while the rest of the listings are pending. Listings
+    of past days are stored in the catalog of the prefered path, so known gaps are
+    never requested again. If the listing of a day cannot be retrieved, all its files
+    are assumed to be available.
+
+    Yields
+    ------
+    tuple[_FilePlan, np.ndarray]
+        Files of each day of the plan and a boolean mask of those in the archive.
+    """
+    product = DATA_NAMES[plan.data_type]
+    catalog = path_config.catalog(path_config.prefered_path)
+
+    # The plan is sorted, so the files of each day are contiguous
+    days, starts = np.unique(plan.days, return_index=True)
+
+    for day, lo, hi in zip(days.tolist(), starts.tolist(), [*starts[1:].tolist(), len(plan)]):
+        day, files = pd.Timestamp(day), plan.take(slice(lo, hi))
+
+        if (listed := catalog.listing(_BASE_URL, product, day)) is None:
+            if (listed := _fetch_listing(product, day, session)) is None:
+                yield files, np.ones(len(files), dtype=bool)
+                continue
+
+            if _listing_is_final(day):
+                catalog.save_listing(_BASE_URL, product, day, listed)
+
+        listed = pd.DatetimeIndex(list(listed)).values.astype("datetime64[s]")
+        available = np.isin(files.times, listed)
+
+        if verbose and (n_gaps := len(files) - available.sum()):
+            print(f"-> {n_gaps} files from {day.date()} are not in the archive. Skipping.")
+
+        yield files, available
+
+
+def _date_range(
+    initial_datetime: str | DatetimeLike,
+    end_datetime: str | DatetimeLike,
+    frequency: str | TimedeltaLike,
+    data_type: MRMSDataType,
+) -> pd.DatetimeIndex:
+    """Validate the arguments of `timerange` and generate the requested timestamps."""
+    if not isinstance(initial_datetime, pd.Timestamp):
+        initial_datetime = pd.Timestamp(initial_datetime)
+
+    if not isinstance(end_datetime, pd.Timestamp):
+        end_datetime = pd.Timestamp(end_datetime)
+
+    if initial_datetime > end_datetime:
+        raise ValueError("`initial_datetime` must come before `end_datetime`")
+
+    if not isinstance(frequency, pd.Timedelta):
+        frequency = pd.Timedelta(frequency)
+
+    if frequency < pd.Timedelta(minutes=2):
+        raise ValueError("`frequency` should not be less than 2 minutes")
+
+    if data_type not in get_args(MRMSDataType.__value__):
+        raise KeyError(f"`data_type` must be one of: {get_args(MRMSDataType.__value__)}")
+
+    # Generate range of files
+    initial_datetime = initial_datetime.replace(second=0, microsecond=0)
+    end_datetime = end_datetime.replace(second=0, microsecond=0)
+    return pd.date_range(initial_datetime, end_datetime, freq=frequency)
+
+
+def _find_stored(plan: _FilePlan) -> np.ndarray:
+    """
+    Resolve the files of a plan already stored with a single query to the catalogs.
+
+    Returns
+    -------
+    np.ndarray
+        Path of each file of the plan, or None if it is not stored.
+    """
+    paths = np.full(len(plan), None, dtype=object)
+
+    if not len(plan):
+        return paths
+
+    stored = path_config.query(DATA_NAMES[plan.data_type], plan.timestamp(0), plan.timestamp(-1))
+
+    if stored:
+        times = pd.DatetimeIndex(list(stored)).values.astype("datetime64[s]")
+        pos = np.searchsorted(plan.times, times).clip(max=len(plan) - 1)
+        match = plan.times[pos] == times
+        paths[pos[match]] = np.fromiter(stored.values(), dtype=object, count=len(stored))[match]
+
+    return paths
+
+
+def _iter_files(
+    plans: list[_FilePlan],
+    verbose: bool,
+    max_workers: int,
+    downloader: Downloader | None,
+    use_listing: bool,
+) -> Iterator[tuple[int, int, Path | None]]:
+    """
+    Resolve the files of one or more plans. Files already stored are yielded first,
+    then the downloaded ones in completion order. The files of all the plans are
+    downloaded together by a single downloader. Files are identified by the position of
+    their plan and their position in it. Files that could not be downloaded or that are
+    not in the archive are yielded with None as their path.
+    """
+    root = path_config.prefered_path
+    todo: list[_FilePlan] = []
+    in_use: set[Path] = set()
+
+    for k, plan in enumerate(plans):
+        paths = _find_stored(plan)
+        is_stored = paths != None  # noqa: E711 (elementwise comparison)
+        found = paths[is_stored].tolist()
+        path_config.touch(found)
+
+        yield from ((k, i, path) for i, path in zip(np.flatnonzero(is_stored).tolist(), found))
+
+        # Files of this run are never evicted to make room for the rest
+        in_use.update(found)
+        todo.append(plan.take(~is_stored))
+
+    dl = downloader or Downloader(max_workers=max_workers)
+
+    # Bytes downloaded into each path with a quota since it was last enforced
+    quotas = path_config.quotas
+    pending: dict[Path, int] = {}
+
+    # Files found not to be in the archive, pending to be yielded
+    gaps: list[tuple[int, int]] = []
+
+    def gfiles() -> Iterator[_GribFile]:
+        """Files to download, checking the listing of each day only once it is reached."""
+        for k, missing in enumerate(todo):
+            if not (len(missing) and use_listing):
+                yield from missing.gribfiles(root)
+                continue
+
+            for files, available in _iter_available(missing, dl.session, verbose):
+                gaps.extend((k, plans[k].index(t)) for t in pd.DatetimeIndex(files.times[~available]))
+                yield from files.take(available).gribfiles(root)
+
+    try:
+        position = {plan.data_type: k for k, plan in enumerate(plans)}
+
+        if n_missing := sum(len(missing) for missing in todo):
+            if verbose:
+                print(f"-> {n_missing} *new* files will be downloaded...")
+
+            for gf, ok in dl.fetch_many(gfiles(), verbose):
+                yield from ((k, i, None) for k, i in gaps)
+                gaps.clear()
+
+                if ok:
+                    in_use.add(gf._path)
+
+                if ok and gf.root in quotas:
+                    pending[gf.root] = pending.get(gf.root, 0) + gf._path.stat().st_size
+
+                    if pending[gf.root] >= min(_QUOTA_CHECK_BYTES, quotas[gf.root][0] // 10):
+                        path_config.enforce_quota(gf.root, keep=in_use)
+                        pending[gf.root] = 0
+
+                k = position[gf.data_type]
+                yield k, plans[k].index(gf.t), gf.path if ok else None
+
+            yield from ((k, i, None) for k, i in gaps)
 
         else:
             if verbose:
-                print(f"Error downloading {gfile.filename}. It is likely that it does not exist in the archive.")
+                print("Nothing new to download :D")
 
+    finally:
+        for root, size in pending.items():
+            if size:
+                path_config.enforce_quota(root, keep=in_use)
 
-def timerange(
+        if downloader is None:
+            dl.close()
+
+
+def _iter_messages(
+    plan: _FilePlan,
+    verbose: bool,
+    max_workers: int,
+    downloader: Downloader | None,
+    use_listing: bool,
+) -> Iterator[tuple[pd.Timestamp, bytes]]:
+    """
+    Same as `_iter_files`, but yields the timestamps and uncompressed GRIB2 messages.
+    Files that are not stored are downloaded into memory and never written to disk.
+    """
+    paths = _find_stored(plan)
+    is_stored = paths != None  # noqa: E711 (elementwise comparison)
+    path_config.touch(paths[is_stored].tolist())
+
+    for i in np.flatnonzero(is_stored).tolist():
+        yield plan.timestamp(i), _read_message(paths[i])
+
+    root = path_config.prefered_path
+    missing = plan.take(~is_stored)
+    dl = downloader or Downloader(max_workers=max_workers)
+
+    def gfiles() -> Iterator[_GribFile]:
+        """Files to stream, checking the listing of each day only once it is reached."""
+        if not use_listing:
+            yield from missing.gribfiles(root)
+            return
+
+        for files, available in _iter_available(missing, dl.session, verbose):
+            yield from files.take(available).gribfiles(root)
+
+    try:
+        if verbose and len(missing):
+            print(f"-> {len(missing)} files will be streamed...")
+
+        for gf, message in dl.fetch_many(gfiles(), verbose, in_memory=True):
+            if message is not None:
+                yield gf.t, message
+
+    finally:
+        if downloader is None:
+            dl.close()
+
+
+def _in_time_order(files: Iterator[tuple[int, Path | None]]) -> Iterator[Path]:
+    """Reorder the output of `_iter_files`, yielding each file once all earlier ones are resolved."""
+    resolved: dict[int, Path | None] = {}
+    next_i = 0
+
+    for i, path in files:
+        resolved[i] = path
+
+        while next_i in resolved:
+            if (ready := resolved.pop(next_i)) is not None:
+                yield ready
+
+            next_i += 1
+
+
+def iter_timerange(
+    initial_datetime: str | DatetimeLike,
+    end_datetime: str | DatetimeLike,
+    frequency: str | TimedeltaLike = pd.Timedelta(minutes=10),
+    data_type: MRMSDataType = "precip_rate",
+    verbose: bool = False,
+    max_workers: int = 8,
+    downloader: Downloader | None = None,
+    use_listing: bool = True,
+    order: Literal["time", "completion"] = "time",
+) -> Iterator[Path]:
+    """
+    Download MRMS files available in the time range, yielding each file as soon as it
+    is on disk. This allows processing files while the rest are being downloaded.
+
+    Parameters are the same as in `timerange`, plus:
+
+    Parameters
+    ----------
+    order : Literal["time", "completion"] = "time"
+        Order in which files are yielded. With "time", files are yielded in chronological
+        order, so a file is held back until all the earlier ones are resolved. With
+        "completion", files already stored are yielded first and the rest as soon as
+        their download finishes.
+
+    Yields
+    ------
+    Path
+        Path to each file in the range. Files that are not in the archive are skipped.
+
+    Examples
+    --------
+    >>> for f in iter_timerange("2024-09-27T00:00", "2024-09-28T00:00", order="completion"):
+    ...     time, values = ts.point.query_single_file(f, geodata)
+    """
+    if order not in ("time", "completion"):
+        raise ValueError("`order` must be either 'time' or 'completion'")
+
+    range_dates = _date_range(initial_datetime, end_datetime, frequency, data_type)
+
+    if verbose:
+        print(f"-> {len(range_dates)} files requested...")
+
+    plan, _ = _plan(range_dates, data_type)
+    files = ((i, path) for _, i, path in _iter_files([plan], verbose, max_workers, downloader, use_listing))
+
+    if order == "time":
+        return _in_time_order(files)
+
+    return (path for _, path in files if path is not None)
+
+
+def stream_timerange(
     initial_datetime: str | DatetimeLike,
     end_datetime: str | DatetimeLike,
     frequency: str | TimedeltaLike = pd.Timedelta(minutes=10),
     data_type: MRMSDataType = "precip_rate",
     verbose: bool = False,
-) -> list[Path]:
+    max_workers: int = 8,
+    downloader: Downloader | None = None,
+    use_listing: bool = True,
+) -> Iterator[tuple[pd.Timestamp, bytes]]:
+    """
+    Stream the GRIB2 messages of a time range without storing them. Files already on disk
+    are read from there; the rest are downloaded and decompressed in memory.
+
+    Parameters are the same as in `timerange`.
+
+    Yields
+    ------
+    tuple[pd.Timestamp, bytes]
+        Timestamp and uncompressed GRIB2 message of each file, in completion order.
+
+    See Also
+    --------
+    grib.decode : Decode a GRIB2 message held in memory.
+    """
+    range_dates = _date_range(initial_datetime, end_datetime, frequency, data_type)
+    plan, _ = _plan(range_dates, data_type)
+    return _iter_messages(plan, verbose, max_workers, downloader, use_listing)
+
+
+def timerange(
+    initial_datetime: str | DatetimeLike,
+    end_datetime: str | DatetimeLike,
+    frequency: str | TimedeltaLike = pd.Timedelta(minutes=10),
+    data_type: MRMSDataType | Sequence[MRMSDataType] = "precip_rate",
+    verbose: bool = False,
+    max_workers: int = 8,
+    downloader: Downloader | None = None,
+    use_listing: bool = True,
+) -> list[Path] | pd.DataFrame:
     """
     Download MRMS files available in the time range.
 
@@ -149,65 +1232,244 @@ def timerange(
     frequency : str | TimedeltaLike = pd.Timedelta(minutes=10)
         Frequency of files to download. Precipitation rate and flags are available every
         2 minutes. Accumulated precipitation is available every hour.
-    data_type : MRMSDataType = "precip_rate"
+    data_type : MRMSDataType | Sequence[MRMSDataType] = "precip_rate"
         Type of data to download, by default "precip_rate". Other options are "precip_flag",
-        "precip_accum_1h", "precip_accum_24h" and "precip_accum_72h",
+        "precip_accum_1h", "precip_accum_24h" and "precip_accum_72h". Several types can be
+        passed to download them together, sharing the same connections.
     verbose : bool = False
         Whether to print the progress of the download, by default False.
+    max_workers : int = 8
+        Maximum number of concurrent downloads. Ignored if a `downloader` is passed.
+    downloader : Downloader | None = None
+        Download engine to use. Passing one allows reusing its connections between calls.
+        If None, a new one is created and closed when the call is done.
+    use_listing : bool = True
+        Whether to check the listing of the archive to skip files that do not exist before
+        requesting them. Listings of past days are cached, so reruns over historical ranges
+        do not make any request for known gaps.
 
     Returns
     -------
-    list[Path]
-        List of paths with the downloaded files.
+    list[Path] | pd.DataFrame
+        List of paths with the downloaded files. If several types of data are requested,
+        a table indexed by the requested timestamps with the path of the file of each type
+        of data as columns. Cells are None where a file is not available. For accumulated
+        precipitation, the file of the hour that contains each timestamp is used.
+
+    See Also
+    --------
+    iter_timerange : Yield files as soon as they are downloaded.
+
+    Examples
+    --------
+    >>> files = timerange("2024-09-27T00:00", "2024-09-28T00:00", data_type=["precip_rate", "precip_flag"])
+    >>> for rate, flag in files.itertuples(index=False):
+    ...     ...
     """
-    if not isinstance(initial_datetime, pd.Timestamp):
-        initial_datetime = pd.Timestamp(initial_datetime)
+    data_types = [data_type] if isinstance(data_type, str) else list(dict.fromkeys(data_type))
 
-    if not isinstance(end_datetime, pd.Timestamp):
-        end_datetime = pd.Timestamp(end_datetime)
+    if not data_types:
+        raise ValueError("At least one `data_type` must be given")
 
-    if initial_datetime > end_datetime:
-        raise ValueError("`initial_datetime` must come before `end_datetime`")
+    # The same timestamps are requested for every type of data
+    range_dates = _date_range(initial_datetime, end_datetime, frequency, data_types[0])
 
-    if not isinstance(frequency, pd.Timedelta):
-        frequency = pd.Timedelta(frequency)
+    for dt in data_types[1:]:
+        if dt not in get_args(MRMSDataType.__value__):
+            raise KeyError(f"`data_type` must be one of: {get_args(MRMSDataType.__value__)}")
 
-    if frequency < pd.Timedelta(minutes=2):
-        raise ValueError("`frequency` should not be less than 2 minutes")
+    if verbose:
+        print(f"-> {len(range_dates) * len(data_types)} files requested...")
+
+    plans, inverses = zip(*(_plan(range_dates, dt) for dt in data_types))
+    paths = [np.full(len(plan), None, dtype=object) for plan in plans]
+
+    for k, i, path in _iter_files(list(plans), verbose, max_workers, downloader, use_listing):
+        paths[k][i] = path
+
+    if isinstance(data_type, str):
+        return [path for path in paths[0][inverses[0]].tolist() if path is not None]
+
+    return pd.DataFrame(
+        {dt: p[inverse] for dt, p, inverse in zip(data_types, paths, inverses)},
+        index=range_dates.rename("time"),
+    )
+
+
+def _file_interval(data_type: MRMSDataType) -> pd.Timedelta:
+    """Time between consecutive files of a type of data."""
+    match data_type:
+        case "precip_rate" | "precip_flag":
+            return pd.Timedelta(minutes=2)
+
+        case _:
+            return pd.Timedelta(hours=1)
+
+
+def _utcnow() -> pd.Timestamp:
+    return pd.Timestamp(datetime.now(timezone.utc).replace(tzinfo=None))
+
+
+def follow(
+    sink: Callable[[Path], Any] | queue.Queue,
+    data_type: MRMSDataType = "precip_rate",
+    start: str | DatetimeLike | None = None,
+    poll_interval: float = 10.0,
+    gap_timeout: str | TimedeltaLike = pd.Timedelta(minutes=15),
+    lookback: str | TimedeltaLike = pd.Timedelta(hours=1),
+    stop: threading.Event | None = None,
+    max_files: int | None = None,
+    max_retries: int = 10,
+    downloader: Downloader | None = None,
+    verbose: bool = False,
+) -> pd.Timestamp | None:
+    """
+    Follow the archive, downloading new files as soon as they are published and handing
+    them to `sink`. This blocks until `stop` is set, `max_files` are ingested or the
+    process is interrupted.
+
+    Only the next expected file is requested on each poll, so following the archive costs
+    one request every `poll_interval` seconds. If a file is still missing after
+    `gap_timeout`, the daily listing of the archive is checked to skip over the gap, or
+    the file is skipped if the listing has no later files yet. Files that keep failing
+    for other reasons, e.g. HTTP 403 or a corrupt file, are skipped with a warning after
+    `max_retries` attempts.
+
+    The timestamp of the last file ingested is stored in the catalog of the prefered path,
+    so a new call carries on where the previous one stopped.
+
+    Parameters
+    ----------
+    sink : Callable[[Path], Any] | queue.Queue
+        Function called with the path of each new file, or queue the paths are put into.
+    data_type : MRMSDataType = "precip_rate"
+        Type of data to follow.
+    start : str | DatetimeLike | None = None
+        Timestamp (UTC) of the first file to ingest. If None, carry on after the last file
+        ingested by a previous call, or start `lookback` before now.
+    poll_interval : float = 10.0
+        Seconds between requests while waiting for the next file.
+    gap_timeout : str | TimedeltaLike = pd.Timedelta(minutes=15)
+        How long after its timestamp a missing file is considered a gap in the archive.
+    lookback : str | TimedeltaLike = pd.Timedelta(hours=1)
+        How far back to start when there is no `start` nor previous call.
+    stop : threading.Event | None = None
+        Event to stop following the archive from another thread.
+    max_files : int | None = None
+        Stop after ingesting this many files. If None, follow the archive indefinitely.
+    max_retries : int = 10
+        Number of times a file that fails for reasons other than not being in the archive
+        is requested again before skipping it.
+    downloader : Downloader | None = None
+        Download engine to use. If None, a new one is created and closed on return.
+    verbose : bool = False
+        Whether to print the progress.
+
+    Returns
+    -------
+    pd.Timestamp | None
+        Timestamp of the last file ingested.
 
+    Examples
+    --------
+    >>> files = queue.Queue()
+    >>> stop = threading.Event()
+    >>> threading.Thread(target=follow, args=(files,), kwargs=dict(stop=stop), daemon=True).start()
+    >>> while f := files.get():
+    ...     time, values = ts.point.query_single_file(f, geodata)
+    """
     if data_type not in get_args(MRMSDataType.__value__):
         raise KeyError(f"`data_type` must be one of: {get_args(MRMSDataType.__value__)}")
 
-    # Generate range of files
-    initial_datetime = initial_datetime.replace(second=0, microsecond=0)
-    end_datetime = end_datetime.replace(second=0, microsecond=0)
-    range_dates = pd.date_range(initial_datetime, end_datetime, freq=frequency)
+    deliver = sink.put if isinstance(sink, queue.Queue) else sink
+    wait = stop.wait if stop is not None else sleep
+    product = DATA_NAMES[data_type]
+    interval = _file_interval(data_type)
+    catalog = path_config.catalog(path_config.prefered_path)
 
-    if verbose:
-        print(f"-> {len(range_dates)} files requested...")
+    if start is not None:
+        next_t = _snap_timestamp(pd.Timestamp(start), data_type)
+    elif (last := catalog.cursor(_BASE_URL, product)) is not None:
+        next_t = last + interval
+    else:
+        next_t = (_utcnow() - pd.Timedelta(lookback)).floor(interval)
 
-    gfiles = [_GribFile(t, data_type) for t in range_dates]
+    dl = downloader or Downloader(max_workers=1)
+    last, ingested, failures = None, 0, 0
 
-    for dest_folder in set([gf.subdir for gf in gfiles]):  # TODO: Calculating this set is suboptimal
-        dest_folder.mkdir(exist_ok=True)
+    try:
+        while not (stop is not None and stop.is_set()) and (max_files is None or ingested < max_files):
+            if (ahead := (next_t - _utcnow()).total_seconds()) > 0:
+                wait(min(ahead, poll_interval))
+                continue
 
-        dest_folder.glob("*.idx")
-        for idx in dest_folder.glob("*.idx"):
-            idx.unlink()
+            gfile = _GribFile(next_t, data_type)
 
-    # Select which files need to be downloaded
-    mask = [not gf.exists() for gf in gfiles]
-    gfiles_missing = list(compress(gfiles, mask))
+            try:
+                if not gfile.exists():
+                    _request_file(gfile, dl.session, dl._throttle)
 
-    if gfiles_missing:
-        if verbose:
-            print(f"-> {len(gfiles_missing)} *new* files will be downloaded...")
+            except _DownloadError as e:
+                if e.missing and _utcnow() - next_t > pd.Timedelta(gap_timeout):
+                    # Files missing at the end of a day are not followed by any in its listing
+                    if (after_gap := _skip_gap(next_t, data_type, dl.session, verbose)) == next_t:
+                        after_gap = next_t + interval
+
+                        if verbose:
+                            print(f"-> {next_t} is not in the archive. Skipping to {after_gap}.")
+
+                    next_t, failures = after_gap, 0
+                    continue
+
+                if not e.missing and (failures := failures + 1) > max_retries:
+                    warnings.warn(f"Skipping {gfile.filename} after {failures} attempts: {e.reason}.", stacklevel=2)
+                    next_t, failures = next_t + interval, 0
+                    continue
+
+                if verbose:
+                    print(f"Waiting for {gfile.filename}: {e.reason}.")
+
+                wait(max(poll_interval, e.retry_after or 0))
+                continue
 
-        with Pool() as pool:
-            pool.starmap(_single_file, [(f, verbose) for f in gfiles_missing])
+            path_config.register(gfile.path)
+            path_config.enforce_quota(gfile.root, keep=[gfile.path])
+            catalog.set_cursor(_BASE_URL, product, next_t)
 
+            if verbose:
+                print(f"Ingested {gfile.path}")
+
+            deliver(gfile.path)
+            last, ingested, failures = next_t, ingested + 1, 0
+            next_t += interval
+
+    finally:
+        if downloader is None:
+            dl.close()
+
+    return last
+
+
+def _skip_gap(t: pd.Timestamp, data_type: MRMSDataType, session: requests.Session, verbose: bool) -> pd.Timestamp:
+    """
+    Find the first file after a missing one using the listing of its day. If the listing
+    cannot be retrieved or has no later files yet, `t` is returned to keep waiting,
+    unless the day is over.
+    """
+    day = t.normalize()
+    listed = _fetch_listing(DATA_NAMES[data_type], day, session)
+
+    if listed is None:
+        return t
+
+    if later := sorted(s for s in listed if s > t):
+        next_t = later[0]
+    elif _utcnow() - day > pd.Timedelta(days=1, hours=1):
+        next_t = day + pd.Timedelta(days=1)
     else:
-        if verbose:
-            print("Nothing new to download :D")
+        return t
+
+    if verbose:
+        print(f"-> {t} is not in the archive. Skipping to {next_t}.")
 
-    return [gf._path for gf in gfiles if gf.exists()]
+    return next_t
@@ -0,0 +1,691 @@
+import gzip
+import struct
+import zlib
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from io import BytesIO
+from math import ceil, floor
+from os import PathLike
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from numpy.typing import ArrayLike
+
+from . import cache
+from .typing_utils import MRMSDataType
+from .utils import Extent, unzip_if_gz
+
+__all__ = [
+    "GridDefinition",
+    "GribField",
+    "Quantization",
+    "QUANTIZATION",
+    "decode",
+    "encode",
+    "read",
+    "read_grid",
+    "open_dataset",
+]
+
+
+@dataclass(frozen=True)
+class GridDefinition:
+    """
+    Regular latitude/longitude grid of an MRMS field. Longitudes are positive, as in the
+    GRIB files.
+
+    Parameters
+    ----------
+    nlat, nlon : int
+        Number of rows and columns of the grid.
+    lat0, lon0 : float
+        Coordinates of the first grid point (top-left corner for MRMS).
+    dlat, dlon : float
+        Grid spacing. `dlat` is negative when rows go from north to south.
+    """
+
+    nlat: int
+    nlon: int
+    lat0: float
+    lon0: float
+    dlat: float
+    dlon: float
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.nlat, self.nlon
+
+    @cached_property
+    def latitudes(self) -> np.ndarray:
+        return np.round(self.lat0 + self.dlat * np.arange(self.nlat), 6)
+
+    @cached_property
+    def longitudes(self) -> np.ndarray:
+        return np.round(self.lon0 + self.dlon * np.arange(self.nlon), 6)
+
+    @staticmethod
+    def _span(lo: float, hi: float, start: float, step: float, n: int) -> slice:
+        """Indices `i` of the axis `start + step * i` with `lo <= start + step * i <= hi`."""
+        if step == 0:
+            return slice(0, n) if lo <= start <= hi else slice(0, 0)
+
+        # Tolerance for the rounding of the coordinates to 6 decimals
+        a, b = sorted(((lo - start) / step, (hi - start) / step))
+        first, last = max(ceil(a - 1e-4), 0), min(floor(b + 1e-4), n - 1)
+        return slice(first, max(first, last + 1))
+
+    def window(self, extent: Extent) -> tuple[slice, slice]:
+        """
+        Rows and columns of the grid covering an extent. These are the same cells
+        `ds.loc[extent.as_xr_slice()]` selects, computed from the grid definition alone.
+
+        Raises
+        ------
+        ValueError
+            If the extent does not overlap with the grid.
+        """
+        window = extent.as_xr_slice()
+        lats, lons = window["latitude"], window["longitude"]
+
+        rows = self._span(lats.stop, lats.start, self.lat0, self.dlat, self.nlat)
+        cols = self._span(lons.start, lons.stop, self.lon0, self.dlon, self.nlon)
+
+        if rows.start == rows.stop or cols.start == cols.stop:
+            raise ValueError(f"{extent} does not overlap with the field.")
+
+        return rows, cols
+
+    def index(self, lon: ArrayLike, lat: ArrayLike) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Row and column of the grid point nearest to each location.
+
+        Parameters
+        ----------
+        lon, lat : ArrayLike
+            Coordinates of the locations. Negative longitudes (EPSG:4326) are converted to
+            the positive longitudes of the grid.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Rows and columns.
+
+        Raises
+        ------
+        ValueError
+            If any location is outside of the grid.
+        """
+        lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+        lon = np.where(lon < 0, lon + 360, lon)
+
+        rows = np.rint((lat - self.lat0) / self.dlat).astype(int) if self.dlat else np.zeros(lat.shape, int)
+        cols = np.rint((lon - self.lon0) / self.dlon).astype(int) if self.dlon else np.zeros(lon.shape, int)
+
+        if ((rows < 0) | (rows >= self.nlat) | (cols < 0) | (cols >= self.nlon)).any():
+            raise ValueError("Some locations are outside of the grid.")
+
+        return rows, cols
+
+    def subgrid(self, rows: slice, cols: slice) -> "GridDefinition":
+        """Grid of a window of rows and columns, as given by `window`."""
+        return GridDefinition(
+            nlat=rows.stop - rows.start,
+            nlon=cols.stop - cols.start,
+            lat0=round(self.lat0 + self.dlat * rows.start, 6),
+            lon0=round(self.lon0 + self.dlon * cols.start, 6),
+            dlat=self.dlat,
+            dlon=self.dlon,
+        )
+
+
+@dataclass
+class GribField:
+    """
+    A decoded MRMS field.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        2D array of values with shape `grid.shape`. No data is kept as stored in the file
+        (-3 for precipitation data).
+    time : np.datetime64
+        Timestamp of the field.
+    grid : GridDefinition
+        Grid of the field.
+    """
+
+    values: np.ndarray
+    time: np.datetime64
+    grid: GridDefinition
+
+    def clip(self, extent: Extent) -> "GribField":
+        """
+        Clip the field to an extent. The same cells as `ds.loc[extent.as_xr_slice()]`
+        are kept.
+
+        Parameters
+        ----------
+        extent : Extent
+            Extent to clip the field to.
+
+        Returns
+        -------
+        GribField
+            Field covering the extent.
+        """
+        rows, cols = self.grid.window(extent)
+        return GribField(self.values[rows, cols], self.time, self.grid.subgrid(rows, cols))
+
+    def to_dataset(self, variable: str = "unknown") -> xr.Dataset:
+        """
+        Wrap the field in an xarray Dataset laid out as `cfgrib` would open the file.
+
+        Parameters
+        ----------
+        variable : str = "unknown"
+            Name of the data variable. `cfgrib` names MRMS variables "unknown".
+        """
+        return xr.Dataset(
+            {variable: (("latitude", "longitude"), self.values)},
+            coords={
+                "time": self.time,
+                "latitude": self.grid.latitudes,
+                "longitude": self.grid.longitudes,
+            },
+        )
+
+
+@dataclass(frozen=True)
+class Quantization:
+    """
+    Integer representation of the values of a data type, `value = offset + scale * stored`.
+    No data (-3 in the files) is stored as `nodata`.
+
+    Parameters
+    ----------
+    dtype : str
+        Unsigned integer type of the stored values, e.g., "uint16".
+    scale, offset : float
+        Resolution and lowest value that can be represented.
+    nodata : int
+        Stored value for no data. It is the largest value of `dtype`, values above the
+        representable range are clipped below it.
+    """
+
+    dtype: str
+    scale: float
+    offset: float
+    nodata: int
+
+    def encode(self, values: np.ndarray) -> np.ndarray:
+        """Quantize values as decoded from a file. Values below `offset` other than -3 are clipped."""
+        stored = np.rint((np.asarray(values, dtype=np.float64) - self.offset) / self.scale)
+        stored = np.clip(stored, 0, self.nodata - 1)
+        return np.where((values == -3) | np.isnan(values), self.nodata, stored).astype(self.dtype)
+
+    def decode(self, stored: np.ndarray) -> np.ndarray:
+        """Single precision values, with -3 for no data as in `GribField.values`."""
+        values = (self.offset + self.scale * np.asarray(stored, dtype=np.float64)).astype(np.float32)
+        values[stored == self.nodata] = -3
+        return values
+
+    @property
+    def cf_encoding(self) -> dict:
+        """Encoding for xarray, so the values are scaled and masked following the CF conventions."""
+        return {"dtype": self.dtype, "scale_factor": self.scale, "add_offset": self.offset, "_FillValue": self.nodata}
+
+
+# Precipitation is kept to 0.1 mm (or mm/h) and flags are small categories (see `utils.PRECIP_FLAGS`)
+QUANTIZATION: dict[MRMSDataType, Quantization] = {
+    "precip_rate": Quantization("uint16", 0.1, 0.0, 65535),
+    "precip_flag": Quantization("uint8", 1.0, 0.0, 255),
+    "precip_accum_1h": Quantization("uint16", 0.1, 0.0, 65535),
+    "precip_accum_24h": Quantization("uint16", 0.1, 0.0, 65535),
+    "precip_accum_72h": Quantization("uint16", 0.1, 0.0, 65535),
+}
+
+
+class _UnsupportedMessage(ValueError):
+    """A GRIB2 message that cannot be decoded into a `GribField`."""
+
+
+def _signed(raw: int, nbytes: int) -> int:
+    """GRIB2 signed integers are stored as sign and magnitude, not two's complement."""
+    sign_bit = 1 << (8 * nbytes - 1)
+    return -(raw & (sign_bit - 1)) if raw & sign_bit else raw
+
+
+def _uint(buf: memoryview, start: int, nbytes: int) -> int:
+    return int.from_bytes(buf[start : start + nbytes], "big")
+
+
+def _int(buf: memoryview, start: int, nbytes: int) -> int:
+    return _signed(_uint(buf, start, nbytes), nbytes)
+
+
+def _sections(message: bytes) -> dict[int, memoryview]:
+    """Split a GRIB2 message into its sections, keyed by section number."""
+    buf = memoryview(message)
+
+    if bytes(buf[:4]) != b"GRIB" or buf[7] != 2:
+        raise _UnsupportedMessage("Not a GRIB2 message")
+
+    if _uint(buf, 8, 8) != len(buf):
+        raise _UnsupportedMessage("Files with several messages are not supported")
+
+    sections: dict[int, memoryview] = {}
+    offset = 16
+
+    while bytes(buf[offset : offset + 4]) != b"7777":
+        length, number = _uint(buf, offset, 4), buf[offset + 4]
+
+        if number in sections or not length:
+            raise _UnsupportedMessage("Messages with several fields are not supported")
+
+        sections[number] = buf[offset : offset + length]
+        offset += length
+
+    return sections
+
+
+def _truncate_png(png: bytes, height: int) -> bytes:
+    """
+    Make a PNG image report fewer rows, so decoders stop inflating the data after them.
+    Rows are compressed as a single stream, so earlier rows cannot be skipped.
+    """
+    if png[12:16] != b"IHDR":
+        raise _UnsupportedMessage("Unexpected PNG layout")
+
+    ihdr = b"IHDR" + png[16:20] + height.to_bytes(4, "big") + png[24:29]
+    return png[:12] + ihdr + zlib.crc32(ihdr).to_bytes(4, "big") + png[33:]
+
+
+def _unpack_png(data: memoryview, shape: tuple[int, int], nbits: int, rows: slice, cols: slice) -> np.ndarray:
+    from PIL import Image
+
+    png = bytes(data)
+
+    if rows.stop < shape[0]:
+        png = _truncate_png(png, rows.stop)
+
+    with Image.open(BytesIO(png)) as img:
+        if img.size != (shape[1], rows.stop):
+            raise _UnsupportedMessage("Unexpected size of PNG packed data")
+
+        img.load()
+        packed = np.asarray(img)[rows, cols]
+
+    if nbits in (24, 32):
+        # Bytes of each value are stored as RGB(A) channels, most significant first
+        packed = packed.astype(np.uint32)
+        packed = sum(packed[..., i] << (8 * (packed.shape[-1] - 1 - i)) for i in range(packed.shape[-1]))
+
+    return packed
+
+
+def _unpack_simple(data: memoryview, shape: tuple[int, int], nbits: int, rows: slice, cols: slice) -> np.ndarray:
+    if nbits % 8:
+        raise _UnsupportedMessage(f"Simple packing with {nbits} bits per value is not supported")
+
+    # Values are byte-aligned, so only the rows of the window are read
+    nbytes = nbits // 8
+    row_size = shape[1] * nbytes
+    packed = np.frombuffer(data, dtype=np.uint8, count=(rows.stop - rows.start) * row_size, offset=rows.start * row_size)
+    packed = packed.reshape(-1, shape[1], nbytes)[:, cols]
+
+    return sum(packed[..., i].astype(np.uint32) << (8 * (nbytes - 1 - i)) for i in range(nbytes))
+
+
+@lru_cache(maxsize=16)
+def _parse_grid(s3: bytes) -> GridDefinition:
+    """
+    Grid of a section 3 of a GRIB2 message. Grids are cached, so fields on the same grid
+    share a single `GridDefinition` and its coordinates.
+    """
+    if _uint(s3, 12, 2) != 0:
+        raise _UnsupportedMessage("Only regular latitude/longitude grids are supported")
+
+    nlon, nlat = _uint(s3, 30, 4), _uint(s3, 34, 4)
+    basic_angle, subdivisions = _uint(s3, 38, 4), _uint(s3, 42, 4)
+    scanning_mode = s3[71]
+
+    if basic_angle not in (0, 0xFFFFFFFF) or subdivisions not in (0, 0xFFFFFFFF) or scanning_mode != 0:
+        raise _UnsupportedMessage("Unsupported grid orientation or units")
+
+    lat0, lon0 = _int(s3, 46, 4) / 1e6, _uint(s3, 50, 4) / 1e6
+    lat1, lon1 = _int(s3, 55, 4) / 1e6, _uint(s3, 59, 4) / 1e6
+
+    return GridDefinition(
+        nlat=nlat,
+        nlon=nlon,
+        lat0=lat0,
+        lon0=lon0,
+        dlat=(lat1 - lat0) / (nlat - 1) if nlat > 1 else 0.0,
+        dlon=(lon1 - lon0) / (nlon - 1) if nlon > 1 else 0.0,
+    )
+
+
+def _native_decode(message: bytes, extent: Extent | None = None) -> GribField:
+    """
+    Decode the GRIB2 messages MRMS publishes without eccodes: a single field on a regular
+    latitude/longitude grid (template 3.0), with PNG (template 5.41) or simple (template
+    5.0) packing and no bitmap. If an extent is given, only the rows up to the bottom of
+    the extent are unpacked, and only the values within it are unscaled.
+
+    Raises
+    ------
+    _UnsupportedMessage
+        If the message uses any other template or option.
+    """
+    sections = _sections(message)
+
+    if not all(n in sections for n in (1, 3, 5, 6, 7)):
+        raise _UnsupportedMessage("Incomplete GRIB2 message")
+
+    # Section 1: reference time
+    s1 = sections[1]
+    year, (month, day, hour, minute, second) = _uint(s1, 12, 2), s1[14:19]
+    stamp = np.datetime64(f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}", "ns")
+
+    # Section 3: grid definition
+    grid = _parse_grid(bytes(sections[3]))
+    nlat, nlon = grid.shape
+
+    # Section 5: data representation
+    s5 = sections[5]
+    npoints, template = _uint(s5, 5, 4), _uint(s5, 9, 2)
+    reference = struct.unpack(">f", s5[11:15])[0]
+    binary_scale, decimal_scale = _int(s5, 15, 2), _int(s5, 17, 2)
+    nbits = s5[19]
+
+    if npoints != nlat * nlon:
+        raise _UnsupportedMessage("Number of values does not match the grid")
+
+    # Section 6: bitmap
+    if sections[6][5] != 255:
+        raise _UnsupportedMessage("Messages with a bitmap are not supported")
+
+    # Section 7: data
+    data = sections[7][5:]
+
+    rows, cols = grid.window(extent) if extent is not None else (slice(0, nlat), slice(0, nlon))
+    window = (rows.stop - rows.start, cols.stop - cols.start)
+
+    match template:
+        case 0 | 41 if nbits == 0:
+            packed = np.zeros(window, dtype=np.uint8)
+        case 41:
+            packed = _unpack_png(data, grid.shape, nbits, rows, cols)
+        case 0:
+            packed = _unpack_simple(data, grid.shape, nbits, rows, cols)
+        case _:
+            raise _UnsupportedMessage(f"Data representation template 5.{template} is not supported")
+
+    def unscale(x: np.ndarray) -> np.ndarray:
+        return ((reference + x * 2.0**binary_scale) * 10.0**-decimal_scale).astype(np.float32)
+
+    if packed.dtype.itemsize <= 2:
+        # Values of up to 16 bits are unscaled through a lookup table
+        values = unscale(np.arange(1 << (8 * packed.dtype.itemsize)))[packed]
+    else:
+        values = unscale(packed)
+
+    return GribField(values, stamp, grid.subgrid(rows, cols) if extent is not None else grid)
+
+
+def _eccodes_decode(message: bytes) -> GribField:
+    """
+    Decode a GRIB2 message using eccodes.
+
+    Raises
+    ------
+    _UnsupportedMessage
+        If the message is not a single field on a regular latitude/longitude grid, or
+        eccodes cannot decode it.
+    """
+    import eccodes
+
+    try:
+        handle = eccodes.codes_new_from_message(message)
+    except eccodes.CodesInternalError as e:
+        raise _UnsupportedMessage(f"eccodes cannot decode the message: {e}") from e
+
+    try:
+        get = eccodes.codes_get
+
+        if get(handle, "totalLength") != len(message):
+            raise _UnsupportedMessage("Files with several messages are not supported")
+
+        if get(handle, "gridType") != "regular_ll":
+            raise _UnsupportedMessage("Only regular latitude/longitude grids are supported")
+
+        nlon, nlat = get(handle, "Ni"), get(handle, "Nj")
+        lat0, lat1 = get(handle, "latitudeOfFirstGridPointInDegrees"), get(handle, "latitudeOfLastGridPointInDegrees")
+        lon0, lon1 = get(handle, "longitudeOfFirstGridPointInDegrees"), get(handle, "longitudeOfLastGridPointInDegrees")
+
+        grid = GridDefinition(
+            nlat=nlat,
+            nlon=nlon,
+            lat0=lat0,
+            lon0=lon0,
+            dlat=(lat1 - lat0) / (nlat - 1) if nlat > 1 else 0.0,
+            dlon=(lon1 - lon0) / (nlon - 1) if nlon > 1 else 0.0,
+        )
+
+        date, time = get(handle, "dataDate"), get(handle, "dataTime")
+        stamp = np.datetime64(pd.to_datetime(f"{date}{time:04d}", format=r"%Y%m%d%H%M"), "ns")
+
+        # Single precision, as cfgrib does. Points flagged as missing by the bitmap are NaN
+        values = eccodes.codes_get_values(handle).reshape(grid.shape)
+
+        if get(handle, "bitmapPresent"):
+            values[values == get(handle, "missingValue")] = np.nan
+
+        values = values.astype(np.float32)
+
+    except eccodes.CodesInternalError as e:
+        raise _UnsupportedMessage(f"eccodes cannot decode the message: {e}") from e
+
+    finally:
+        eccodes.codes_release(handle)
+
+    return GribField(values, stamp, grid)
+
+
+def decode(
+    message: bytes,
+    engine: Literal["auto", "native", "eccodes"] = "auto",
+    extent: Extent | None = None,
+) -> GribField:
+    """
+    Decode a GRIB2 message held in memory.
+
+    The templates MRMS uses (regular latitude/longitude grid with PNG or simple packing)
+    are decoded natively with NumPy. Other messages are decoded using eccodes.
+
+    Parameters
+    ----------
+    message : bytes
+        Uncompressed GRIB2 message.
+    engine : Literal["auto", "native", "eccodes"] = "auto"
+        Decoder to use. "auto" tries the native decoder first and falls back to eccodes.
+    extent : Extent | None = None
+        Only decode the values within this extent. The result is the same as decoding the
+        whole field and calling `GribField.clip`, but the native decoder skips the rows
+        below the extent and only unscales the values within it.
+
+    Returns
+    -------
+    GribField
+        Values, timestamp and grid of the message.
+
+    Raises
+    ------
+    ValueError
+        If the message cannot be decoded, e.g. it holds several fields or is corrupt.
+        `open_dataset` falls back to `cfgrib` for these messages.
+    """
+    if engine not in ("auto", "native", "eccodes"):
+        raise ValueError("`engine` must be one of 'auto', 'native' or 'eccodes'")
+
+    if engine != "eccodes":
+        try:
+            return _native_decode(message, extent)
+
+        except (_UnsupportedMessage, ImportError):
+            if engine == "native":
+                raise
+
+        # Packed data the native decoder cannot read, e.g. a truncated PNG
+        except (OSError, SyntaxError, zlib.error, struct.error) as e:
+            if engine == "native":
+                raise _UnsupportedMessage(f"Cannot unpack the data: {e}") from e
+
+    field = _eccodes_decode(message)
+    return field.clip(extent) if extent is not None else field
+
+
+def encode(field: GribField, template: bytes) -> bytes:
+    """
+    Encode a field as a GRIB2 message, copying all metadata but the grid and values from
+    another message. This is used to store regional clips of MRMS files.
+
+    Parameters
+    ----------
+    field : GribField
+        Field to encode.
+    template : bytes
+        GRIB2 message to take the metadata from, e.g. the original CONUS message.
+
+    Returns
+    -------
+    bytes
+        GRIB2 message.
+    """
+    import eccodes
+
+    handle = eccodes.codes_new_from_message(template)
+
+    try:
+        grid = field.grid
+        eccodes.codes_set_long(handle, "Ni", grid.nlon)
+        eccodes.codes_set_long(handle, "Nj", grid.nlat)
+        eccodes.codes_set(handle, "latitudeOfFirstGridPointInDegrees", float(grid.latitudes[0]))
+        eccodes.codes_set(handle, "longitudeOfFirstGridPointInDegrees", float(grid.longitudes[0]))
+        eccodes.codes_set(handle, "latitudeOfLastGridPointInDegrees", float(grid.latitudes[-1]))
+        eccodes.codes_set(handle, "longitudeOfLastGridPointInDegrees", float(grid.longitudes[-1]))
+        eccodes.codes_set_values(handle, np.ascontiguousarray(field.values, dtype=float).ravel())
+        return eccodes.codes_get_message(handle)
+
+    finally:
+        eccodes.codes_release(handle)
+
+
+def read(f: PathLike, extent: Extent | None = None) -> GribField:
+    """
+    Read a `.grib2` or `.grib2.gz` file. Gzipped files are decompressed in memory, or
+    taken from the decompressed-file cache if it is enabled (see `mrms.cache`).
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to the file.
+    extent : Extent | None = None
+        Only decode the values within this extent, see `decode`.
+
+    Returns
+    -------
+    GribField
+        Values, timestamp and grid of the file.
+    """
+    f = Path(f)
+
+    if f.suffix == ".gz":
+        if (cached := cache.decompressed(f)) is not None:
+            return decode(cached.read_bytes(), extent=extent)
+
+        with gzip.open(f, "rb") as fin:
+            return decode(fin.read(), extent=extent)
+
+    if f.suffix == ".grib2":
+        return decode(f.read_bytes(), extent=extent)
+
+    raise ValueError("File is not `.gz` nor `.grib2`")
+
+
+def read_grid(f: PathLike) -> GridDefinition:
+    """
+    Read the grid of a `.grib2` or `.grib2.gz` file. Only the header of the file is read.
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to the file.
+
+    Returns
+    -------
+    GridDefinition
+        Grid of the file.
+    """
+    f = Path(f)
+
+    if f.suffix not in (".gz", ".grib2"):
+        raise ValueError("File is not `.gz` nor `.grib2`")
+
+    with (gzip.open if f.suffix == ".gz" else open)(f, "rb") as fin:
+        head = fin.read(16)
+
+        if head[:4] == b"GRIB" and head[7:8] == b"\x02":
+            # Sections are read one at a time until the grid definition
+            while len(header := fin.read(5)) == 5 and header[:4] != b"7777":
+                section = header + fin.read(int.from_bytes(header[:4], "big") - 5)
+
+                if header[4] == 3:
+                    try:
+                        return _parse_grid(section)
+                    except _UnsupportedMessage:
+                        break
+
+    return read(f).grid
+
+
+def open_dataset(f: PathLike, variable: str = "unknown", extent: Extent | None = None) -> xr.Dataset:
+    """
+    Open a `.grib2` or `.grib2.gz` file as an xarray Dataset, laid out as `cfgrib` would
+    open it. Gzipped files are decompressed in memory and decoded from the buffer, so no
+    temporary file is written nor indexed. Files that cannot be decoded into a single
+    field on a regular grid, e.g. files with several messages or data that neither the
+    native decoder nor eccodes can unpack, are opened with `cfgrib`. Errors raised by
+    `cfgrib` for these files are not caught.
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to the file.
+    variable : str = "unknown"
+        Name of the data variable. `cfgrib` names MRMS variables "unknown".
+    extent : Extent | None = None
+        Only decode the values within this extent. The dataset then holds the same
+        cells as `ds.loc[extent.as_xr_slice()]`.
+
+    Returns
+    -------
+    xr.Dataset
+        Dataset with the values of the file.
+    """
+    try:
+        return read(f, extent).to_dataset(variable)
+
+    except _UnsupportedMessage:
+        # Temporary copies of gzipped files are never opened again, so they are not indexed
+        indexed = Path(f).suffix == ".grib2" or cache.is_enabled()
+        ds = unzip_if_gz(_cfgrib_load)(f, indexed)
+        return ds.loc[extent.as_xr_slice()] if extent is not None else ds
+
+
+def _cfgrib_load(f: Path, indexed: bool) -> xr.Dataset:
+    indexpath = cache.index_path(f) if indexed else ""
+    return xr.load_dataset(f, engine="cfgrib", decode_timedelta=False, backend_kwargs={"indexpath": indexpath})
@@ -0,0 +1,257 @@
+import os
+from dataclasses import asdict, dataclass
+from functools import partial
+from multiprocessing import Pool
+from os import PathLike
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+
+from . import grib
+from .cube import _GRID_ATTRS, _data_type, _sorted_by_time
+from .typing_utils import MRMSDataType
+from .utils import Extent
+
+__all__ = ["PixelStore", "build", "open_store"]
+
+_VALUES: str = "values.bin"
+_INDEX: str = "index.npz"
+
+
+@dataclass(frozen=True)
+class PixelStore:
+    """
+    Series of a set of grid cells, stored pixel-major in a flat binary file: the series
+    of each pixel is contiguous, so reading it is a single slice of a memory map.
+
+    Parameters
+    ----------
+    path : Path
+        Folder of the store.
+    grid : grib.GridDefinition
+        Grid of the files the store was built from.
+    rows, cols : np.ndarray
+        Row and column of each pixel in `grid`, sorted.
+    times : np.ndarray
+        Timestamps of the series, sorted.
+    quantization : grib.Quantization | None = None
+        Integer representation of the values, or None if they are stored as floats.
+    data_type : MRMSDataType | None = None
+        Type of data of the files the store was built from, or None if it could not be
+        told from their names.
+    """
+
+    path: Path
+    grid: grib.GridDefinition
+    rows: np.ndarray
+    cols: np.ndarray
+    times: np.ndarray
+    quantization: grib.Quantization | None = None
+    data_type: MRMSDataType | None = None
+
+    @property
+    def values(self) -> np.memmap:
+        """Read-only memory map of shape (pixels, times), with the values as stored."""
+        dtype = self.quantization.dtype if self.quantization is not None else np.float32
+        return np.memmap(self.path / _VALUES, dtype=dtype, mode="r", shape=(len(self.rows), len(self.times)))
+
+    def decode(self, stored: np.ndarray) -> np.ndarray:
+        """Values read from `values` as in `GribField.values`, with -3 for no data."""
+        return self.quantization.decode(stored) if self.quantization is not None else np.array(stored)
+
+    def locate(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Position of each cell among the pixels of the store, -1 for cells not in the store."""
+        keys = self.rows.astype(np.int64) * self.grid.nlon + self.cols
+        wanted = np.asarray(rows, dtype=np.int64) * self.grid.nlon + np.asarray(cols)
+
+        i = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+        return np.where(keys[i] == wanted, i, -1)
+
+    def series(self, lon: float, lat: float) -> pd.Series:
+        """
+        Series of the pixel nearest to a point.
+
+        Parameters
+        ----------
+        lon, lat : float
+            Coordinates of the point in EPSG:4326.
+
+        Returns
+        -------
+        pd.Series
+            Values of the pixel indexed by timestamp. No data (-3 for precipitation) is NaN.
+
+        Raises
+        ------
+        KeyError
+            If the pixel is not in the store.
+        """
+        row, col = self.grid.index(lon, lat)
+
+        if (i := int(self.locate([row], [col])[0])) < 0:
+            raise KeyError(f"The pixel at ({lon}, {lat}) is not in {self.path}.")
+
+        values = self.decode(self.values[i])
+        values[values == -3] = np.nan
+
+        return pd.Series(values, index=pd.to_datetime(self.times, utc=True), name="value")
+
+
+def open_store(path: PathLike) -> PixelStore:
+    """
+    Open a pixel store written by `build`.
+
+    Parameters
+    ----------
+    path : PathLike
+        Folder of the store.
+
+    Returns
+    -------
+    PixelStore
+        The store. Values are only read from disk as they are accessed.
+    """
+    path = Path(path)
+
+    with np.load(path / _INDEX) as index:
+        grid = grib.GridDefinition(**{k: index[k].item() for k in _GRID_ATTRS})
+        quantization = None
+
+        if "dtype" in index:
+            quantization = grib.Quantization(
+                str(index["dtype"]), index["scale"].item(), index["offset"].item(), index["nodata"].item()
+            )
+
+        data_type = str(index["data_type"]) if "data_type" in index else None
+        return PixelStore(path, grid, index["rows"], index["cols"], index["times"], quantization, data_type)
+
+
+def _pixels(grid: grib.GridDefinition, geodata: gpd.GeoDataFrame | None, extent: Extent | None) -> np.ndarray:
+    """Sorted keys `row * nlon + col` of the cells nearest to the points and within the extent."""
+    keys = []
+
+    if geodata is not None:
+        geodata = geodata.to_crs("4326")
+        rows, cols = grid.index(geodata.geometry.x.values, geodata.geometry.y.values)
+        keys.append(np.asarray(rows, dtype=np.int64) * grid.nlon + cols)
+
+    if extent is not None:
+        rows, cols = grid.window(extent)
+        rows, cols = np.meshgrid(np.arange(rows.start, rows.stop), np.arange(cols.start, cols.stop), indexing="ij")
+        keys.append(rows.ravel().astype(np.int64) * grid.nlon + cols.ravel())
+
+    if not keys:
+        raise ValueError("Provide the points (`geodata`) or the `extent` to store.")
+
+    return np.unique(np.concatenate(keys))
+
+
+def build(
+    files: Sequence[PathLike],
+    path: PathLike,
+    geodata: gpd.GeoDataFrame | None = None,
+    extent: Extent | None = None,
+    block: int = 720,
+    quantize: bool = True,
+    verbose: bool = False,
+) -> PixelStore:
+    """
+    Build a pixel store with the series of the cells nearest to a set of points, or of
+    all the cells within an extent.
+
+    Parameters
+    ----------
+    files : Sequence[PathLike]
+        `.grib2` or `.grib2.gz` files of a single data type, e.g., as returned by
+        `fetch.timerange`. They are ordered by the timestamp in their names.
+    path : PathLike
+        Folder to write the store to. An existing store is replaced.
+    geodata : gpd.GeoDataFrame | None = None
+        GeoDataFrame containing Points as geometries.
+    extent : Extent | None = None
+        Extent to store all the cells of. Can be combined with `geodata`.
+    block : int = 720
+        Number of files decoded before writing their values.
+    quantize : bool = True
+        Store the values as scaled integers, see `grib.QUANTIZATION`. They take 2 to 4
+        times less space than single precision floats. Files whose data type cannot be
+        told from their names are stored as floats.
+    verbose : bool = False
+        Print progress.
+
+    Returns
+    -------
+    PixelStore
+        The new store.
+
+    Examples
+    --------
+    >>> files = mrms.fetch.timerange("2020-01-01", "2024-12-31", frequency="1h")
+    >>> store = mrms.pixels.build(files, "gauges", geodata=gauges)
+    >>> mrms.ts.point.query_files(files, gauges, pixel_store="gauges")
+    """
+    if not files:
+        raise ValueError("No files to store")
+
+    path = Path(path)
+    files, _ = _sorted_by_time(files)
+
+    data_type = _data_type(files)
+    quantization = grib.QUANTIZATION.get(data_type) if quantize and data_type is not None else None
+    dtype = quantization.dtype if quantization is not None else np.float32
+
+    grid = grib.read_grid(files[0])
+    keys = _pixels(grid, geodata, extent)
+    rows, cols = np.divmod(keys, grid.nlon)
+
+    # Only the window covering the pixels is decoded
+    lats, lons = grid.latitudes[[rows.min(), rows.max()]], grid.longitudes[[cols.min(), cols.max()]] - 360
+    window = Extent((lats.min(), lats.max()), (lons.min(), lons.max()))
+    win_rows, win_cols = grid.window(window)
+    win_grid = grid.subgrid(win_rows, win_cols)
+
+    path.mkdir(parents=True, exist_ok=True)
+    (path / _INDEX).unlink(missing_ok=True)
+
+    values = np.memmap(path / _VALUES, dtype=dtype, mode="w+", shape=(len(keys), len(files)))
+    times = np.empty(len(files), dtype="datetime64[ns]")
+
+    with Pool() as pool:
+        fields = pool.imap(partial(grib.read, extent=window), files, chunksize=16)
+        buffer = np.empty((len(keys), min(block, len(files))), dtype=dtype)
+
+        for i, field in enumerate(fields):
+            if field.grid != win_grid:
+                raise ValueError(f"The grid of {files[i].name} does not match the grid of {files[0].name}.")
+
+            pixels = field.values[rows - win_rows.start, cols - win_cols.start]
+            buffer[:, i % block] = quantization.encode(pixels) if quantization is not None else pixels
+            times[i] = field.time
+
+            # Write pixel-major, one block of timestamps at a time
+            if (i + 1) % block == 0 or i + 1 == len(files):
+                start = i - i % block
+                values[:, start : i + 1] = buffer[:, : i + 1 - start]
+
+                if verbose:
+                    print(f"-> {i + 1}/{len(files)} files written to {path}.")
+
+    values.flush()
+    del values
+
+    # The index is written last, so an interrupted build is not mistaken for a store
+    np.savez(
+        tmp := path / f"{_INDEX}.{os.getpid()}.tmp.npz",
+        rows=rows,
+        cols=cols,
+        times=times,
+        **{k: getattr(grid, k) for k in _GRID_ATTRS},
+        **(asdict(quantization) if quantization is not None else {}),
+        **({"data_type": data_type} if data_type is not None else {}),
+    )
+    os.replace(tmp, path / _INDEX)
+
+    return open_store(path)
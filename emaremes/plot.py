@@ -18,8 +18,8 @@ from .utils import (
     DATA_NAMES,
     PRECIP_FLAGS_COLORS,
     Extent,
-    unzip_if_gz,
 )
+from . import grib
 
 from .typing_utils import UnitedState, MRMSDataType
 
@@ -121,7 +121,6 @@ def _get_extent_config(extent: UnitedState | Literal["CONUS"] | Extent, scale_wi
     raise ValueError(f"{extent:=} not found. Valid options are `CONUS` or two-letter state codes (uppercase).")
 
 
-@unzip_if_gz
 def precip_rate_map(
     file: PathLike,
     state: UnitedState | Literal["CONUS"] | Extent,
@@ -155,7 +154,7 @@ def precip_rate_map(
 
     extent, scale_win = _get_extent_config(state, scale_win)
 
-    with xr.open_dataset(file, engine="cfgrib", decode_timedelta=False) as ds:
+    with grib.open_dataset(file, extent=extent) as ds:
         # -> Clip to extent
         # |-> Mask out no data (-3 for precipitation data)
         # |-> Hide small intensities (PrecipRate < 1)
@@ -174,7 +173,6 @@ def precip_rate_map(
     return fig
 
 
-@unzip_if_gz
 def precip_flag_map(
     file: PathLike,
     state: UnitedState | Literal["CONUS"] | Extent,
@@ -208,7 +206,7 @@ def precip_flag_map(
 
     extent, scale_win = _get_extent_config(state, scale_win)
 
-    with xr.open_dataset(file, engine="cfgrib", decode_timedelta=False) as ds:
+    with grib.open_dataset(file, extent=extent) as ds:
         # - Mask out no data (-3 for precipitation data)
         # |-> Mask out no rain (Flag = 0)
         # |-> Clip to extent
@@ -0,0 +1,367 @@
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import Pool
+from os import PathLike
+from pathlib import Path
+from typing import Iterable, Literal, Sequence
+
+import numpy as np
+import pandas as pd
+
+from . import grib
+from .cube import _GRID_ATTRS, _sorted_by_time
+from .utils import Extent
+
+__all__ = ["SparseFrames", "from_fields", "ingest", "load"]
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """Runs `[start, stop)` of the True values of a flat boolean array."""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1).astype(np.int32)
+
+
+def _merge_runs(runs: np.ndarray) -> np.ndarray:
+    """Union of a set of runs `[start, stop)`, as sorted non-overlapping runs."""
+    if not len(runs):
+        return runs
+
+    runs = runs[np.argsort(runs[:, 0], kind="stable")]
+    reach = np.maximum.accumulate(runs[:, 1])
+
+    # A run starts a new group if it begins after every previous run has ended
+    new = np.r_[True, runs[1:, 0] > reach[:-1]]
+    starts = runs[new, 0]
+    stops = reach[np.r_[np.flatnonzero(new)[1:] - 1, len(runs) - 1]]
+
+    return np.stack([starts, stops], axis=1)
+
+
+def _in_runs(keys: np.ndarray, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """Whether each key falls within one of the sorted runs `[start, stop)`."""
+    if not len(starts):
+        return np.zeros(np.shape(keys), dtype=bool)
+
+    i = np.searchsorted(starts, keys, side="right") - 1
+    return (i >= 0) & (keys < stops[np.maximum(i, 0)])
+
+
+def _sparsify(field: grib.GribField) -> tuple[np.datetime64, np.ndarray, np.ndarray, np.ndarray]:
+    """Flat index and value of the nonzero cells of a field, and runs of no data."""
+    flat = field.values.ravel()
+    nodata = flat == -3
+    index = np.flatnonzero((flat != 0) & ~nodata).astype(np.int32)
+
+    return field.time, index, flat[index], _runs(nodata)
+
+
+def _read_sparse(f: PathLike, extent: Extent | None) -> tuple[grib.GridDefinition, tuple]:
+    field = grib.read(f, extent)
+    return field.grid, _sparsify(field)
+
+
+@dataclass
+class SparseFrames:
+    """
+    Sequence of fields on the same grid, keeping only their nonzero cells. No data (-3)
+    is kept as runs of consecutive cells, which are few because no data covers large
+    contiguous areas outside of the radar coverage. Dry fields take almost no memory.
+
+    Cells are numbered row by row, `row * grid.nlon + col`.
+
+    Parameters
+    ----------
+    grid : grib.GridDefinition
+        Grid of the fields.
+    times : np.ndarray
+        Timestamps of the fields, sorted.
+    offsets : np.ndarray
+        The nonzero cells of field `i` are `index[offsets[i]:offsets[i + 1]]`.
+    index : np.ndarray
+        Nonzero cells, sorted within each field.
+    values : np.ndarray
+        Values of the nonzero cells.
+    nodata_offsets : np.ndarray
+        The runs of no data of field `i` are `nodata[nodata_offsets[i]:nodata_offsets[i + 1]]`.
+    nodata : np.ndarray
+        Runs `[start, stop)` of cells with no data, sorted within each field.
+    """
+
+    grid: grib.GridDefinition
+    times: np.ndarray
+    offsets: np.ndarray
+    index: np.ndarray
+    values: np.ndarray
+    nodata_offsets: np.ndarray
+    nodata: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the arrays of the frames."""
+        return sum(
+            a.nbytes for a in (self.times, self.offsets, self.index, self.values, self.nodata_offsets, self.nodata)
+        )
+
+    def field(self, i: int, extent: Extent | None = None) -> grib.GribField:
+        """
+        Dense field of a timestamp.
+
+        Parameters
+        ----------
+        i : int
+            Position of the timestamp.
+        extent : Extent | None = None
+            Only build the window of the field covering this extent.
+
+        Returns
+        -------
+        grib.GribField
+            Field with zeros, nonzero values and -3 for no data.
+        """
+        index = self.index[self.offsets[i] : self.offsets[i + 1]]
+        values = self.values[self.offsets[i] : self.offsets[i + 1]]
+        runs = self.nodata[self.nodata_offsets[i] : self.nodata_offsets[i + 1]]
+
+        if extent is None:
+            dense = np.zeros(self.grid.nlat * self.grid.nlon, dtype=self.values.dtype)
+            dense[index] = values
+
+            for start, stop in runs.tolist():
+                dense[start:stop] = -3
+
+            return grib.GribField(dense.reshape(self.grid.shape), self.times[i], self.grid)
+
+        rows, cols = self.grid.window(extent)
+        cells = np.arange(rows.start, rows.stop)[:, None] * self.grid.nlon + np.arange(cols.start, cols.stop)
+        dense = np.zeros(cells.shape, dtype=self.values.dtype)
+
+        # Nonzero cells within the window
+        first, last = np.searchsorted(index, [cells[0, 0], cells[-1, -1] + 1])
+        r, c = np.divmod(index[first:last], self.grid.nlon)
+        inside = (c >= cols.start) & (c < cols.stop)
+        dense[r[inside] - rows.start, c[inside] - cols.start] = values[first:last][inside]
+
+        dense[_in_runs(cells, runs[:, 0], runs[:, 1])] = -3
+
+        return grib.GribField(dense, self.times[i], self.grid.subgrid(rows, cols))
+
+    def points(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """
+        Series of a set of cells.
+
+        Parameters
+        ----------
+        rows, cols : np.ndarray
+            Rows and columns of the cells, e.g., from `grid.index`.
+
+        Returns
+        -------
+        np.ndarray
+            Values of shape (times, cells), with -3 for no data.
+        """
+        ncells = self.grid.nlat * self.grid.nlon
+        cells = np.asarray(rows, dtype=np.int64) * self.grid.nlon + np.asarray(cols)
+
+        # Keys of all the frames are sorted once offset by `frame * ncells`
+        frames = np.arange(len(self), dtype=np.int64)
+        wanted = (frames[:, None] * ncells + cells).ravel()
+
+        keys = np.repeat(frames, np.diff(self.offsets)) * ncells + self.index
+        out = np.zeros(len(wanted), dtype=self.values.dtype)
+
+        if len(keys):
+            pos = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            found = keys[pos] == wanted
+            out[found] = self.values[pos[found]]
+
+        run_frames = np.repeat(frames, np.diff(self.nodata_offsets)) * ncells
+        out[_in_runs(wanted, run_frames + self.nodata[:, 0], run_frames + self.nodata[:, 1])] = -3
+
+        return out.reshape(len(self), len(cells))
+
+    def aggregate(self, freq: str | pd.Timedelta, how: Literal["sum", "mean", "max"] = "sum") -> "SparseFrames":
+        """
+        Aggregate the frames over periods of time, e.g., to hourly totals. A cell has no data
+        in a period if it has no data in any of its frames.
+
+        Parameters
+        ----------
+        freq : str | pd.Timedelta
+            Length of the periods, e.g., "1h". Periods are labeled by their start.
+        how : Literal["sum", "mean", "max"] = "sum"
+            Aggregation of the frames of a period. The mean of a precipitation rate over an
+            hour is the precipitation depth of that hour.
+
+        Returns
+        -------
+        SparseFrames
+            One frame per period, labeled by its start.
+        """
+        if how not in ("sum", "mean", "max"):
+            raise ValueError(f"Unknown aggregation {how!r}")
+
+        labels = pd.DatetimeIndex(self.times).floor(freq)
+        periods, starts = np.unique(labels.values, return_index=True)
+        bounds = np.r_[starts, len(self)]
+
+        frames = []
+
+        for period, a, b in zip(periods, bounds[:-1], bounds[1:]):
+            index = self.index[self.offsets[a] : self.offsets[b]]
+            values = self.values[self.offsets[a] : self.offsets[b]]
+            runs = _merge_runs(self.nodata[self.nodata_offsets[a] : self.nodata_offsets[b]])
+
+            cells, inverse = np.unique(index, return_inverse=True)
+
+            if how == "max":
+                # Cells missing from a frame are zero in that frame
+                total = np.full(len(cells), -np.inf)
+                np.maximum.at(total, inverse, values)
+                total = np.where(np.bincount(inverse, minlength=len(cells)) < b - a, np.maximum(total, 0), total)
+            else:
+                total = np.bincount(inverse, weights=values, minlength=len(cells))
+                total = total / (b - a) if how == "mean" else total
+
+            keep = (total != 0) & ~_in_runs(cells, runs[:, 0], runs[:, 1])
+            frames.append((period, cells[keep].astype(np.int32), total[keep].astype(self.values.dtype), runs))
+
+        return _assemble(self.grid, frames)
+
+    def save(self, path: PathLike) -> Path:
+        """
+        Save the frames to a `.npz` file, see `load`.
+
+        Parameters
+        ----------
+        path : PathLike
+            Path of the file.
+        """
+        path = Path(path)
+        np.savez(
+            path,
+            times=self.times,
+            offsets=self.offsets,
+            index=self.index,
+            values=self.values,
+            nodata_offsets=self.nodata_offsets,
+            nodata=self.nodata,
+            **{k: getattr(self.grid, k) for k in _GRID_ATTRS},
+        )
+        return path
+
+
+def _assemble(grid: grib.GridDefinition, frames: Sequence[tuple]) -> SparseFrames:
+    """Concatenate `(time, index, values, runs)` tuples into a `SparseFrames`."""
+    return SparseFrames(
+        grid,
+        np.array([f[0] for f in frames], dtype="datetime64[ns]"),
+        np.r_[0, np.cumsum([len(f[1]) for f in frames])].astype(np.int64),
+        np.concatenate([f[1] for f in frames]) if frames else np.empty(0, dtype=np.int32),
+        np.concatenate([f[2] for f in frames]) if frames else np.empty(0, dtype=np.float32),
+        np.r_[0, np.cumsum([len(f[3]) for f in frames])].astype(np.int64),
+        np.concatenate([f[3] for f in frames]).reshape(-1, 2) if frames else np.empty((0, 2), dtype=np.int32),
+    )
+
+
+def from_fields(fields: Iterable[grib.GribField]) -> SparseFrames:
+    """
+    Sparse frames of decoded fields.
+
+    Parameters
+    ----------
+    fields : Iterable[grib.GribField]
+        Fields on the same grid, e.g., from `grib.read`. They are sorted by time.
+
+    Returns
+    -------
+    SparseFrames
+        The frames of the fields.
+    """
+    grid = None
+    frames = []
+
+    for field in fields:
+        if grid is None:
+            grid = field.grid
+        elif field.grid != grid:
+            raise ValueError("All the fields must be on the same grid.")
+
+        frames.append(_sparsify(field))
+
+    if grid is None:
+        raise ValueError("No fields to convert")
+
+    frames.sort(key=lambda f: f[0])
+    return _assemble(grid, frames)
+
+
+def ingest(files: Sequence[PathLike], extent: Extent | None = None) -> SparseFrames:
+    """
+    Read files into sparse frames. Files are decoded in parallel and only their nonzero
+    cells are kept, so a month of CONUS fields fits in memory.
+
+    Parameters
+    ----------
+    files : Sequence[PathLike]
+        `.grib2` or `.grib2.gz` files, e.g., as returned by `fetch.timerange`. They are
+        ordered by the timestamp in their names.
+    extent : Extent | None = None
+        Only keep the cells within this extent. If None, the full grid is kept.
+
+    Returns
+    -------
+    SparseFrames
+        The frames of the files.
+
+    Examples
+    --------
+    >>> files = mrms.fetch.timerange("2024-07-01", "2024-07-31T23:58", frequency="2min")
+    >>> hourly = mrms.sparse.ingest(files).aggregate("1h", how="mean")
+    """
+    if not files:
+        raise ValueError("No files to read")
+
+    files, _ = _sorted_by_time(files)
+    grid = None
+    frames = []
+
+    with Pool() as pool:
+        for f, (field_grid, frame) in zip(files, pool.imap(partial(_read_sparse, extent=extent), files, chunksize=16)):
+            if grid is None:
+                grid = field_grid
+            elif field_grid != grid:
+                raise ValueError(f"The grid of {f.name} does not match the grid of {files[0].name}.")
+
+            frames.append(frame)
+
+    return _assemble(grid, frames)
+
+
+def load(path: PathLike) -> SparseFrames:
+    """
+    Load frames saved with `SparseFrames.save`.
+
+    Parameters
+    ----------
+    path : PathLike
+        Path of the `.npz` file.
+
+    Returns
+    -------
+    SparseFrames
+        The frames.
+    """
+    with np.load(path) as data:
+        grid = grib.GridDefinition(**{k: data[k].item() for k in _GRID_ATTRS})
+        return SparseFrames(
+            grid,
+            data["times"],
+            data["offsets"],
+            data["index"],
+            data["values"],
+            data["nodata_offsets"],
+            data["nodata"],
+        )
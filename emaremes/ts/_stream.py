@@ -0,0 +1,53 @@
+from os import PathLike
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+from .. import fetch, grib
+from ..typing_utils import MRMSDataType
+from ..utils import DATA_NAMES, Extent
+
+
+def iter_fields(
+    initial_datetime: str | fetch.DatetimeLike,
+    end_datetime: str | fetch.DatetimeLike,
+    extent: Extent,
+    frequency: str | fetch.TimedeltaLike = pd.Timedelta(minutes=10),
+    data_type: MRMSDataType = "precip_rate",
+    persist_to: PathLike | None = None,
+    **fetch_kwargs,
+) -> Iterator[grib.GribField]:
+    """
+    Stream the fields of a time range clipped to an extent. Messages are decoded in memory
+    as they are downloaded, so full CONUS files are never written to disk.
+
+    Parameters
+    ----------
+    initial_datetime, end_datetime, frequency, data_type
+        Same as in `fetch.timerange`.
+    extent : Extent
+        Extent to clip the fields to.
+    persist_to : PathLike | None = None
+        If given, the clipped fields are stored as `.grib2` files in `YYYYMMDD` subfolders
+        of this folder. These files can be passed to `query_files` later on.
+    **fetch_kwargs
+        Other arguments for `fetch.stream_timerange`.
+
+    Yields
+    ------
+    grib.GribField
+        Clipped fields, in completion order.
+    """
+    persist_to = Path(persist_to) if persist_to is not None else None
+    product = DATA_NAMES[data_type]
+
+    for t, message in fetch.stream_timerange(initial_datetime, end_datetime, frequency, data_type, **fetch_kwargs):
+        field = grib.decode(message, extent=extent)
+
+        if persist_to is not None:
+            folder = persist_to / t.strftime(r"%Y%m%d")
+            folder.mkdir(parents=True, exist_ok=True)
+            (folder / f"{product}_00.00_{t.strftime(r'%Y%m%d-%H%M%S')}.grib2").write_bytes(grib.encode(field, message))
+
+        yield field
@@ -1,19 +1,206 @@
+import warnings
+from dataclasses import dataclass
 from multiprocessing import Pool
 from os import PathLike
 from pathlib import Path
+from typing import Literal
 
 import numpy as np
-import xarray as xr
 import pandas as pd
 import geopandas as gpd
+import xarray as xr
+from numpy.typing import ArrayLike
+
+from . import _stream
+from .. import cube, grib, pixels, sparse
+from ..catalog import parse_filename
+from ..fetch import DatetimeLike, TimedeltaLike
+from ..typing_utils import MRMSDataType
+from ..utils import Extent
+
 
-from ..utils import Extent, unzip_if_gz
+type Sampling = Literal["nearest", "bilinear", "mean", "max"]
 
+# Spacing of the MRMS grid, to pad extents before the grid of the files is known
+_STEP: float = 0.01
 
-@unzip_if_gz
-def query_single_file(f: PathLike, geodata: gpd.GeoDataFrame) -> tuple[np.datetime64, dict[str, float]]:
+
+@dataclass
+class _Points:
+    """
+    Points in EPSG:4326 and the table of grid cells sampled for each of them, built once
+    for many files. Cells shared by several points are read once: `rows` and `cols` are
+    the distinct cells, `inverse` maps each point to the cells it samples, and `weights`
+    holds the bilinear weights. Cells outside of the grid map to `len(rows)`.
     """
-    Extracts the nearest value of a grib2 file provided a latitude and longitude.
+
+    columns: list[str]
+    lon: np.ndarray
+    lat: np.ndarray
+    method: Sampling = "nearest"
+    size: int = 3
+    grid: grib.GridDefinition | None = None
+    rows: np.ndarray | None = None
+    cols: np.ndarray | None = None
+    inverse: np.ndarray | None = None
+    weights: np.ndarray | None = None
+
+    def __post_init__(self) -> None:
+        if self.method not in ("nearest", "bilinear", "mean", "max"):
+            raise ValueError(f"Unknown sampling method {self.method!r}")
+
+        if self.size < 1 or self.size % 2 == 0:
+            raise ValueError("`size` must be a positive odd number.")
+
+    @classmethod
+    def from_geodata(
+        cls,
+        geodata: gpd.GeoDataFrame,
+        grid: grib.GridDefinition | None = None,
+        method: Sampling = "nearest",
+        size: int = 3,
+    ) -> "_Points":
+        geodata = geodata.to_crs("4326")
+        x, y = geodata.geometry.x.values, geodata.geometry.y.values
+        points = cls(geodata.index.astype(str).tolist(), x, y, method, size)
+        return points.located(grid) if grid is not None else points
+
+    @property
+    def margin(self) -> int:
+        """Number of cells sampled around the nearest cell."""
+        return {"nearest": 0, "bilinear": 1}.get(self.method, self.size // 2)
+
+    @property
+    def extent(self) -> Extent:
+        """Extent covering the points and the cells sampled around them."""
+        # The nearest cell is up to half a cell away from the point
+        pad = (self.margin + 1) * _STEP if self.margin else 0.0
+        return Extent((self.lat.min() - pad, self.lat.max() + pad), (self.lon.min() - pad, self.lon.max() + pad))
+
+    def _table(self, grid: grib.GridDefinition) -> tuple[np.ndarray, np.ndarray, np.ndarray | None]:
+        """Rows and columns of the cells sampled for each point, of shape (points, cells)."""
+        rows, cols = grid.index(self.lon, self.lat)
+
+        if self.method == "nearest":
+            return rows[:, None], cols[:, None], None
+
+        if self.method == "bilinear":
+            lon = np.where(self.lon < 0, self.lon + 360, self.lon)
+            frow, fcol = (self.lat - grid.lat0) / grid.dlat, (lon - grid.lon0) / grid.dlon
+            rows, cols = np.floor(frow).astype(int), np.floor(fcol).astype(int)
+            trow, tcol = frow - rows, fcol - cols
+
+            dr, dc = np.array([0, 0, 1, 1]), np.array([0, 1, 0, 1])
+            weights = np.stack([(1 - trow) * (1 - tcol), (1 - trow) * tcol, trow * (1 - tcol), trow * tcol], axis=1)
+            return rows[:, None] + dr, cols[:, None] + dc, weights
+
+        dr, dc = np.divmod(np.arange(self.size**2), self.size)
+        return rows[:, None] + dr - self.margin, cols[:, None] + dc - self.margin, None
+
+    def located(self, grid: grib.GridDefinition) -> "_Points":
+        rows, cols, weights = self._table(grid)
+        inside = (rows >= 0) & (rows < grid.nlat) & (cols >= 0) & (cols < grid.nlon)
+
+        cells, inverse = np.unique(rows[inside].astype(np.int64) * grid.nlon + cols[inside], return_inverse=True)
+        table = np.full(rows.shape, len(cells))
+        table[inside] = inverse
+
+        rows, cols = np.divmod(cells, grid.nlon)
+        return _Points(self.columns, self.lon, self.lat, self.method, self.size, grid, rows, cols, table, weights)
+
+    def reduce(self, values: np.ndarray, block: int = 4096) -> np.ndarray:
+        """
+        Sample the points from the values of the distinct cells, of shape (cells,) or
+        (times, cells). No data (-3) and cells outside of the grid are ignored, NaN if no
+        cell is left. Long series are sampled `block` timestamps at a time.
+        """
+        if values.ndim > 1 and len(values) > block:
+            return np.concatenate([self.reduce(values[i : i + block]) for i in range(0, len(values), block)])
+
+        values = np.where(values == -3, np.nan, values)
+        values = np.concatenate([values, np.full((*values.shape[:-1], 1), np.nan, values.dtype)], axis=-1)
+        table = values[..., self.inverse]
+
+        if self.method == "nearest":
+            return table[..., 0]
+
+        with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+            # Points with no valid cells give NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+
+            if self.method == "bilinear":
+                valid = ~np.isnan(table)
+                weighted = np.where(valid, table, 0) * self.weights
+                return weighted.sum(axis=-1) / (valid * self.weights).sum(axis=-1)
+
+            return np.nanmean(table, axis=-1) if self.method == "mean" else np.nanmax(table, axis=-1)
+
+    def gather(self, field: grib.GribField) -> np.ndarray:
+        """Values sampled for each point from a decoded field."""
+        points = self if field.grid == self.grid else self.located(field.grid)
+        return points.reduce(field.values[points.rows, points.cols])
+
+
+def _gather_from_file(f: PathLike, points: _Points, extent: Extent) -> tuple[np.datetime64, np.ndarray]:
+    """
+    Reads the window of a file covering an extent and gathers the values of the points.
+    Points located on the grid of that window are not located again.
+    """
+    field = grib.read(f, extent)
+    return field.time, points.gather(field)
+
+
+def _to_dataframe(times: ArrayLike, values: ArrayLike, columns: list[str]) -> pd.DataFrame:
+    df = pd.DataFrame(
+        np.asarray(values, dtype=float).reshape(len(times), len(columns)),
+        index=pd.to_datetime(np.asarray(times), utc=True),
+        columns=columns,
+    )
+    df.index.name = "timestamp"
+
+    return df
+
+
+def snap_points(geodata: gpd.GeoDataFrame, grid: PathLike | grib.GridDefinition) -> pd.DataFrame:
+    """
+    Snaps points to the nearest cells of the MRMS grid. Points falling in the same cell
+    are extracted once by the `query_*` functions.
+
+    Parameters
+    ----------
+    geodata : gpd.GeoDataFrame
+        GeoDataFrame containing Points as geometries.
+    grid : PathLike | grib.GridDefinition
+        Grid, or a grib2 file to read the grid from. Only its header is read.
+
+    Returns
+    -------
+    pd.DataFrame
+        Table indexed as `geodata`, with the `row` and `col` of the cell, a `cell` identifier
+        shared by the points in the same cell, the `longitude` and `latitude` of its center,
+        and the `distance` in meters from the point to that center.
+    """
+    if not isinstance(grid, grib.GridDefinition):
+        grid = grib.read_grid(grid)
+
+    points = _Points.from_geodata(geodata, grid)
+    rows, cols = points.rows[points.inverse[:, 0]], points.cols[points.inverse[:, 0]]
+    lon, lat = grid.longitudes[cols] - 360, grid.latitudes[rows]
+
+    # Haversine distance, on a sphere with the mean radius of the Earth
+    phi, cell_phi, dlon = np.radians(points.lat), np.radians(lat), np.radians(lon - points.lon)
+    h = np.sin((cell_phi - phi) / 2) ** 2 + np.cos(phi) * np.cos(cell_phi) * np.sin(dlon / 2) ** 2
+    distance = 2 * 6_371_008.8 * np.arcsin(np.sqrt(h))
+
+    cells = {"row": rows, "col": cols, "cell": rows * grid.nlon + cols}
+    return pd.DataFrame({**cells, "longitude": lon, "latitude": lat, "distance": distance}, index=geodata.index)
+
+
+def query_single_file(
+    f: PathLike, geodata: gpd.GeoDataFrame, method: Sampling = "nearest", size: int = 3
+) -> tuple[np.datetime64, dict[str, float]]:
+    """
+    Extracts the value of a grib2 file at each point, the nearest one by default.
 
     Parameters
     ----------
@@ -21,6 +208,12 @@ def query_single_file(f: PathLike, geodata: gpd.GeoDataFrame) -> tuple[np.dateti
         Path to the grib2 file.
     geodata: gpd.GeoDataFrame
         GeoDataFrame containing Points as geometries.
+    method : Sampling = "nearest"
+        How each point is sampled: the `"nearest"` cell, a `"bilinear"` interpolation of the
+        four surrounding cells, or the `"mean"` or `"max"` of the `size` x `size` cells
+        centered on the nearest one. No data is left out of the interpolation and windows.
+    size : int = 3
+        Width of the window, in cells, for `"mean"` and `"max"`. Must be odd.
 
     Returns
     -------
@@ -28,28 +221,48 @@ def query_single_file(f: PathLike, geodata: gpd.GeoDataFrame) -> tuple[np.dateti
         A tuple with the timestamp and values of the queried points.
     """
 
-    geodata = geodata.to_crs("4326")
-    bounds = geodata.total_bounds
-    extent = Extent((bounds[1], bounds[3]), (bounds[0], bounds[2]))
+    points = _Points.from_geodata(geodata, method=method, size=size)
+    time, values = _gather_from_file(f, points, points.extent)
+    return time, {k: float(v) for k, v in zip(geodata.index.astype(str), values)}
+
+
+def _query_pixel_store(store: pixels.PixelStore, files: list[Path], points: _Points) -> pd.DataFrame | None:
+    """Reads the values of the files from a pixel store, or None if it does not have them all."""
+    parsed = [parse_filename(Path(f).name) for f in files]
+    if any(p is None for p in parsed):
+        return None
+
+    # Files of another type of data may have the same timestamps
+    if store.data_type is None or store.data_type != cube._data_type([Path(f) for f in files]):
+        return None
+
+    stamps = pd.DatetimeIndex([t for _, t in parsed]).as_unit("ns").values
+    t = np.minimum(np.searchsorted(store.times, stamps), len(store.times) - 1)
 
-    with xr.open_dataset(f, engine="cfgrib", decode_timedelta=False) as ds:
-        # Mask out no data (-3 for precipitation data) and hide small intensities
-        ds = ds.where(ds["unknown"] != -3)
-        time = ds.time.values.copy()
-        xclip = ds.loc[extent.as_xr_slice()]
-        data = {}
+    try:
+        points = points.located(store.grid)
+    except ValueError:  # Points outside of the grid
+        return None
 
-        for index, point in geodata.iterrows():
-            lon, lat = point.geometry.x, point.geometry.y
-            lon = 360 + lon if lon < 0 else lon
+    pix = store.locate(points.rows, points.cols)
+    if (store.times[t] != stamps).any() or (pix < 0).any():
+        return None
 
-            v = xclip.sel(latitude=lat, longitude=lon, method="nearest")["unknown"].values.copy()
-            data[str(index)] = float(v)
+    # One contiguous slice per pixel
+    mm = store.values
+    values = store.decode(np.stack([mm[p][t] for p in pix], axis=1))
 
-    return time, data
+    # No data (-3 for precipitation data) is masked out
+    return _to_dataframe(stamps, points.reduce(values), points.columns)
 
 
-def query_files(files: list[Path], geodata: gpd.GeoDataFrame) -> pd.DataFrame:
+def query_files(
+    files: list[Path],
+    geodata: gpd.GeoDataFrame,
+    pixel_store: PathLike | None = None,
+    method: Sampling = "nearest",
+    size: int = 3,
+) -> pd.DataFrame:
     """
     Parallelizes the extraction of point values from grib2 files. For a large number of files,
     this can be much faster than using `xr.open_mfdataset`.
@@ -60,6 +273,17 @@ def query_files(files: list[Path], geodata: gpd.GeoDataFrame) -> pd.DataFrame:
         List of grib2 files to extract the point value from.
     geodata : gpd.GeoDataFrame
         GeoDataFrame containing Points as geometries.
+    pixel_store : PathLike | None = None
+        Path to a store written by `pixels.build`. If it holds the pixels of all the points
+        for the timestamps of all the files, the values are read from it and no file is
+        decoded. For `method`s other than `"nearest"`, it must also hold the cells around
+        the points.
+    method : Sampling = "nearest"
+        How each point is sampled: the `"nearest"` cell, a `"bilinear"` interpolation of the
+        four surrounding cells, or the `"mean"` or `"max"` of the `size` x `size` cells
+        centered on the nearest one. No data is left out of the interpolation and windows.
+    size : int = 3
+        Width of the window, in cells, for `"mean"` and `"max"`. Must be odd.
 
     Returns
     -------
@@ -70,14 +294,153 @@ def query_files(files: list[Path], geodata: gpd.GeoDataFrame) -> pd.DataFrame:
     if not files:
         raise ValueError("No files to query")
 
+    # The cells sampled are located once, in the window of the grid covering them, and
+    # every file is sampled with the same index and weight tables
+    points = _Points.from_geodata(geodata, method=method, size=size)
+
+    if pixel_store is not None:
+        if (df := _query_pixel_store(pixels.open_store(pixel_store), files, points)) is not None:
+            return df
+
+    grid = grib.read_grid(files[0])
+    extent = points.extent
+    points = points.located(grid.subgrid(*grid.window(extent)))
+
     with Pool() as pool:
-        query = pool.starmap(query_single_file, [(f, geodata) for f in files])
+        query = pool.starmap(_gather_from_file, [(f, points, extent) for f in files])
 
-    df = pd.DataFrame([{"timestamp": timestamp, **values} for timestamp, values in query])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df.set_index("timestamp", inplace=True)
+    times, values = zip(*query)
+    return _to_dataframe(times, np.stack(values), points.columns)
 
-    return df
+
+def query_timerange(
+    geodata: gpd.GeoDataFrame,
+    initial_datetime: str | DatetimeLike,
+    end_datetime: str | DatetimeLike,
+    frequency: str | TimedeltaLike = pd.Timedelta(minutes=10),
+    data_type: MRMSDataType = "precip_rate",
+    persist_to: PathLike | None = None,
+    method: Sampling = "nearest",
+    size: int = 3,
+    **fetch_kwargs,
+) -> pd.DataFrame:
+    """
+    Downloads and extracts point values for a time range in a single pass. Files that are
+    not stored yet are decompressed and decoded in memory as they are downloaded, so full
+    CONUS files are never written to disk.
+
+    Parameters
+    ----------
+    geodata : gpd.GeoDataFrame
+        GeoDataFrame containing Points as geometries.
+    initial_datetime, end_datetime, frequency, data_type
+        Time range to query. Same as in `fetch.timerange`.
+    persist_to : PathLike | None = None
+        If given, a regional clip of each file covering the points is stored as a `.grib2`
+        file in this folder.
+    method, size
+        How each point is sampled, same as in `query_files`.
+    **fetch_kwargs
+        Other arguments for `fetch.stream_timerange`, e.g. `max_workers` or `verbose`.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    points = _Points.from_geodata(geodata, method=method, size=size)
+
+    fields = _stream.iter_fields(
+        initial_datetime, end_datetime, points.extent, frequency, data_type, persist_to, **fetch_kwargs
+    )
+
+    # Fields are clipped to the same window, so the points are located with the first one
+    query = []
+    for field in fields:
+        if points.grid is None:
+            points = points.located(field.grid)
+
+        query.append((field.time, points.gather(field)))
+
+    if not query:
+        raise ValueError("No files found in the time range")
+
+    times, values = zip(*query)
+    return _to_dataframe(times, np.stack(values), points.columns).sort_index()
+
+
+def query_cube(
+    store: PathLike,
+    geodata: gpd.GeoDataFrame,
+    initial_datetime: str | DatetimeLike | None = None,
+    end_datetime: str | DatetimeLike | None = None,
+    method: Sampling = "nearest",
+    size: int = 3,
+) -> pd.DataFrame:
+    """
+    Extracts point values from a cube written by `cube.ingest`. Only the chunks holding
+    the points are read.
+
+    Parameters
+    ----------
+    store : PathLike
+        Path to the cube.
+    geodata : gpd.GeoDataFrame
+        GeoDataFrame containing Points as geometries.
+    initial_datetime, end_datetime : str | DatetimeLike | None = None
+        Time range to extract, both ends included. If None, from the start or to the end
+        of the cube.
+    method, size
+        How each point is sampled, same as in `query_files`.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    points = _Points.from_geodata(geodata, cube.read_grid(store), method, size)
+
+    ds, quantization = cube._open_encoded(store)
+
+    with ds:
+        da = ds[cube.VARIABLE].sel(time=slice(initial_datetime, end_datetime))
+        cells = da.isel(
+            latitude=xr.DataArray(points.rows, dims="point"), longitude=xr.DataArray(points.cols, dims="point")
+        )
+        values = cube._read_values(cells, quantization)
+
+    # No data (-3 for precipitation data) is masked out
+    return _to_dataframe(da.time.values, points.reduce(values), points.columns)
+
+
+def query_sparse(
+    frames: sparse.SparseFrames, geodata: gpd.GeoDataFrame, method: Sampling = "nearest", size: int = 3
+) -> pd.DataFrame:
+    """
+    Extracts point values from sparse frames, e.g., from `sparse.ingest`.
+
+    Parameters
+    ----------
+    frames : sparse.SparseFrames
+        Frames to extract the point values from.
+    geodata : gpd.GeoDataFrame
+        GeoDataFrame containing Points as geometries.
+    method, size
+        How each point is sampled, same as in `query_files`.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    points = _Points.from_geodata(geodata, frames.grid, method, size)
+    values = frames.points(points.rows, points.cols)
+
+    # No data (-3 for precipitation data) is masked out
+    return _to_dataframe(frames.times, points.reduce(values), points.columns)
 
 
-__all__ = ["query_files", "query_single_file"]
+__all__ = ["query_files", "query_single_file", "query_timerange", "query_cube", "query_sparse", "snap_points"]
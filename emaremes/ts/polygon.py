@@ -1,3 +1,4 @@
+import warnings
 from os import PathLike
 from pathlib import Path
 from multiprocessing import Pool
@@ -5,22 +6,144 @@ from multiprocessing import Pool
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-import xarray as xr
 
 from pyproj.crs.crs import CRS
-from shapely.geometry import Point, Polygon
+import shapely
+from shapely.geometry import Polygon
 from shapely.affinity import translate
 
-from ..utils import Extent, unzip_if_gz
+from . import _stream
+from .. import cube, grib, sparse
+from ..fetch import DatetimeLike, TimedeltaLike
+from ..typing_utils import MRMSDataType
+from ..utils import Extent
+
+
+type UpsampleIndex = tuple[np.ndarray, np.ndarray]
+
+
+def _nearest_index(coords: np.ndarray, new: np.ndarray) -> np.ndarray:
+    """
+    Index of the coordinate nearest to each new coordinate. Ties are broken as in
+    `xr.Dataset.interp(method="nearest")`.
+    """
+    order = np.argsort(coords)
+    ascending = coords[order]
+    return order[np.searchsorted((ascending[1:] + ascending[:-1]) / 2, new, side="left")]
+
+
+def _extract_using_masks(
+    field: grib.GribField,
+    masks: dict[str, np.ndarray],
+    extent: Extent,
+    upsample_index: UpsampleIndex | None = None,
+) -> tuple[np.datetime64, dict[str, float]]:
+    """Extracts the mean value within each mask from a decoded field."""
+    # Clip to the extent and mask out no data (-3 for precipitation data)
+    rows, cols = field.grid.window(extent)
+    values = field.values[rows, cols]
+    values = np.where(values == -3, np.nan, values)
+
+    # Upscaling helper
+    if upsample_index is not None:
+        values = values[np.ix_(*upsample_index)]
+
+    # Dictionary to store the data
+    data = {}
+
+    with warnings.catch_warnings():
+        # Masks with no valid data give NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+
+        for id, mask in masks.items():
+            data[id] = float(np.nanmean(values[mask]))
+
+    return field.time, data
+
+
+def _rasterize(polygon: Polygon, lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """
+    Mask of the nodes of a grid, given by its monotonic axes, strictly inside a polygon.
+    Only the nodes within the bounds of the polygon are tested, all at once.
+    """
+    mask = np.zeros((len(lat), len(lon)), dtype=bool)
+
+    minx, miny, maxx, maxy = polygon.bounds
+    cols = np.flatnonzero((lon >= minx) & (lon <= maxx))
+    rows = np.flatnonzero((lat >= miny) & (lat <= maxy))
+
+    if len(rows) and len(cols):
+        # The axes are monotonic, so the nodes within the bounds are a window of the grid
+        rows, cols = slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1)
+        x, y = np.meshgrid(lon[cols], lat[rows])
+        mask[rows, cols] = shapely.contains_xy(polygon, x, y)
+
+    return mask
+
+
+def _masks_and_index(
+    grid: grib.GridDefinition,
+    polygons: dict[str, Polygon],
+    extent: Extent,
+    upsample: bool = True,
+) -> tuple[dict[str, np.ndarray], UpsampleIndex | None]:
+    """Calculates the mask of each polygon over the window of a grid covering an extent."""
+    window = grid.subgrid(*grid.window(extent))
+    lon, lat = window.longitudes, window.latitudes
+
+    if upsample:
+        llon = np.linspace(min(lon), max(lon), num=4 * len(lon) - 1)
+        llat = np.linspace(min(lat), max(lat), num=4 * len(lat) - 1)
+        upsample_index = (_nearest_index(lat, llat), _nearest_index(lon, llon))
+
+    else:
+        llon, llat = lon, lat
+        upsample_index = None
+
+    # Same as `polygon.contains(Point(x, y))` on every node
+    for p in polygons.values():
+        shapely.prepare(p)
+
+    masks = {k: _rasterize(p, llon, llat) for k, p in polygons.items()}
+
+    return masks, upsample_index
+
+
+def _prepare_polygons(geodata: gpd.GeoDataFrame) -> tuple[Extent, dict[str, Polygon]]:
+    """Figures out the extent of the first clip and maps each identifier to its polygon."""
+    if geodata.crs != CRS("EPSG:4326"):
+        geodata["geometry"] = geodata["geometry"].buffer(0.001)
+        blob = geodata.dissolve().simplify(tolerance=50)
+    else:
+        blob = geodata.dissolve()
+
+    geo_blob = blob.to_crs("4326")
+    all_bounds = geo_blob.bounds
+    extent = Extent(
+        (all_bounds.miny[0], all_bounds.maxy[0]),
+        (all_bounds.minx[0], all_bounds.maxx[0]),
+    )
+
+    # Reproject the geodatabase and create a mapping of identifier: polygon
+    geodata_reproj = geodata.to_crs("4326")
+    translated_polygons = {k: translate(geo.geometry, xoff=360) for k, geo in geodata_reproj.iterrows()}
+
+    return extent, translated_polygons
+
+
+def _to_dataframe(query: list[tuple[np.datetime64, dict[str, float]]]) -> pd.DataFrame:
+    df = pd.DataFrame([{"timestamp": timestamp, **values} for timestamp, values in query])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
+    df.set_index("timestamp", inplace=True)
+
+    return df
 
 
-@unzip_if_gz
 def _extract_using_masks_from_file(
     file: PathLike,
     masks: dict[str, np.ndarray],
     extent: Extent,
-    variable: str = "unknown",
-    upsample_coords: dict[str, np.ndarray] | None = None,
+    upsample_index: UpsampleIndex | None = None,
 ) -> tuple[np.datetime64, dict[str, float]]:
     """
     Extracts the values of a grib2 file provided a mask and an extent.
@@ -33,72 +156,26 @@ def _extract_using_masks_from_file(
         Masks to apply to the grib2 file.
     extent : Extent
         Extent to clip the grib2 file to.
-    variable : str, optional
-        Variable to extract from the grib2 file, by default "unknown" which
-        represents precipitation intensity in mm/h.
-    upsample_coords : dict[str, np.ndarray] | None, optional
-        Coordinates to upsample the data to, by default None.
+    upsample_index : UpsampleIndex | None, optional
+        Rows and columns of the clipped grid that make up the upsampled grid, by
+        default None.
 
     Returns
     -------
     tuple[np.datetime64, dict[str, float]]
         A tuple with the timestamp and values for the polygons.
     """
-    with xr.open_dataset(file, engine="cfgrib", decode_timedelta=True) as ds:
-        # Open file and do a coarse clip
-        time = ds.time.values.copy()
-        xclip = ds.loc[extent.as_xr_slice()]
-        xclip = xclip.where(xclip["unknown"] != -3)
-
-        # Upscaling helper
-        if upsample_coords:
-            upsample = xclip.interp(coords=upsample_coords, method="nearest")
-        else:
-            upsample = xclip
-
-        # Dictionary to store the data
-        data = {}
-
-        for id, mask in masks.items():
-            mask_ds = upsample.where(mask)
-
-            # Actually access the files and extract the data
-            mean_precip = mask_ds[variable].mean(dim=["longitude", "latitude"])
-            data[id] = float(mean_precip.values.copy())
+    return _extract_using_masks(grib.read(file, extent), masks, extent, upsample_index)
 
-    return time, data
 
-
-@unzip_if_gz
-def _calculate_masks_and_coords(
+def _calculate_masks_and_index(
     f: PathLike,
     polygons: dict[str, Polygon],
     extent: Extent,
     upsample: bool = True,
-) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
-    """"""
-    with xr.open_dataset(f, engine="cfgrib", decode_timedelta=True) as ds:
-        xclip = ds.loc[extent.as_xr_slice()]
-        lon, lat = xclip.longitude.values.copy(), xclip.latitude.values.copy()
-
-        if upsample:
-            llon = np.linspace(min(lon), max(lon), num=4 * len(lon) - 1)
-            llat = np.linspace(min(lat), max(lat), num=4 * len(lat) - 1)
-
-        else:
-            llon, llat = lon, lat
-
-        upsample_coords = {"longitude": llon, "latitude": llat}
-        mlon, mlat = np.meshgrid(llon, llat)
-        points = np.vstack((mlon.flatten(), mlat.flatten())).T
-
-        # Mask using the polygon.contains calculation
-        masks = {
-            k: np.array([p.contains(Point(x, y)) for x, y in points]).reshape(len(llat), len(llon))
-            for k, p in polygons.items()
-        }
-
-    return masks, upsample_coords
+) -> tuple[dict[str, np.ndarray], UpsampleIndex | None]:
+    """Calculates the polygon masks over the grid of a file. Only its header is read."""
+    return _masks_and_index(grib.read_grid(f), polygons, extent, upsample)
 
 
 def query_single_file(
@@ -125,28 +202,13 @@ def query_single_file(
         A tuple with the timestamp and values of the queried points.
     """
 
-    # Figure out the extent of first clip
-    if geodata.crs != CRS("EPSG:4326"):
-        geodata["geometry"] = geodata["geometry"].buffer(0.001)
-        blob = geodata.dissolve().simplify(tolerance=50)
-    else:
-        blob = geodata.dissolve()
-
-    geo_blob = blob.to_crs("4326")
-    all_bounds = geo_blob.bounds
-    extent = Extent(
-        (all_bounds.miny[0], all_bounds.maxy[0]),
-        (all_bounds.minx[0], all_bounds.maxx[0]),
-    )
-
-    # Reproject the geodatabase and create a mapping of identifier: polygon
-    geodata_reproj = geodata.to_crs("4326")
-    translated_polygons = {k: translate(geo.geometry, xoff=360) for k, geo in geodata_reproj.iterrows()}
+    # Figure out the extent of first clip and the polygons
+    extent, translated_polygons = _prepare_polygons(geodata)
 
     # Generate masks
-    masks, upsample_coords = _calculate_masks_and_coords(file, translated_polygons, extent, upsample)
+    masks, upsample_index = _calculate_masks_and_index(file, translated_polygons, extent, upsample)
 
-    return _extract_using_masks_from_file(file, masks, extent, "unknown", upsample_coords)
+    return _extract_using_masks_from_file(file, masks, extent, upsample_index)
 
 
 def query_files(
@@ -174,39 +236,193 @@ def query_files(
         identified by the indexes in the `geodata` GeoDataFrame.
     """
 
-    # Figure out the extent of first clip
-    if geodata.crs != CRS("EPSG:4326"):
-        geodata["geometry"] = geodata["geometry"].buffer(0.001)
-        blob = geodata.dissolve().simplify(tolerance=50)
-    else:
-        blob = geodata.dissolve()
-
-    geo_blob = blob.to_crs("4326")
-    all_bounds = geo_blob.bounds
-    extent = Extent(
-        (all_bounds.miny[0], all_bounds.maxy[0]),
-        (all_bounds.minx[0], all_bounds.maxx[0]),
-    )
-
-    # Reproject the geodatabase and create a mapping of identifier: polygon
-    geodata_reproj = geodata.to_crs("4326")
-    translated_polygons = {k: translate(geo.geometry, xoff=360) for k, geo in geodata_reproj.iterrows()}
+    # Figure out the extent of first clip and the polygons
+    extent, translated_polygons = _prepare_polygons(geodata)
 
-    # Generate masks using the first file
-    masks, upsample_coords = _calculate_masks_and_coords(files[0], translated_polygons, extent, upsample)
+    # Generate masks using the grid of the first file
+    masks, upsample_index = _calculate_masks_and_index(files[0], translated_polygons, extent, upsample)
 
     # Query all GRIB files
     with Pool() as pool:
         query = pool.starmap(
             _extract_using_masks_from_file,
-            [(f, masks, extent, "unknown", upsample_coords) for f in files],
+            [(f, masks, extent, upsample_index) for f in files],
         )
 
-    df = pd.DataFrame([{"timestamp": timestamp, **values} for timestamp, values in query])
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True)
-    df.set_index("timestamp", inplace=True)
+    return _to_dataframe(query)
 
-    return df
+
+def query_timerange(
+    geodata: gpd.GeoDataFrame,
+    initial_datetime: str | DatetimeLike,
+    end_datetime: str | DatetimeLike,
+    frequency: str | TimedeltaLike = pd.Timedelta(minutes=10),
+    data_type: MRMSDataType = "precip_rate",
+    upsample: bool = False,
+    persist_to: PathLike | None = None,
+    **fetch_kwargs,
+) -> pd.DataFrame:
+    """
+    Downloads and extracts polygon values for a time range in a single pass. Files that are
+    not stored yet are decompressed and decoded in memory as they are downloaded, so full
+    CONUS files are never written to disk.
+
+    Parameters
+    ----------
+    geodata : gpd.GeoDataFrame
+        Geopandas dataframe of polygons to extract the value from.
+    initial_datetime, end_datetime, frequency, data_type
+        Time range to query. Same as in `fetch.timerange`.
+    upsample : bool = False
+        Whether to upsample the data to a finer grid, by default False.
+    persist_to : PathLike | None = None
+        If given, a regional clip of each file covering the polygons is stored as a `.grib2`
+        file in this folder.
+    **fetch_kwargs
+        Other arguments for `fetch.stream_timerange`, e.g. `max_workers` or `verbose`.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    extent, translated_polygons = _prepare_polygons(geodata)
+
+    fields = _stream.iter_fields(
+        initial_datetime, end_datetime, extent, frequency, data_type, persist_to, **fetch_kwargs
+    )
+
+    query = []
+    masks = upsample_index = None
+
+    for field in fields:
+        # Generate masks using the grid of the first field
+        if masks is None:
+            masks, upsample_index = _masks_and_index(field.grid, translated_polygons, extent, upsample)
+
+        query.append(_extract_using_masks(field, masks, extent, upsample_index))
+
+    if not query:
+        raise ValueError("No files found in the time range")
+
+    return _to_dataframe(query).sort_index()
+
+
+def _mask_weights(
+    masks: dict[str, np.ndarray],
+    upsample_index: UpsampleIndex | None,
+    shape: tuple[int, int],
+) -> dict[str, np.ndarray]:
+    """Number of cells of each mask, upsampled or not, that fall on each cell of a window."""
+    if upsample_index is None:
+        return {k: mask.astype(float) for k, mask in masks.items()}
+
+    weights = {}
+
+    for k, mask in masks.items():
+        weights[k] = np.zeros(shape)
+        np.add.at(weights[k], np.ix_(*upsample_index), mask)
+
+    return weights
+
+
+def query_cube(
+    store: PathLike,
+    geodata: gpd.GeoDataFrame,
+    initial_datetime: str | DatetimeLike | None = None,
+    end_datetime: str | DatetimeLike | None = None,
+    upsample: bool = False,
+) -> pd.DataFrame:
+    """
+    Extracts polygon values from a cube written by `cube.ingest`. Only the chunks covering
+    the polygons are read, one time chunk at a time.
+
+    Parameters
+    ----------
+    store : PathLike
+        Path to the cube.
+    geodata : gpd.GeoDataFrame
+        Geopandas dataframe of polygons to extract the value from.
+    initial_datetime, end_datetime : str | DatetimeLike | None = None
+        Time range to extract, both ends included. If None, from the start or to the end
+        of the cube.
+    upsample : bool = False
+        Whether to upsample the data to a finer grid, by default False.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    extent, translated_polygons = _prepare_polygons(geodata)
+
+    grid = cube.read_grid(store)
+    rows, cols = grid.window(extent)
+    masks, upsample_index = _masks_and_index(grid, translated_polygons, extent, upsample)
+
+    # The mean over the cells of a mask is a weighted mean over the cells of the window
+    weights = _mask_weights(masks, upsample_index, (rows.stop - rows.start, cols.stop - cols.start))
+    data = {k: [] for k in weights}
+
+    ds, quantization = cube._open_encoded(store)
+
+    with ds:
+        da = ds[cube.VARIABLE].sel(time=slice(initial_datetime, end_datetime)).isel(latitude=rows, longitude=cols)
+        step = da.encoding.get("chunks", (720,))[0]
+
+        for start in range(0, da.sizes["time"], step):
+            values = cube._read_values(da.isel(time=slice(start, start + step)), quantization)
+
+            # Mask out no data (-3 for precipitation data)
+            valid = (values != -3) & ~np.isnan(values)
+            values = np.where(valid, values, 0)
+
+            with np.errstate(invalid="ignore"):
+                for k, w in weights.items():
+                    data[k].append(np.tensordot(values, w, axes=2) / np.tensordot(valid, w, axes=2))
+
+        times = pd.to_datetime(da.time.values, utc=True)
+
+    # Built as in `_to_dataframe`, so the columns are the same as when querying the files
+    df = pd.DataFrame({"timestamp": times, **{k: np.concatenate(v) if v else [] for k, v in data.items()}})
+    return df.set_index("timestamp")
+
+
+def query_sparse(
+    frames: sparse.SparseFrames,
+    geodata: gpd.GeoDataFrame,
+    upsample: bool = False,
+) -> pd.DataFrame:
+    """
+    Extracts polygon values from sparse frames, e.g., from `sparse.ingest`. Only the window
+    covering the polygons is made dense, one frame at a time.
+
+    Parameters
+    ----------
+    frames : sparse.SparseFrames
+        Frames to extract the polygon values from.
+    geodata : gpd.GeoDataFrame
+        Geopandas dataframe of polygons to extract the value from.
+    upsample : bool = False
+        Whether to upsample the data to a finer grid, by default False.
+
+    Returns
+    -------
+    pd.Dataframe
+        Pandas dataframe with the extracted values. Rows are indexed by timestamp, columns are
+        identified by the indexes in the `geodata` GeoDataFrame.
+    """
+    extent, translated_polygons = _prepare_polygons(geodata)
+    masks, upsample_index = _masks_and_index(frames.grid, translated_polygons, extent, upsample)
+
+    query = [_extract_using_masks(frames.field(i, extent), masks, extent, upsample_index) for i in range(len(frames))]
+
+    if not query:
+        raise ValueError("No frames to query")
+
+    return _to_dataframe(query)
 
 
-__all__ = ["query_single_file", "query_files"]
+__all__ = ["query_single_file", "query_files", "query_timerange", "query_cube", "query_sparse"]
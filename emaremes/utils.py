@@ -1,11 +1,21 @@
 import gzip
+import zlib
 import functools
+import threading
+import warnings
 from os import PathLike
 
 from dataclasses import dataclass
+from shutil import copyfileobj
 from tempfile import NamedTemporaryFile
 from pathlib import Path
-from typing import Callable, Concatenate
+from typing import Callable, Concatenate, Iterable, Literal
+
+import pandas as pd
+
+from . import cache
+from .catalog import Catalog
+from .typing_utils import MRMSDataType
 
 __all__ = [
     "Extent",
@@ -13,6 +23,7 @@ __all__ = [
     "PRECIP_FLAGS",
     "PRECIP_FLAGS_COLORS",
     "STATE_BOUNDS",
+    "is_valid_grib",
     "unzip_if_gz",
 ]
 
@@ -220,6 +231,41 @@ def remove_idx_files(f: Path) -> None:
         idx_file.unlink()
 
 
+def is_valid_grib(f: PathLike) -> bool:
+    """
+    Checks that a file holds complete GRIB data. Gzipped files are fully decompressed
+    so their CRC and length trailer are verified. The GRIB data must start with the
+    `GRIB` indicator and end with the `7777` end marker.
+
+    Parameters
+    ----------
+    f : PathLike
+        Path to a `.grib2` or `.grib2.gz` file.
+
+    Returns
+    -------
+    bool
+        Whether the file is complete.
+    """
+    f = Path(f)
+    opener = gzip.open if f.suffix == ".gz" or f.name.endswith(".gz.part") else open
+
+    try:
+        with opener(f, "rb") as fin:
+            if fin.read(4) != b"GRIB":
+                return False
+
+            tail = b""
+            while chunk := fin.read(1 << 20):
+                tail = (tail + chunk)[-4:]
+
+    except (OSError, EOFError, zlib.error):
+        # Truncated streams raise EOFError, bad CRC or length raise gzip.BadGzipFile
+        return False
+
+    return tail == b"7777"
+
+
 def unzip_if_gz[**P, R](func: Callable[Concatenate[PathLike, P], R]) -> Callable[Concatenate[Path, P], R]:
     @functools.wraps(func)
     def wrapped(f: PathLike, *args: P.args, **kwargs: P.kwargs):
@@ -233,10 +279,15 @@ def unzip_if_gz[**P, R](func: Callable[Concatenate[PathLike, P], R]) -> Callable
             prefix = f.stem.partition("_00.00_")[0]
             assert prefix in DATA_NAMES.values(), "Invalid prefix"
 
+            # Reuse the copy in the decompressed-file cache, if enabled (see `mrms.cache`)
+            if (cached := cache.decompressed(f)) is not None:
+                return func(cached, *args, **kwargs)
+
+            # Only for readers that need a path, e.g. cfgrib. `grib.read` decodes from memory.
             with gzip.open(f, "rb") as gzip_file_in:
-                with NamedTemporaryFile("ab+", prefix=f"{prefix}_", suffix=".grib2") as tf:
-                    unzipped_bytes = gzip_file_in.read()
-                    tf.write(unzipped_bytes)
+                with NamedTemporaryFile("wb+", prefix=f"{prefix}_", suffix=".grib2") as tf:
+                    copyfileobj(gzip_file_in, tf, 1 << 20)
+                    tf.flush()
                     return func(Path(tf.name), *args, **kwargs)
 
         raise ValueError("File is not `.gz` nor `.grib2`")
@@ -245,10 +296,14 @@ def unzip_if_gz[**P, R](func: Callable[Concatenate[PathLike, P], R]) -> Callable
 
 
 class _PathConfig:
-    def __init__(self) -> None:
-        self._defaultpath: Path = Path.home() / "emaremes"
+    def __init__(self, default_path: PathLike | None = None) -> None:
+        self._defaultpath: Path = Path(default_path) if default_path else Path.home() / "emaremes"
         self._allpaths: set[Path] = {self._defaultpath}
         self._preferedpath: Path = self._defaultpath
+        self._catalogs: dict[Path, Catalog] = {}
+        self._catalogs_lock = threading.Lock()
+        self._quotas: dict[Path, tuple[int, str]] = {}
+        self._pins: list[tuple[str | None, pd.Timestamp, pd.Timestamp]] = []
 
         if not self._defaultpath.exists():
             self._defaultpath.mkdir()
@@ -306,6 +361,274 @@ class _PathConfig:
     def prefered_path(self) -> Path:
         return self._preferedpath
 
+    @property
+    def ordered_paths(self) -> list[Path]:
+        """All paths, starting with the prefered one."""
+        return [self.prefered_path, *(self.all_paths - {self.prefered_path})]
+
+    def catalog(self, path: PathLike) -> Catalog:
+        """Catalog of the files stored in one of the paths. It is built on first use.
+
+        Parameters
+        ----------
+        path : PathLike
+            One of the paths in `all_paths`.
+        """
+
+        path = Path(path)
+
+        if path not in self.all_paths:
+            raise ValueError(f"{path} is not a path to store Gribfiles.")
+
+        # Downloads run in several threads, and a catalog must only be built once
+        with self._catalogs_lock:
+            if path not in self._catalogs:
+                self._catalogs[path] = Catalog(path)
+
+            return self._catalogs[path]
+
+    def register(self, file: PathLike) -> None:
+        """Add a file stored in `root/YYYYMMDD/` to the catalog of its root.
+
+        Parameters
+        ----------
+        file : PathLike
+            Path to a Gribfile.
+        """
+
+        file = Path(file)
+        self.catalog(file.parent.parent).add(file)
+
+    def locate(self, product: str, t: pd.Timestamp) -> Path | None:
+        """Find a file in the catalogs. Paths are searched starting by the prefered one.
+
+        Parameters
+        ----------
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        t : pd.Timestamp
+            Timestamp of the file.
+
+        Returns
+        -------
+        Path | None
+            Path to the file, or None if it is not in any of the catalogs.
+        """
+
+        return self.query(product, t, t).get(t)
+
+    def query(self, product: str, start: pd.Timestamp, end: pd.Timestamp) -> dict[pd.Timestamp, Path]:
+        """Find all files of a product within a time range with one query per path.
+
+        Parameters
+        ----------
+        product : str
+            MRMS product name, e.g. "PrecipRate".
+        start, end : pd.Timestamp
+            Time range to query (both ends included).
+
+        Returns
+        -------
+        dict[pd.Timestamp, Path]
+            Mapping of timestamps to file paths. Files in the prefered path take priority.
+        """
+
+        found: dict[pd.Timestamp, Path] = {}
+
+        for root in reversed(self.ordered_paths):
+            found.update(self.catalog(root).query(product, start, end))
+
+        return found
+
+    def rescan(self, path: PathLike | None = None) -> int:
+        """Rebuild the catalog of a path by listing its files. Use this after adding or
+        removing files by hand.
+
+        Parameters
+        ----------
+        path : PathLike | None = None
+            Path to rescan. If None, all paths are rescanned.
+
+        Returns
+        -------
+        int
+            Number of files found.
+        """
+
+        paths = self.all_paths if path is None else {Path(path)}
+        return sum(self.catalog(p).rescan() for p in paths)
+
+    def touch(self, files: Iterable[PathLike]) -> None:
+        """Mark files stored in `root/YYYYMMDD/` as accessed now.
+
+        Parameters
+        ----------
+        files : Iterable[PathLike]
+            Paths to Gribfiles.
+        """
+
+        by_root: dict[Path, list[Path]] = {}
+
+        for f in map(Path, files):
+            by_root.setdefault(f.parent.parent, []).append(f)
+
+        for root, paths in by_root.items():
+            if root in self.all_paths:
+                self.catalog(root).touch(paths)
+
+    def set_quota(
+        self,
+        path: PathLike,
+        max_bytes: int | None,
+        policy: Literal["lru", "oldest"] = "lru",
+    ) -> None:
+        """Limit the size of the files stored in a path. When new files are downloaded
+        into a path over its quota, stored files are deleted until it fits again.
+
+        Parameters
+        ----------
+        path : PathLike
+            One of the paths in `all_paths`.
+        max_bytes : int | None
+            Maximum size in bytes of the stored files. If None, the quota is removed.
+        policy : Literal["lru", "oldest"] = "lru"
+            Which files to delete first: the least recently accessed ("lru") or the ones
+            with the oldest timestamps ("oldest"). Pinned files are never deleted.
+        """
+
+        path = Path(path)
+
+        if path not in self.all_paths:
+            raise ValueError(f"{path} is not a path to store Gribfiles.")
+
+        if max_bytes is None:
+            self._quotas.pop(path, None)
+            return
+
+        if max_bytes <= 0:
+            raise ValueError("`max_bytes` must be positive.")
+
+        if policy not in ("lru", "oldest"):
+            raise ValueError(f"Unknown eviction policy {policy!r}. Use 'lru' or 'oldest'.")
+
+        self._quotas[path] = (int(max_bytes), policy)
+
+    @property
+    def quotas(self) -> dict[Path, tuple[int, str]]:
+        """Quota in bytes and eviction policy of each path with a quota."""
+        return dict(self._quotas)
+
+    def pin(
+        self,
+        start: str | pd.Timestamp,
+        end: str | pd.Timestamp,
+        data_type: MRMSDataType | None = None,
+    ) -> None:
+        """Protect the files within a time range from being deleted to fit a quota.
+
+        Parameters
+        ----------
+        start, end : str | pd.Timestamp
+            Time range to pin (both ends included).
+        data_type : MRMSDataType | None = None
+            Only pin the files of this type of data. If None, files of all types are pinned.
+        """
+
+        product = DATA_NAMES[data_type] if data_type is not None else None
+        self._pins.append((product, pd.Timestamp(start), pd.Timestamp(end)))
+
+    def unpin(
+        self,
+        start: str | pd.Timestamp | None = None,
+        end: str | pd.Timestamp | None = None,
+        data_type: MRMSDataType | None = None,
+    ) -> None:
+        """Remove pins added with `pin`. Without arguments, all pins are removed.
+
+        Parameters
+        ----------
+        start, end : str | pd.Timestamp | None = None
+            Time range of the pin to remove, as given to `pin`.
+        data_type : MRMSDataType | None = None
+            Type of data of the pin to remove, as given to `pin`.
+        """
+
+        if start is None and end is None:
+            self._pins.clear()
+            return
+
+        product = DATA_NAMES[data_type] if data_type is not None else None
+        self._pins.remove((product, pd.Timestamp(start), pd.Timestamp(end)))
+
+    @property
+    def pins(self) -> list[tuple[str | None, pd.Timestamp, pd.Timestamp]]:
+        """Pinned time ranges as (product name or None, start, end)."""
+        return list(self._pins)
+
+    def is_pinned(self, product: str, t: pd.Timestamp) -> bool:
+        """Whether a file is protected by a pin."""
+
+        return any((p is None or p == product) and start <= t <= end for p, start, end in self._pins)
+
+    def enforce_quota(self, path: PathLike | None = None, keep: Iterable[PathLike] = ()) -> list[Path]:
+        """Delete stored files until the paths fit their quotas.
+
+        Parameters
+        ----------
+        path : PathLike | None = None
+            Path to enforce the quota of. If None, all paths with a quota are checked.
+        keep : Iterable[PathLike] = ()
+            Files that must not be deleted, besides the pinned ones, e.g. the files
+            being used right now. A set is used as is, so it must hold `Path`s.
+
+        Returns
+        -------
+        list[Path]
+            Deleted files.
+        """
+
+        paths = self._quotas.keys() if path is None else {Path(path)} & self._quotas.keys()
+
+        if not paths:
+            return []
+
+        if not isinstance(keep, (set, frozenset)):
+            keep = {Path(f) for f in keep}
+
+        evicted: list[Path] = []
+
+        for root in list(paths):
+            max_bytes, policy = self._quotas[root]
+            catalog = self.catalog(root)
+
+            if (usage := catalog.usage()) <= max_bytes:
+                continue
+
+            removed: list[Path] = []
+
+            for product, t, f, size in catalog.eviction_order(policy):
+                if usage <= max_bytes:
+                    break
+
+                if f in keep or self.is_pinned(product, t):
+                    continue
+
+                f.unlink(missing_ok=True)
+                removed.append(f)
+                usage -= size
+
+            catalog.remove(removed)
+            evicted.extend(removed)
+
+            if usage > max_bytes:
+                warnings.warn(
+                    f"{root} is over its quota of {max_bytes / 1e6:.1f} MB "
+                    "but the rest of its files are pinned or in use.",
+                    stacklevel=2,
+                )
+
+        return evicted
+
     def __repr__(self) -> str:
         return str(self)
 
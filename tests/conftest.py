@@ -0,0 +1,156 @@
+import gzip
+import os
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import emaremes as mrms
+from emaremes.utils import DATA_NAMES, _PathConfig
+
+
+# Regional grid used for synthetic MRMS files. It covers 35.015-37.005N, 84.995-82.005W
+GRID = dict(lat0=37.005, lon0=275.005, nlat=200, nlon=300, step=0.01)
+
+
+def synthetic_values(t: pd.Timestamp) -> np.ndarray:
+    """Deterministic field for a timestamp. The first rows have no data (-3)."""
+    rows, cols = np.indices((GRID["nlat"], GRID["nlon"]))
+    values = ((rows + 2 * cols + pd.Timestamp(t).minute) % 50) * 0.5
+    values[:10] = -3
+    return values
+
+
+def make_message(t: str | pd.Timestamp, values: np.ndarray | None = None, data_type: str = "precip_rate") -> bytes:
+    """Encode a GRIB2 message laid out like an MRMS file, with PNG packing."""
+    import eccodes
+
+    t = pd.Timestamp(t)
+    values = synthetic_values(t) if values is None else values
+    nlat, nlon = values.shape
+    step = GRID["step"]
+    category, number = {"precip_rate": (6, 1), "precip_flag": (6, 2)}.get(data_type, (6, 37))
+
+    handle = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+
+    try:
+        for key, value in {
+            "discipline": 209,
+            "parameterCategory": category,
+            "parameterNumber": number,
+            "dataDate": int(t.strftime(r"%Y%m%d")),
+            "dataTime": int(t.strftime(r"%H%M")),
+            "Ni": nlon,
+            "Nj": nlat,
+            "latitudeOfFirstGridPointInDegrees": GRID["lat0"],
+            "longitudeOfFirstGridPointInDegrees": GRID["lon0"],
+            "latitudeOfLastGridPointInDegrees": GRID["lat0"] - step * (nlat - 1),
+            "longitudeOfLastGridPointInDegrees": GRID["lon0"] + step * (nlon - 1),
+            "iDirectionIncrementInDegrees": step,
+            "jDirectionIncrementInDegrees": step,
+        }.items():
+            eccodes.codes_set(handle, key, value)
+
+        eccodes.codes_set_string(handle, "packingType", "grid_png")
+        eccodes.codes_set(handle, "decimalScaleFactor", 1)
+        eccodes.codes_set(handle, "bitsPerValue", 16)
+        eccodes.codes_set_values(handle, values.ravel().astype(float))
+        return eccodes.codes_get_message(handle)
+
+    finally:
+        eccodes.codes_release(handle)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args) -> None:
+        pass
+
+
+class LocalArchive:
+    """Stand-in for the MRMS archive served from a local folder."""
+
+    def __init__(self, root: Path, url: str) -> None:
+        self.root = root
+        self.url = url
+        self.requests: list[str] = []
+        self.ranges: list[str | None] = []
+        self.failures: dict[str, list[int]] = {}
+
+    def add(self, t: str | pd.Timestamp, data_type: str = "precip_rate", payload: bytes | None = None) -> Path:
+        """Place a fake gzipped GRIB file in the archive and return its path."""
+        t = pd.Timestamp(t)
+        name = DATA_NAMES[data_type]
+        folder = self.root / t.strftime(r"%Y/%m/%d") / "mrms" / "ncep" / name
+        folder.mkdir(parents=True, exist_ok=True)
+
+        if payload is None:
+            payload = b"GRIB" + os.urandom(4096) + b"7777"
+
+        path = folder / f"{name}_00.00_{t.strftime(r'%Y%m%d-%H%M%S')}.grib2.gz"
+        path.write_bytes(gzip.compress(payload))
+        return path
+
+    def add_field(self, t: str | pd.Timestamp, data_type: str = "precip_rate") -> Path:
+        """Place a synthetic MRMS file with `synthetic_values` in the archive."""
+        return self.add(t, data_type, make_message(t, data_type=data_type))
+
+
+@pytest.fixture
+def local_archive(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Serve a temporary folder over HTTP and point `emaremes.fetch` to it."""
+    root = tmp_path / "archive"
+    root.mkdir()
+
+    # Keep the files of the stand-in archive away from the rest of the tests
+    monkeypatch.setattr(mrms.fetch, "path_config", _PathConfig(tmp_path / "store"))
+
+    archive = LocalArchive(root, "")
+
+    class _Handler(_QuietHandler):
+        def do_GET(self) -> None:
+            archive.requests.append(self.path)
+            archive.ranges.append(byte_range := self.headers.get("Range"))
+
+            # Errors to answer with before serving a file, e.g. to test retries
+            if statuses := archive.failures.get(Path(self.path).name):
+                self.send_response(status := statuses.pop(0))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            file = root / self.path.lstrip("/")
+            if not byte_range or not file.is_file():
+                return super().do_GET()
+
+            # Minimal support for `Range: bytes=N-` requests
+            content = file.read_bytes()
+            start = int(byte_range.removeprefix("bytes=").rstrip("-"))
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(content)}")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(content) - 1}/{len(content)}")
+            self.send_header("Content-Length", str(len(content) - start))
+            self.end_headers()
+            self.wfile.write(content[start:])
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_Handler, directory=str(root)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    archive.url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(mrms.fetch, "_BASE_URL", archive.url)
+
+    yield archive
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,91 @@
+import gzip
+
+import numpy as np
+import pytest
+
+import emaremes as mrms
+
+from conftest import make_message
+
+
+@pytest.fixture
+def grib_cache(tmp_path):
+    mrms.cache.enable(tmp_path / "cache", max_bytes=1)
+    yield tmp_path / "cache"
+    mrms.cache.disable()
+
+
+def test_cache(grib_cache, tmp_path):
+    message = make_message("2024-10-08T12:00:00")
+    files = []
+
+    for minute in (0, 2):
+        f = tmp_path / f"PrecipRate_00.00_20241008-120{minute}00.grib2.gz"
+        f.write_bytes(gzip.compress(message))
+        files.append(f)
+
+    # Files are decompressed once and reused
+    entry = mrms.cache.decompressed(files[0])
+    assert entry.read_bytes() == message
+    assert entry.name.startswith("PrecipRate_00.00_20241008-120000.")
+    assert mrms.cache.decompressed(files[0]) == entry
+    assert mrms.utils.unzip_if_gz(lambda f: f)(files[0]) == entry
+
+    field = mrms.grib.read(files[0])
+    assert field.values.shape == mrms.grib.decode(message).values.shape
+
+    # A file replaced on disk gets a new entry
+    files[0].write_bytes(gzip.compress(message, compresslevel=1))
+    assert mrms.cache.decompressed(files[0]) != entry
+
+    # Over the quota, only the most recent entry is kept
+    latest = mrms.cache.decompressed(files[1])
+    assert [p.name for p in grib_cache.glob("*.grib2")] == [latest.name]
+    assert mrms.cache.usage() == len(message)
+
+    mrms.cache.clear()
+    assert mrms.cache.usage() == 0
+
+    mrms.cache.disable()
+    assert mrms.cache.decompressed(files[1]) is None
+
+
+def test_index_path(grib_cache, tmp_path):
+    import xarray as xr
+
+    f = tmp_path / "PrecipRate_00.00_20241008-120000.grib2"
+    f.write_bytes(make_message("2024-10-08T12:00:00"))
+
+    def load():
+        kwargs = {"indexpath": mrms.cache.index_path(f)}
+        return xr.load_dataset(f, engine="cfgrib", decode_timedelta=False, backend_kwargs=kwargs)
+
+    # Indexes are written to the cache, not next to the file, and reused
+    load()
+    (index,) = (grib_cache / "indexes").glob("*.idx")
+    assert not list(tmp_path.glob("*.idx"))
+
+    mtime = index.stat().st_mtime_ns
+    load()
+    assert index.stat().st_mtime_ns == mtime
+    assert mrms.cache.prune_indexes() == 0
+
+    # A file replaced on disk gets a new index, and the old one is pruned
+    f.write_bytes(make_message("2024-10-08T12:02:00"))
+    assert load().time.values == np.datetime64("2024-10-08T12:02:00", "ns")
+    assert len(list((grib_cache / "indexes").glob("*.idx"))) == 2
+
+    assert mrms.cache.prune_indexes() == 1
+    assert not index.exists()
+    assert len(list((grib_cache / "indexes").glob("*.idx"))) == 1
+
+
+def test_index_of_cached_entry(grib_cache, tmp_path):
+    f = tmp_path / "PrecipRate_00.00_20241008-120000.grib2.gz"
+    f.write_bytes(gzip.compress(make_message("2024-10-08T12:00:00")))
+
+    # Hits on the cache do not change the key of the index of the entry
+    for _ in range(3):
+        mrms.utils.unzip_if_gz(mrms.grib._cfgrib_load)(f, True)
+
+    assert len(list((grib_cache / "indexes").glob("*.idx"))) == 1
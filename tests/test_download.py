@@ -1,6 +1,10 @@
+import queue
+import threading
+import numpy as np
 import pandas as pd
 import pytest
 import emaremes as mrms
+from pathlib import Path
 from typing import get_args
 
 
@@ -57,3 +61,355 @@ def test_download_range(tmp_path):
     gfiles = mrms.fetch.timerange(init_tstamp, end_tstamp)
     for gf in gfiles:
         assert gf.exists()
+
+
+def test_downloader_local_archive(local_archive):
+    times = pd.date_range("2024-09-27T12:00:00", "2024-09-27T12:20:00", freq="2min")
+    for t in times:
+        local_archive.add(t)
+
+    with mrms.fetch.Downloader(max_workers=4) as dl:
+        files = mrms.fetch.timerange(times[0], times[-1], frequency="2min", downloader=dl)
+        assert dl._session is not None
+
+    assert len(files) == len(times)
+    assert all(f.exists() for f in files)
+    assert len(local_archive.requests) == len(times) + 1  # One for the archive listing
+
+
+def test_resume_and_verify(local_archive):
+    tstamp = pd.Timestamp("2024-09-28T12:00:00")
+    source = local_archive.add(tstamp)
+
+    # Leave half of the file from an "interrupted" download
+    gfile = mrms.fetch._GribFile(tstamp)
+    gfile.subdir.mkdir(parents=True, exist_ok=True)
+    content = source.read_bytes()
+    gfile.part_path.write_bytes(content[: len(content) // 2])
+
+    assert mrms.fetch._single_file(gfile)
+    assert local_archive.ranges[-1] == f"bytes={len(content) // 2}-"
+    assert gfile.path.read_bytes() == content
+    assert not gfile.part_path.exists()
+
+    # A truncated file in the archive is never moved into place
+    tstamp = pd.Timestamp("2024-09-28T12:02:00")
+    local_archive.add(tstamp, payload=b"GRIB" + bytes(4096))
+    gfile = mrms.fetch._GribFile(tstamp)
+    assert not mrms.fetch._single_file(gfile)
+    assert not gfile.exists()
+    assert not gfile.part_path.exists()
+
+
+def test_catalog(local_archive):
+    times = pd.date_range("2024-09-29T12:00:00", "2024-09-29T12:10:00", freq="2min")
+    for t in times:
+        local_archive.add(t)
+
+    files = mrms.fetch.timerange(times[0], times[-1], frequency="2min")
+    catalog = mrms.fetch.path_config.catalog(mrms.fetch.path_config.prefered_path)
+    assert len(catalog.query("PrecipRate", times[0], times[-1])) == len(times)
+
+    # Files already in the catalog are not requested again
+    n_requests = len(local_archive.requests)
+    assert mrms.fetch.timerange(times[0], times[-1], frequency="2min") == files
+    assert len(local_archive.requests) == n_requests
+
+    # Files removed by hand are picked up by a rescan
+    files[0].unlink()
+    assert catalog.rescan() == len(times) - 1
+    assert mrms.fetch.timerange(times[0], times[-1], frequency="2min") == files
+    assert len(local_archive.requests) == n_requests + 1
+
+
+def test_catalog_read_only(local_archive, tmp_path, monkeypatch):
+    times = pd.date_range("2024-09-29T13:00:00", "2024-09-29T13:04:00", freq="2min")
+
+    # A root that cannot be written to gets a catalog in memory, built from its files
+    root = tmp_path / "read_only"
+    for t in times:
+        f = local_archive.add(t)
+        (root / t.strftime("%Y%m%d")).mkdir(parents=True, exist_ok=True)
+        f.rename(root / t.strftime("%Y%m%d") / f.name)
+
+    access = mrms.catalog.os.access
+    monkeypatch.setattr(mrms.catalog.os, "access", lambda p, mode: Path(p) != root and access(p, mode))
+
+    path_config = mrms.fetch.path_config
+    path_config.add_path(root)
+    assert len(path_config.catalog(root)) == len(times)
+    assert not (root / mrms.catalog.CATALOG_NAME).exists()
+    assert path_config.locate("PrecipRate", times[1]).parent.parent == root
+
+    # Catalogs are built once, even when first used from several threads
+    built = []
+    monkeypatch.setattr(mrms.utils, "Catalog", lambda path: built.append(path) or mrms.catalog.Catalog(path))
+    other = tmp_path / "other"
+    path_config.add_path(other)
+
+    threads = [threading.Thread(target=path_config.catalog, args=(other,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert built == [other]
+
+
+def test_archive_listing(local_archive):
+    times = pd.date_range("2024-09-30T12:00:00", "2024-09-30T12:10:00", freq="2min")
+    gap = times[2]
+    for t in times.drop(gap):
+        local_archive.add(t)
+
+    files = mrms.fetch.timerange(times[0], times[-1], frequency="2min")
+    assert len(files) == len(times) - 1
+
+    # One request for the listing and one for each file in the archive
+    assert len(local_archive.requests) == len(times)
+    assert not any(gap.strftime(r"%Y%m%d-%H%M%S") in r for r in local_archive.requests)
+
+    # The gap is known, so rerunning makes no requests
+    assert mrms.fetch.timerange(times[0], times[-1], frequency="2min") == files
+    assert len(local_archive.requests) == len(times)
+
+
+def test_listings_fetched_lazily(local_archive):
+    times = pd.date_range("2024-09-26T23:00:00", "2024-09-29T23:00:00", freq="12h")
+    for t in times:
+        local_archive.add(t)
+
+    def listings() -> list[str]:
+        return [r for r in local_archive.requests if r.endswith("/")]
+
+    # The first files are downloaded before the listings of the later days are requested
+    files = mrms.fetch.iter_timerange(times[0], times[-1], frequency="12h", max_workers=1, order="completion")
+    next(files)
+    assert len(listings()) < 4
+
+    assert len(list(files)) == len(times) - 1
+    assert len(listings()) == 4
+
+
+def test_iter_timerange(local_archive):
+    times = pd.date_range("2024-10-02T12:00:00", "2024-10-02T12:20:00", freq="2min")
+    for t in times.drop(times[3]):
+        local_archive.add(t)
+
+    files = mrms.fetch.iter_timerange(times[0], times[-1], frequency="2min", order="time")
+    assert not isinstance(files, list)
+
+    files = list(files)
+    assert len(files) == len(times) - 1
+    assert files == sorted(files)
+
+    # Files on disk are yielded straight away in completion order
+    n_requests = len(local_archive.requests)
+    first = next(mrms.fetch.iter_timerange(times[0], times[-1], frequency="2min", order="completion"))
+    assert first == files[0]
+    assert len(local_archive.requests) == n_requests
+
+
+def test_retries(local_archive):
+    times = pd.date_range("2024-10-03T12:00:00", "2024-10-03T12:06:00", freq="2min")
+    names = [local_archive.add(t).name for t in times]
+
+    # Transient errors are retried, persistent ones are reported
+    local_archive.failures[names[0]] = [503, 429]
+    local_archive.failures[names[1]] = [500] * 10
+
+    with mrms.fetch.Downloader(retries=2, backoff=0.01, max_requests_per_second=100) as dl:
+        with pytest.warns(UserWarning, match="could not be downloaded"):
+            files = mrms.fetch.timerange(times[0], times[-1], frequency="2min", downloader=dl, use_listing=False)
+
+    assert [f.name.removesuffix(".gz") for f in files] == [n.removesuffix(".gz") for n in names if n != names[1]]
+    assert dl.summary.requested == len(times)
+    assert dl.summary.downloaded == len(times) - 1
+    assert dl.summary.retries == 4
+    assert list(dl.summary.failed) == [names[1]]
+    assert local_archive.failures[names[1]] == [500] * 7
+
+    # Files that are not in the archive are not retried
+    local_archive.add(times[-1] + pd.Timedelta("2min")).unlink()
+    with mrms.fetch.Downloader(retries=2, backoff=0.01) as dl:
+        gfile = mrms.fetch._GribFile(times[-1] + pd.Timedelta("2min"))
+        assert not dl.fetch(gfile)
+
+    assert dl.summary.missing == [gfile.filename]
+    assert dl.summary.retries == 0
+
+    # Other errors are failures, not missing files
+    name = local_archive.add(times[-1] + pd.Timedelta("4min")).name
+    local_archive.failures[name] = [403]
+    with mrms.fetch.Downloader(retries=2, backoff=0.01) as dl:
+        gfile = mrms.fetch._GribFile(times[-1] + pd.Timedelta("4min"))
+        assert not dl.fetch(gfile)
+
+    assert dl.summary.failed == {gfile.filename: "HTTP 403"}
+    assert not dl.summary.missing and dl.summary.retries == 0
+
+    # Messages kept in memory count the bytes received, not the decompressed size
+    t = times[-1] + pd.Timedelta("6min")
+    archived = local_archive.add(t, payload=b"GRIB" + bytes(1 << 16) + b"7777")
+    with mrms.fetch.Downloader() as dl:
+        assert len(dl.fetch_message(mrms.fetch._GribFile(t))) == (1 << 16) + 8
+
+    assert dl.summary.received_bytes == archived.stat().st_size
+
+
+def test_fetch_many_window(local_archive):
+    times = pd.date_range("2024-10-04T14:00:00", "2024-10-04T14:58:00", freq="2min")
+    for t in times:
+        local_archive.add(t)
+
+    taken = []
+
+    def gfiles():
+        for t in times:
+            taken.append(t)
+            yield mrms.fetch._GribFile(t)
+
+    # Files are taken as downloads complete, not all up front
+    with mrms.fetch.Downloader(max_workers=2) as dl:
+        results = dl.fetch_many(gfiles())
+        next(results)
+        assert len(taken) <= 2 * 2 + 1
+
+        assert all(ok for _, ok in results)
+
+    assert len(taken) == dl.summary.requested == dl.summary.downloaded == len(times)
+
+
+def test_quota(local_archive):
+    path_config = mrms.fetch.path_config
+    root = path_config.prefered_path
+
+    times = pd.date_range("2024-10-04T12:00:00", "2024-10-04T12:18:00", freq="2min")
+    for t in times:
+        local_archive.add(t)
+
+    files = mrms.fetch.timerange(times[0], times[4], frequency="2min")
+    size = files[0].stat().st_size
+
+    # Pinned files and the files of the current run are kept
+    path_config.set_quota(root, 6 * size, policy="oldest")
+    path_config.pin(times[1], times[1])
+    files = mrms.fetch.timerange(times[5], times[-1], frequency="2min")
+
+    assert all(f.exists() for f in files)
+    assert path_config.catalog(root).usage() <= 6 * size
+    assert [t for t in times[:5] if path_config.locate("PrecipRate", t)] == [times[1]]
+
+    # With the "lru" policy, files accessed recently are kept
+    path_config.unpin()
+    path_config.set_quota(root, 6 * size, policy="lru")
+    mrms.fetch.timerange(times[5], times[5], frequency="2min")
+    mrms.fetch.timerange(times[0], times[0], frequency="2min")
+
+    assert path_config.locate("PrecipRate", times[5]) is not None
+    assert path_config.locate("PrecipRate", times[0]) is not None
+    assert path_config.locate("PrecipRate", times[1]) is None
+    assert len(path_config.catalog(root)) == 6
+
+
+def test_plan(local_archive):
+    stamps = pd.date_range("2023-12-31T22:00:00", "2024-01-02T02:00:00", freq="2min")
+    plan, inverse = mrms.fetch._plan(stamps.append(stamps[:3]), "precip_rate")
+
+    assert len(plan) == len(stamps)
+    assert (plan.times[inverse[-3:]] == stamps[:3].values).all()
+    assert list(np.unique(plan.days)) == ["20231231", "20240101", "20240102"]
+
+    for i in (0, 61, len(plan) - 1):
+        gfile = mrms.fetch._GribFile(stamps[i])
+        assert plan.urls[i] == gfile.url
+        assert plan.relpaths[i] == f"{gfile.path.parent.name}/{gfile.filename}"
+
+    with pytest.raises(ValueError):
+        mrms.fetch._plan(pd.DatetimeIndex(["2024-01-01T00:01:00"]), "precip_rate")
+
+    plan, _ = mrms.fetch._plan(pd.DatetimeIndex(["2024-01-01T00:30:00", "2024-01-01T00:50:00"]), "precip_accum_1h")
+    assert plan.names.tolist() == ["RadarOnly_QPE_01H_00.00_20240101-000000.grib2.gz"]
+
+
+def test_multiple_data_types(local_archive):
+    times = pd.date_range("2024-10-05T12:00:00", "2024-10-05T12:20:00", freq="2min")
+    for t in times:
+        local_archive.add(t, "precip_rate")
+        if t != times[3]:
+            local_archive.add(t, "precip_flag")
+
+    local_archive.add("2024-10-05T12:00:00", "precip_accum_1h")
+
+    with mrms.fetch.Downloader() as dl:
+        files = mrms.fetch.timerange(
+            times[0],
+            times[-1],
+            frequency="2min",
+            data_type=["precip_rate", "precip_flag", "precip_accum_1h"],
+            downloader=dl,
+        )
+
+    # One request per listing and per file, all through the same downloader
+    assert dl.summary.requested == 2 * len(times)
+    assert len(local_archive.requests) == 3 + 2 * len(times)
+
+    assert isinstance(files, pd.DataFrame)
+    assert list(files.columns) == ["precip_rate", "precip_flag", "precip_accum_1h"]
+    assert (files.index == times).all()
+
+    assert files["precip_rate"].notna().all()
+    assert files["precip_flag"].isna().tolist() == [t == times[3] for t in times]
+    assert files["precip_accum_1h"].nunique() == 1
+    assert files.loc[times[5], "precip_flag"].name == "PrecipFlag_00.00_20241005-121000.grib2.gz"
+
+    # A single type of data still gives a list of paths
+    assert mrms.fetch.timerange(times[0], times[-1], frequency="2min") == files["precip_rate"].tolist()
+
+    # Every type of data is validated
+    with pytest.raises(KeyError):
+        mrms.fetch.timerange(times[0], times[-1], data_type=["precip_rate", "reflectivity"])
+
+
+def test_follow(local_archive):
+    times = pd.date_range("2024-10-06T12:00:00", "2024-10-06T12:12:00", freq="2min")
+    gap = times[2]
+    for t in times.drop(gap):
+        local_archive.add(t)
+
+    ingested = queue.Queue()
+    last = mrms.fetch.follow(ingested, start=times[0], poll_interval=0.01, max_files=len(times) - 1)
+
+    assert last == times[-1]
+    assert [ingested.get_nowait().name for _ in times.drop(gap)] == [
+        mrms.fetch._GribFile(t).filename for t in times.drop(gap)
+    ]
+
+    # The next call carries on after the last file ingested
+    local_archive.add(times[-1] + pd.Timedelta("2min"))
+    n_requests = len(local_archive.requests)
+    paths = []
+    assert mrms.fetch.follow(paths.append, poll_interval=0.01, max_files=1) == times[-1] + pd.Timedelta("2min")
+    assert len(paths) == 1
+    assert len(local_archive.requests) == n_requests + 1
+
+    # Files that keep failing are skipped with a warning, and gaps are stepped over
+    # when the listing has nothing later
+    times = pd.date_range("2024-10-07T12:00:00", "2024-10-07T12:06:00", freq="2min")
+    names = [local_archive.add(t).name for t in times.drop(times[2])]
+    local_archive.failures[names[0]] = [403] * 10
+
+    with pytest.MonkeyPatch.context() as m:
+        m.setattr(mrms.fetch, "_fetch_listing", lambda *args: None)
+
+        with pytest.warns(UserWarning, match="Skipping"):
+            paths = []
+            mrms.fetch.follow(paths.append, start=times[0], poll_interval=0.01, max_retries=2, max_files=2)
+
+    assert [p.name for p in paths] == names[1:]
+    assert len(local_archive.failures[names[0]]) == 7
+
+    # Waiting for a file can be stopped from another thread
+    stop = threading.Event()
+    threading.Timer(0.2, stop.set).start()
+    assert mrms.fetch.follow(paths.append, poll_interval=0.01, gap_timeout="1000days", stop=stop) is None
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+import emaremes as mrms
+
+from conftest import make_message
+
+
+def _repack(message: bytes, packing: str) -> bytes:
+    import eccodes
+
+    handle = eccodes.codes_new_from_message(message)
+    eccodes.codes_set_string(handle, "packingType", packing)
+    message = eccodes.codes_get_message(handle)
+    eccodes.codes_release(handle)
+    return message
+
+
+@pytest.mark.parametrize("packing", ["grid_png", "grid_simple"])
+def test_native_decoder(packing):
+    message = _repack(make_message("2024-10-08T12:34:00"), packing)
+
+    native = mrms.grib.decode(message, engine="native")
+    reference = mrms.grib.decode(message, engine="eccodes")
+
+    assert native.time == reference.time == np.datetime64("2024-10-08T12:34:00", "ns")
+    assert native.values.dtype == np.float32
+    np.testing.assert_array_equal(native.values, reference.values)
+    np.testing.assert_allclose(native.grid.latitudes, reference.grid.latitudes)
+    np.testing.assert_allclose(native.grid.longitudes, reference.grid.longitudes)
+    assert (native.values[:10] == -3).all()
+
+
+def test_unsupported_message():
+    message = _repack(make_message("2024-10-08T12:34:00"), "grid_ccsds")
+
+    with pytest.raises(mrms.grib._UnsupportedMessage):
+        mrms.grib.decode(message, engine="native")
+
+    # Other packings are left to eccodes
+    np.testing.assert_array_equal(
+        mrms.grib.decode(message).values, mrms.grib.decode(make_message("2024-10-08T12:34:00")).values
+    )
+
+
+def test_cfgrib_fallback(tmp_path):
+    import gzip
+
+    messages = [make_message("2024-10-08T12:34:00"), make_message("2024-10-08T12:36:00")]
+
+    # Files with several messages are not decoded as their first field
+    with pytest.raises(ValueError):
+        mrms.grib.decode(messages[0] + messages[1])
+
+    f = tmp_path / "PrecipRate_00.00_20241008-123400.grib2.gz"
+    f.write_bytes(gzip.compress(messages[0] + messages[1]))
+
+    ds = mrms.grib.open_dataset(f)
+    assert ds.sizes["time"] == 2
+    np.testing.assert_array_equal(ds["unknown"].isel(time=1).values, mrms.grib.decode(messages[1]).values)
+
+    # Packed data the native decoder cannot read raise a ValueError
+    message = bytearray(messages[0])
+    message[-200:-4] = bytes(196)
+    with pytest.raises(ValueError):
+        mrms.grib.decode(bytes(message), engine="native")
+
+
+@pytest.mark.parametrize("packing", ["grid_png", "grid_simple"])
+def test_partial_decode(packing):
+    message = _repack(make_message("2024-10-08T12:34:00"), packing)
+    field = mrms.grib.decode(message)
+
+    for extent in (
+        mrms.utils.Extent((35.5, 36.0), (-84.5, -84.0)),
+        mrms.utils.Extent((36.9, 38.0), (-86.0, -84.9)),
+        mrms.utils.Extent((30.0, 40.0), (-90.0, -80.0)),
+    ):
+        expected = field.clip(extent)
+
+        for engine in ("native", "eccodes"):
+            window = mrms.grib.decode(message, engine=engine, extent=extent)
+            assert window.grid == expected.grid
+            np.testing.assert_array_equal(window.values, expected.values)
+
+    with pytest.raises(ValueError):
+        mrms.grib.decode(message, extent=mrms.utils.Extent((40.0, 41.0), (-84.5, -84.0)))
+
+
+def test_grid_index():
+    field = mrms.grib.decode(make_message("2024-10-08T12:34:00"))
+    ds = field.to_dataset()
+    grid = field.grid
+
+    rng = np.random.default_rng(16)
+    lons = rng.uniform(grid.longitudes.min(), grid.longitudes.max(), 200) - 360
+    lats = rng.uniform(grid.latitudes.min(), grid.latitudes.max(), 200)
+
+    # Same cells as a label-based nearest selection
+    for lon, lat in zip(lons, lats):
+        row, col = grid.index(lon, lat)
+        expected = ds.sel(longitude=lon + 360, latitude=lat, method="nearest")
+        assert field.values[row, col] == expected["unknown"].values
+
+    with pytest.raises(ValueError):
+        grid.index(-90.0, 36.0)
+
+    # Same cells as a label-based clip
+    extent = mrms.utils.Extent((35.5, 36.0), (-84.5, -84.0))
+    rows, cols = grid.window(extent)
+    clipped = ds.loc[extent.as_xr_slice()]
+    np.testing.assert_array_equal(field.values[rows, cols], clipped["unknown"].values)
+    np.testing.assert_allclose(grid.subgrid(rows, cols).latitudes, clipped.latitude)
+
+
+def test_quantization():
+    rate = mrms.grib.QUANTIZATION["precip_rate"]
+    values = np.array([-3, 0, 0.1, 12.3, 250.1, -1, 1e4, np.nan], dtype=np.float32)
+
+    stored = rate.encode(values)
+    assert stored.dtype == np.uint16
+    assert stored.tolist() == [65535, 0, 1, 123, 2501, 0, 65534, 65535]
+
+    decoded = rate.decode(stored)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded[:5], values[:5])
+    assert decoded[-1] == -3
+
+    flag = mrms.grib.QUANTIZATION["precip_flag"]
+    flags = np.array([-3, *mrms.utils.PRECIP_FLAGS], dtype=np.float32)
+    assert flag.encode(flags).dtype == np.uint8
+    np.testing.assert_array_equal(flag.decode(flag.encode(flags)), flags)
@@ -0,0 +1,322 @@
+from math import isclose
+
+import numpy as np
+import pytest
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point, Polygon
+
+import emaremes as mrms
+
+from conftest import GRID, synthetic_values
+
+
+def _expected(t: pd.Timestamp, lon: float, lat: float) -> float:
+    row = round((GRID["lat0"] - lat) / GRID["step"])
+    col = round((lon + 360 - GRID["lon0"]) / GRID["step"])
+    return synthetic_values(t)[row, col]
+
+
+def test_point_pipeline(local_archive, tmp_path):
+    times = pd.date_range("2024-10-03T12:00:00", "2024-10-03T12:20:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    geodf = gpd.GeoDataFrame(
+        {"name": ["A", "B"]},
+        geometry=[Point(-84.002, 36.003), Point(-83.503, 35.498)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    clips = tmp_path / "clips"
+    df = mrms.ts.point.query_timerange(geodf, times[0], times[-1], persist_to=clips)
+
+    # Nothing was stored in the data folders
+    assert not list(mrms.fetch.path_config.prefered_path.glob("*/*.gz"))
+
+    assert len(df) == len(times)
+    for t in times:
+        for name, point in geodf.geometry.items():
+            assert isclose(df.loc[t.tz_localize("UTC"), name], _expected(t, point.x, point.y))
+
+    # The clipped files give the same results
+    clipped = sorted(clips.glob("*/*.grib2"))
+    assert len(clipped) == len(times)
+    pd.testing.assert_frame_equal(mrms.ts.point.query_files(clipped, geodf), df, check_freq=False)
+
+
+def test_polygon_pipeline(local_archive):
+    t = pd.Timestamp("2024-10-03T13:00:00")
+    local_archive.add_field(t)
+
+    geodf = gpd.GeoDataFrame(
+        {"name": ["R"]},
+        geometry=[Polygon.from_bounds(-84.5, 35.5, -84.0, 36.0)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    df = mrms.ts.polygon.query_timerange(geodf, t, t)
+
+    lats = GRID["lat0"] - GRID["step"] * np.arange(GRID["nlat"])
+    lons = GRID["lon0"] - 360 + GRID["step"] * np.arange(GRID["nlon"])
+    inside = np.ix_((lats > 35.5) & (lats < 36.0), (lons > -84.5) & (lons < -84.0))
+    assert isclose(df["R"].iloc[0], synthetic_values(t)[inside].mean())
+
+
+def test_open_dataset(local_archive):
+    import xarray as xr
+
+    t = pd.Timestamp("2024-10-07T12:00:00")
+    f = local_archive.add_field(t)
+
+    ds = mrms.grib.open_dataset(f)
+    assert ds["unknown"].dtype == np.float32
+    assert ds.time.values == np.datetime64(t, "ns")
+
+    # Same values and grid as cfgrib, without writing any file
+    def load(g):
+        return xr.load_dataset(g, engine="cfgrib", decode_timedelta=False, backend_kwargs={"indexpath": ""})
+
+    with mrms.utils.unzip_if_gz(load)(f) as expected:
+        np.testing.assert_array_equal(ds["unknown"].values, expected["unknown"].values)
+        np.testing.assert_allclose(ds.latitude, expected.latitude)
+        np.testing.assert_allclose(ds.longitude, expected.longitude)
+
+
+def test_cube(local_archive, tmp_path):
+    pytest.importorskip("zarr")
+    import xarray as xr
+
+    times = pd.date_range("2024-10-08T12:00:00", "2024-10-08T12:50:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    files = mrms.fetch.timerange(times[0], times[-1])
+    extent = mrms.utils.Extent((35.4, 36.2), (-84.6, -83.4))
+    store = tmp_path / "cube.zarr"
+
+    # Written in several time chunks, then extended with the rest of the files
+    mrms.cube.ingest(files[:4], store, extent=extent, time_chunk=3, space_chunk=16)
+    mrms.cube.ingest(files, store, extent=extent, time_chunk=3)
+
+    # Time chunks written in several passes when the fields of a chunk do not fit in memory
+    window = mrms.grib.read_grid(files[0]).window(extent)
+    field_bytes = 4 * (window[0].stop - window[0].start) * (window[1].stop - window[1].start)
+    mrms.cube.ingest(files, tmp_path / "small.zarr", extent=extent, time_chunk=3, max_bytes=2 * field_bytes)
+
+    with mrms.cube.open_cube(store) as ds, mrms.cube.open_cube(tmp_path / "small.zarr") as small:
+        xr.testing.assert_identical(ds, small)
+
+    with mrms.cube.open_cube(store) as ds:
+        assert ds.sizes["time"] == len(times)
+        assert ds["unknown"].encoding["dtype"] == np.uint16
+
+        # Quantized to 0.1 mm/h, with NaN for no data
+        expected = mrms.grib.open_dataset(files[-1], extent=extent)["unknown"].values
+        np.testing.assert_allclose(ds["unknown"].isel(time=-1).values, np.where(expected == -3, np.nan, expected))
+
+    points = gpd.GeoDataFrame(
+        {"name": ["A", "B"]},
+        geometry=[Point(-84.002, 36.003), Point(-83.503, 35.498)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    df = mrms.ts.point.query_cube(store, points, times[1], times[3])
+    pd.testing.assert_frame_equal(df, mrms.ts.point.query_files(files[1:4], points), check_freq=False)
+
+    polygons = gpd.GeoDataFrame(
+        {"name": ["R", "S"]},
+        geometry=[Polygon.from_bounds(-84.5, 35.5, -84.0, 36.0), Polygon.from_bounds(-83.9, 35.6, -83.5, 35.9)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    for upsample in (False, True):
+        df = mrms.ts.polygon.query_cube(store, polygons, upsample=upsample)
+        expected = mrms.ts.polygon.query_files(files, polygons, upsample=upsample)
+        pd.testing.assert_frame_equal(df, expected, check_freq=False, rtol=1e-6)
+
+    # Columns keep the keys of the index, as with the files
+    polygons = polygons.reset_index(drop=True)
+    df = mrms.ts.polygon.query_cube(store, polygons)
+    pd.testing.assert_frame_equal(df, mrms.ts.polygon.query_files(files, polygons), check_freq=False, rtol=1e-6)
+    assert list(df.columns) == [0, 1]
+
+
+def test_pixel_store(local_archive, tmp_path, monkeypatch):
+    times = pd.date_range("2024-10-09T12:00:00", "2024-10-09T12:50:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    files = mrms.fetch.timerange(times[0], times[-1])
+    points = gpd.GeoDataFrame(
+        {"name": ["A", "B", "C"]},
+        geometry=[Point(-84.002, 36.003), Point(-83.503, 35.498), Point(-84.001, 36.004)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    expected = mrms.ts.point.query_files(files, points)
+    store = mrms.pixels.build(files, tmp_path / "pixels", geodata=points, block=4)
+
+    # Points sharing a cell share a pixel
+    assert len(store.rows) == 2
+    assert store.values.dtype == np.uint16
+    pd.testing.assert_series_equal(
+        store.series(-84.002, 36.003), expected["A"], check_names=False, check_freq=False, check_dtype=False
+    )
+
+    with monkeypatch.context() as m:
+        m.setattr(mrms.ts.point, "_gather_from_file", None)
+        df = mrms.ts.point.query_files(files[::-1], points, pixel_store=tmp_path / "pixels")
+        pd.testing.assert_frame_equal(df, expected[::-1], check_freq=False)
+
+    # Points that are not in the store are decoded from the files
+    other = gpd.GeoDataFrame({"name": ["D"]}, geometry=[Point(-83.203, 35.902)], crs="EPSG:4326").set_index("name")
+    df = mrms.ts.point.query_files(files, other, pixel_store=tmp_path / "pixels")
+    assert isclose(df.loc[times[2].tz_localize("UTC"), "D"], _expected(times[2], -83.203, 35.902))
+
+    # Files of another type of data with the same timestamps are not read from the store
+    for t in times:
+        local_archive.add_field(t, "precip_flag")
+
+    flags = mrms.fetch.timerange(times[0], times[-1], data_type="precip_flag")
+    store = mrms.pixels.open_store(tmp_path / "pixels")
+    assert store.data_type == "precip_rate"
+    assert mrms.ts.point._query_pixel_store(store, flags, mrms.ts.point._Points.from_geodata(points)) is None
+
+
+def test_many_points(local_archive):
+    times = pd.date_range("2024-10-11T12:00:00", "2024-10-11T12:20:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    rng = np.random.default_rng(22)
+    lons, lats = rng.uniform(-84.9, -82.1, 2000), rng.uniform(35.1, 36.9, 2000)
+    geodf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lons, lats), crs="EPSG:4326")
+
+    files = mrms.fetch.timerange(times[0], times[-1])
+    df = mrms.ts.point.query_files(files, geodf)
+
+    assert df.shape == (len(times), len(geodf))
+    for t in times:
+        expected = np.array([_expected(t, x, y) for x, y in zip(lons, lats)])
+        np.testing.assert_array_equal(df.loc[t.tz_localize("UTC")].values, np.where(expected == -3, np.nan, expected))
+
+
+def test_points_located_once(local_archive, monkeypatch):
+    times = pd.date_range("2024-10-11T13:00:00", "2024-10-11T13:20:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    class InlinePool:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+        def starmap(self, func, args):
+            return [func(*a) for a in args]
+
+    calls = []
+    located = mrms.ts.point._Points.located
+    monkeypatch.setattr(mrms.ts.point, "Pool", InlinePool)
+    monkeypatch.setattr(mrms.ts.point._Points, "located", lambda self, grid: calls.append(grid) or located(self, grid))
+
+    # The window decoded from each file is the grid the points were located on
+    geodf = gpd.GeoDataFrame(geometry=[Point(-84.002, 36.003), Point(-83.503, 35.498)], crs="EPSG:4326")
+    for method in ("nearest", "mean"):
+        calls.clear()
+        df = mrms.ts.point.query_files(mrms.fetch.timerange(times[0], times[-1]), geodf, method=method)
+        assert len(df) == len(times) and len(calls) == 1
+
+
+def test_snap_points():
+    step = GRID["step"]
+    grid = mrms.grib.GridDefinition(GRID["nlat"], GRID["nlon"], GRID["lat0"], GRID["lon0"], -step, step)
+    geodf = gpd.GeoDataFrame(
+        {"name": ["A", "B", "C"]},
+        geometry=[Point(-84.002, 36.003), Point(-84.001, 36.004), Point(-83.503, 35.498)],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    snapped = mrms.ts.point.snap_points(geodf, grid)
+    assert snapped.index.equals(geodf.index)
+    assert snapped.loc["A", "cell"] == snapped.loc["B", "cell"] != snapped.loc["C", "cell"]
+    assert isclose(snapped.loc["A", "longitude"], -84.005) and isclose(snapped.loc["A", "latitude"], 36.005)
+
+    # About 111 km per degree of latitude
+    expected = np.hypot(0.002 * np.cos(np.radians(35.5)), 0.003) * 111_195
+    assert isclose(snapped.loc["C", "distance"], expected, rel_tol=1e-3)
+
+    # Points sharing a cell are gathered once
+    points = mrms.ts.point._Points.from_geodata(geodf, grid)
+    assert len(points.rows) == 2
+    t = pd.Timestamp("2024-10-11")
+    field = mrms.grib.GribField(synthetic_values(t), np.datetime64(t), grid)
+    np.testing.assert_array_equal(points.gather(field), [_expected(t, p.x, p.y) for p in geodf.geometry])
+
+
+def test_sampling_methods(local_archive):
+    step = GRID["step"]
+    grid = mrms.grib.GridDefinition(GRID["nlat"], GRID["nlon"], GRID["lat0"], GRID["lon0"], -step, step)
+    t = pd.Timestamp("2024-10-12T12:00:00")
+    values = synthetic_values(t)
+
+    # A point a quarter of a cell from a cell center, and one next to the rows with no data
+    geodf = gpd.GeoDataFrame(
+        {"name": ["A", "B"]}, geometry=[Point(-84.0075, 36.0025), Point(-84.005, 36.905)], crs="EPSG:4326"
+    ).set_index("name")
+    row, col = round((GRID["lat0"] - 36.0025) / step), round((-84.0075 + 360 - GRID["lon0"]) / step)
+
+    window = values[row - 1 : row + 2, col - 1 : col + 2]
+    bilinear = values[row : row + 2, col - 1 : col + 1]
+    weights = np.array([[0.25 * 0.75, 0.75 * 0.75], [0.25 * 0.25, 0.75 * 0.25]])
+
+    field = mrms.grib.GribField(values, np.datetime64(t), grid)
+    methods = ("bilinear", "mean", "max")
+    sample = {m: mrms.ts.point._Points.from_geodata(geodf, grid, m).gather(field) for m in methods}
+
+    assert isclose(sample["bilinear"][0], (bilinear * weights).sum())
+    assert isclose(sample["mean"][0], window.mean()) and sample["max"][0] == window.max()
+
+    # No data is left out of the window
+    row = round((GRID["lat0"] - 36.905) / step)
+    valid = values[row : row + 2, col - 1 : col + 2]
+    assert isclose(sample["mean"][1], valid.mean())
+
+    # Files are sampled with the same tables
+    local_archive.add_field(t)
+    df = mrms.ts.point.query_files(mrms.fetch.timerange(t, t), geodf, method="mean")
+    np.testing.assert_allclose(df.values[0], sample["mean"])
+
+
+def test_polygon_masks():
+    step = GRID["step"]
+    grid = mrms.grib.GridDefinition(GRID["nlat"], GRID["nlon"], GRID["lat0"], GRID["lon0"], -step, step)
+    geodf = gpd.GeoDataFrame(
+        {"name": ["T", "M", "Out"]},
+        geometry=[
+            Polygon([(-84.5, 35.5), (-83.7, 35.6), (-84.1, 36.3)]),
+            Point(-83.3, 36.0).buffer(0.2).union(Point(-83.0, 35.5).buffer(0.1)),
+            Polygon.from_bounds(-80.0, 30.0, -79.0, 31.0),
+        ],
+        crs="EPSG:4326",
+    ).set_index("name")
+
+    _, polygons = mrms.ts.polygon._prepare_polygons(geodf)
+    extent = mrms.utils.Extent((35.0, 36.9), (-84.9, -82.1))
+
+    # Same masks as testing every node with `polygon.contains`
+    for upsample in (False, True):
+        masks, _ = mrms.ts.polygon._masks_and_index(grid, polygons, extent, upsample)
+        window = grid.subgrid(*grid.window(extent))
+        lon, lat = window.longitudes, window.latitudes
+        if upsample:
+            lon = np.linspace(lon.min(), lon.max(), 4 * len(lon) - 1)
+            lat = np.linspace(lat.min(), lat.max(), 4 * len(lat) - 1)
+
+        for k, p in polygons.items():
+            expected = np.array([[p.contains(Point(x, y)) for x in lon] for y in lat])
+            np.testing.assert_array_equal(masks[k], expected)
+
+    assert masks["T"].any() and masks["M"].any() and not masks["Out"].any()
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point, Polygon
+
+import emaremes as mrms
+
+GRID = mrms.grib.GridDefinition(nlat=120, nlon=150, lat0=37.005, lon0=275.005, dlat=-0.01, dlon=0.01)
+
+
+def _fields(n: int = 12) -> list[mrms.grib.GribField]:
+    """Mostly dry fields with a few storms and a varying area with no data."""
+    rng = np.random.default_rng(21)
+    fields = []
+
+    for i in range(n):
+        values = np.where(rng.random(GRID.shape) < 0.05, rng.integers(1, 500, GRID.shape) / 10, 0).astype(np.float32)
+        values[: 5 + i % 3] = -3
+        values[40:60, 100 + i :] = -3
+        fields.append(mrms.grib.GribField(values, np.datetime64("2024-10-10T12:00") + np.timedelta64(10 * i, "m"), GRID))
+
+    return fields
+
+
+def test_sparse_frames(tmp_path):
+    fields = _fields()
+    dense = np.stack([f.values for f in fields])
+    frames = mrms.sparse.from_fields(fields[::-1])
+
+    assert len(frames) == len(fields)
+    assert frames.nbytes < dense.nbytes / 4
+
+    extent = mrms.utils.Extent((36.3, 36.7), (-84.2, -83.7))
+    for i, field in enumerate(fields):
+        assert frames.times[i] == field.time
+        np.testing.assert_array_equal(frames.field(i).values, field.values)
+        np.testing.assert_array_equal(frames.field(i, extent).values, field.clip(extent).values)
+
+    rows, cols = np.array([0, 50, 50, 80, 119]), np.array([0, 120, 99, 3, 149])
+    np.testing.assert_array_equal(frames.points(rows, cols), dense[:, rows, cols])
+
+    loaded = mrms.sparse.load(frames.save(tmp_path / "frames.npz"))
+    np.testing.assert_array_equal(loaded.field(3).values, fields[3].values)
+
+
+def test_aggregate():
+    fields = _fields()
+    dense = np.stack([f.values for f in fields]).reshape(2, 6, *GRID.shape)
+    nodata = (dense == -3).any(axis=1)
+    frames = mrms.sparse.from_fields(fields)
+
+    for how, func in (("sum", np.sum), ("mean", np.mean), ("max", np.max)):
+        hourly = frames.aggregate("1h", how)
+        assert pd.DatetimeIndex(hourly.times).equals(pd.date_range("2024-10-10T12:00", periods=2, freq="1h"))
+
+        expected = np.where(nodata, -3, func(np.maximum(dense, 0), axis=1))
+        for i in range(2):
+            np.testing.assert_allclose(hourly.field(i).values, expected[i], rtol=1e-6)
+
+
+def test_sparse_queries():
+    fields = _fields()
+    frames = mrms.sparse.from_fields(fields)
+
+    points = gpd.GeoDataFrame(
+        {"name": ["A", "B"]}, geometry=[Point(-84.502, 36.503), Point(-83.803, 36.498)], crs="EPSG:4326"
+    ).set_index("name")
+
+    df = mrms.ts.point.query_sparse(frames, points)
+    for name, point in points.geometry.items():
+        row, col = GRID.index(point.x, point.y)
+        expected = [f.values[row, col] for f in fields]
+        np.testing.assert_array_equal(df[name].values, np.where(np.equal(expected, -3), np.nan, expected))
+
+    polygons = gpd.GeoDataFrame(
+        {"name": ["R"]}, geometry=[Polygon.from_bounds(-84.5, 36.2, -83.9, 36.6)], crs="EPSG:4326"
+    ).set_index("name")
+
+    df = mrms.ts.polygon.query_sparse(frames, polygons)
+    extent, translated = mrms.ts.polygon._prepare_polygons(polygons)
+    masks, index = mrms.ts.polygon._masks_and_index(GRID, translated, extent, upsample=False)
+    expected = [mrms.ts.polygon._extract_using_masks(f, masks, extent, index)[1]["R"] for f in fields]
+    np.testing.assert_allclose(df["R"].values, expected)
+
+
+def test_ingest(local_archive):
+    times = pd.date_range("2024-10-10T12:00:00", "2024-10-10T12:30:00", freq="10min")
+    for t in times:
+        local_archive.add_field(t)
+
+    files = mrms.fetch.timerange(times[0], times[-1])
+    extent = mrms.utils.Extent((35.4, 36.2), (-84.6, -83.4))
+    frames = mrms.sparse.ingest(files[::-1], extent)
+
+    assert pd.DatetimeIndex(frames.times).equals(times)
+    for i, f in enumerate(files):
+        np.testing.assert_array_equal(frames.field(i).values, mrms.grib.read(f, extent).values)